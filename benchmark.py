@@ -0,0 +1,1027 @@
+"""基金报告推送系统性能基准测试
+
+用法:
+    python benchmark.py renderer --holdings 100000
+    python benchmark.py export --holdings 100000
+    python benchmark.py pingzhongdata --points 3000
+    python benchmark.py generate funds.txt --rows 100000 --users 5000 --funds 800
+    python benchmark.py pipeline --rows 100000 --latency-ms 20 --fail fundgz=0.2 --mobile
+    python benchmark.py suite --sizes 1k,100k,1m --output benchmark_baseline.json --compare old_baseline.json
+"""
+import sys
+import os
+import re
+import time
+import random
+import argparse
+import asyncio
+import json
+import hashlib
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+import configparser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from collections import defaultdict, OrderedDict
+
+from PyQt5.QtCore import QCoreApplication
+
+from main import (FakeHttpClient, HttpResponse, DEFAULT_CONFIG, ReportWorker, ReportRenderer, REPORT_TEMPLATES, ResultExporter,
+                  read_columnar_export, PingzhongdataExtractor, STREAM_CHUNK_SIZE, TradingCalendar, load_holidays)
+
+HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "holidays.txt")
+
+
+# 原有逐行拼接字符串的报告生成方式（作为渲染器的对照基准）
+class LegacyStringReports:
+    def get_number_emoji(self, number):
+        """数字转序号emoji"""
+        number_emojis = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣',
+                        '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
+        return number_emojis[number-1] if 1 <= number <= 10 else f'{number}.'
+    def generate_user_report(self, user, data, emoji):
+        """生成用户报告（用于推送）"""
+        # 对基金进行排序：先有效基金，再无效基金；每组内按购买日期排序
+        sorted_funds = sorted(
+            data['funds'], 
+            key=lambda x: (
+                not x.get('valid', True),  # 有效基金排前面
+                datetime.strptime(x['buy_date'], "%Y-%m-%d")  # 按购买日期排序
+            )
+        )
+        
+        report = [
+            f"{emoji} {user} 持仓详情:{len(data['funds'])}支",
+            "▔▔▔▔▔▔▔▔▔▔▔▔▔▔"
+        ]
+        
+        for idx, fund in enumerate(sorted_funds, 1):
+            # 处理基金名称显示（保留[未开放]标记）
+            fund_title = f"{self.get_number_emoji(idx)} {fund['name']} | {fund['code']}"
+            
+            report.append(fund_title)
+            report.append(f"├ 购买日期:{fund['buy_date']}")
+            report.append(f"├ 购买金额:{fund['buy_amount']/10000:.2f}万")
+            
+            if fund.get('valid', True) and fund.get('nav_date'):
+                # 将日期格式从 "YYYY-MM-DD" 转换为 "MM-DD"
+                nav_date = datetime.strptime(fund['nav_date'], "%Y-%m-%d").strftime("%m-%d")
+                report.append(f"├ 最新净值:{fund['nav']:.4f} | {nav_date}")
+            else:
+                report.append(f"├ 最新净值:未知")
+            
+            if fund.get('valid', True) and 'profit' in fund:
+                report.append(f"├ 持仓收益:{fund['profit']:+,.2f}")
+            else:
+                report.append(f"├ 持仓收益:未知")
+            
+            if fund.get('valid', True) and 'returns' in fund:
+                report.append(f"└ 收益率:{fund['returns']['annualized']}")
+            else:
+                report.append(f"└ 收益率:未知")
+        
+        return '\n'.join(report)
+    
+    def generate_performance_summary(self, user_data, target_return, time_str, failed_users=None):
+        """生成业绩达标总结报告（用于推送）"""
+        # 收集所有达到目标收益率的基金
+        performance_data = defaultdict(list)
+        
+        for user, data in user_data.items():
+            for fund in data['funds']:
+                # 只处理有效基金
+                if not fund.get('valid', True) or 'returns' not in fund:
+                    continue
+                    
+                # 提取年化收益率数值
+                try:
+                    if fund['returns']['annualized'] in ["N/A", "未知"]:
+                        continue
+                        
+                    # 从字符串中提取数字部分（保留符号）
+                    return_str = fund['returns']['annualized'].rstrip('%')
+                    if return_str.startswith('+'):
+                        return_value = float(return_str[1:])
+                    elif return_str.startswith('-'):
+                        return_value = float(return_str)  # 保留负号
+                    else:
+                        return_value = float(return_str)
+                    
+                    # 检查是否达标（正收益且大于等于目标值）
+                    if return_value >= target_return:
+                        performance_data[user].append({
+                            'code': fund['code'],
+                            'name': fund['name'],
+                            'annualized': return_value
+                        })
+                except (ValueError, TypeError) as e:
+                    continue
+        
+        # 生成报告内容
+        if not performance_data:
+            report = [
+                f"📊 业绩达标总结(≥{target_return}%)",
+                "▔▔▔▔▔▔▔▔▔▔▔▔▔▔",
+                "今日无达标基金"
+            ]
+        else:
+            report = [
+                f"📊 业绩达标总结(≥{target_return}%)",
+                "▔▔▔▔▔▔▔▔▔▔▔▔▔▔"
+            ]
+            
+            for user, funds in performance_data.items():
+                report.append(f"👤 {user}:")
+                for fund in funds:
+                    report.append(f"  · {fund['name']} ({fund['code']}): {fund['annualized']:.2f}%")
+                report.append("")  # 添加空行分隔不同用户
+        
+        # 添加失败用户提示
+        if failed_users:
+            report.append("⚠️ 报告推送异常:")
+            report.append(f"以下{len(failed_users)}位用户报告未成功推送:")
+            report.append(", ".join(failed_users))
+            report.append("请检查网络连接或手动处理")
+        
+        report.append(f"⏰ 报告生成: {time_str}")
+        return '\n'.join(report)
+    
+    def generate_fund_report(self, fund_code, fund_name, holdings):
+        """生成基金报告：持有该基金的客户情况列表和详情"""
+        # 清洁基金名称（去除[未开放]标记）
+        clean_fund_name = fund_name.replace(" [未开放]", "")
+        
+        # 按客户分组并排序（按最早购买日期）
+        user_holdings = defaultdict(list)
+        for holding in holdings:
+            user_holdings[holding['username']].append(holding)
+        
+        # 按每个客户最早购买该基金的日期排序
+        sorted_users = []
+        for user, funds in user_holdings.items():
+            # 获取该用户的最早购买日期
+            earliest_date = min([datetime.strptime(f['buy_date'], "%Y-%m-%d") for f in funds])
+            sorted_users.append((user, earliest_date))
+        
+        # 按最早购买日期排序
+        sorted_users.sort(key=lambda x: x[1])
+        
+        # 生成报告 - 使用简单字符避免乱码
+        report = [
+            f"基金报告: {clean_fund_name} ({fund_code})",
+            "=" * 50,
+            f"持有客户数: {len(user_holdings)}人 | 总持仓数: {len(holdings)}笔",
+            ""
+        ]
+        
+        # 添加汇总统计
+        total_amount = sum(h['buy_amount'] for h in holdings)
+        total_profit = sum(h['profit'] for h in holdings if h.get('valid', True))
+        report.append(f"总买入金额: {total_amount:,.2f}元")
+        report.append(f"总持仓收益: {total_profit:+,.2f}元")
+        report.append("")
+        
+        # 添加每个客户的持有详情（按购买时间排序）
+        for user, _ in sorted_users:
+            funds = user_holdings[user]
+            
+            # 按购买日期排序
+            sorted_funds = sorted(funds, key=lambda x: datetime.strptime(x['buy_date'], "%Y-%m-%d"))
+            
+            report.append(f"客户: {user}")
+            report.append("-" * 30)
+            
+            for fund in sorted_funds:
+                report.append(f"购买日期: {fund['buy_date']}")
+                report.append(f"买入金额: {fund['buy_amount']:,.2f}元")
+                
+                if fund.get('valid', True) and fund.get('nav_date'):
+                    # 将净值日期格式化为MM-DD
+                    nav_date = datetime.strptime(fund['nav_date'], "%Y-%m-%d").strftime("%m-%d")
+                    report.append(f"最新净值: {fund['nav']:.4f} ({nav_date})")
+                    report.append(f"持仓收益: {fund['profit']:+,.2f}")
+                    report.append(f"收益率: {fund['returns_annualized']}")
+                else:
+                    report.append(f"最新净值: 未知")
+                    report.append(f"持仓收益: 未知")
+                    report.append(f"收益率: 未知")
+                
+                report.append("")  # 添加空行分隔不同购买记录
+            
+            if user != sorted_users[-1][0]:
+                report.append("\n")  # 用户间分隔线（最后一个用户不加）
+        
+        return '\n'.join(report)
+
+    def generate_user_file_report(self, data):
+        """原电脑端客户报告：逐字段 += 拼接"""
+        report_content = ""
+        for fund in data['funds']:
+            report_content += f"基金代码: {fund['code']}\n"
+            report_content += f"基金名称: {fund['name']}\n"
+            report_content += f"购买日期: {fund['buy_date']}\n"
+            report_content += f"购买金额: {fund['buy_amount']:,.2f}\n"
+            if fund.get('valid', True):
+                report_content += f"最新净值: {fund['nav']:.4f} ({fund['nav_date']})\n"
+                report_content += f"持仓收益: {fund['profit']:+,.2f}\n"
+                report_content += f"年化收益率: {fund['returns']['annualized']}\n"
+            else:
+                report_content += "最新净值: 未知\n"
+                report_content += "持仓收益: 未知\n"
+                report_content += "年化收益率: 未知\n"
+            report_content += "\n"
+        return report_content
+
+
+def build_synthetic_book(holdings, users, funds, seed=42):
+    """生成计算完成后的合成持仓数据，返回 (user_data, fund_holdings)"""
+    rng = random.Random(seed)
+    codes = [f"{100000 + i * 7:06d}" for i in range(funds)]
+    names = {code: f"测试基金{code}" + (" [未开放]" if i % 17 == 0 else "") for i, code in enumerate(codes)}
+    user_names = [f"客户{chr(0x4e00 + i % 20000)}{chr(0x4e00 + i // 20000)}" for i in range(users)]
+    start = datetime(2018, 1, 1)
+    nav_date = "2025-06-30"
+
+    user_data = OrderedDict()
+    fund_holdings = defaultdict(list)
+    for i in range(holdings):
+        user = user_names[i % users]
+        code = codes[rng.randrange(funds)]
+        buy_date = (start + timedelta(days=rng.randrange(2500))).strftime("%Y-%m-%d")
+        amount = round(rng.uniform(1000, 500000), 2)
+        valid = rng.random() > 0.02
+        nav = round(rng.uniform(0.5, 5.0), 4)
+        profit = amount * rng.uniform(-0.3, 0.6) if valid else 0
+        absolute = f"{profit / amount * 100:+.2f}%" if valid else "未知"
+        annualized = f"{profit / amount * 100 / 3:+.2f}%" if valid else "未知"
+
+        user_data.setdefault(user, {'funds': []})['funds'].append({
+            'code': code,
+            'name': names[code],
+            'buy_date': buy_date,
+            'buy_amount': amount,
+            'nav': nav,
+            'nav_date': nav_date if valid else '',
+            'profit': profit,
+            'returns': {'absolute': absolute, 'annualized': annualized},
+            'valid': valid
+        })
+        fund_holdings[code].append({
+            'username': user,
+            'buy_date': buy_date,
+            'buy_amount': amount,
+            'shares': amount / nav,
+            'nav': nav,
+            'nav_date': nav_date if valid else '',
+            'profit': profit,
+            'returns_absolute': absolute,
+            'returns_annualized': annualized,
+            'valid': valid,
+            'fund_name': names[code]
+        })
+    return user_data, fund_holdings
+
+
+def _time_call(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def bench_renderer(holdings, users, funds):
+    """对比原字符串拼接与模板渲染器渲染全部报告的耗时，并校验 text 格式输出一致"""
+    user_data, fund_holdings = build_synthetic_book(holdings, users, funds)
+    legacy = LegacyStringReports()
+    time_str = "2025-06-30 20:00"
+
+    def run_legacy():
+        out = []
+        for idx, (user, data) in enumerate(user_data.items()):
+            out.append(legacy.generate_user_report(user, data, '👤'))
+            out.append(legacy.generate_user_file_report(data))
+        for code, holdings_list in fund_holdings.items():
+            out.append(legacy.generate_fund_report(code, holdings_list[0]['fund_name'], holdings_list))
+        out.append(legacy.generate_performance_summary(user_data, 5.0, time_str))
+        return out
+
+    def run_renderer(renderer):
+        def run():
+            out = []
+            for idx, (user, data) in enumerate(user_data.items()):
+                out.append(renderer.render_user_push(user, data, '👤'))
+                out.append(renderer.render_user_file(user, data))
+            for code, holdings_list in fund_holdings.items():
+                out.append(renderer.render_fund(code, holdings_list[0]['fund_name'], holdings_list))
+            out.append(renderer.render_performance_summary(user_data, 5.0, time_str))
+            return out
+        return run
+
+    results = {}
+    elapsed, legacy_out = _time_call(run_legacy)
+    results['legacy'] = {'seconds': elapsed, 'bytes': sum(len(x.encode('utf-8')) for x in legacy_out)}
+    print(f"原字符串拼接: {elapsed:.3f}s")
+
+    for fmt in REPORT_TEMPLATES:
+        elapsed, out = _time_call(run_renderer(ReportRenderer(fmt)))
+        results[fmt] = {'seconds': elapsed, 'bytes': sum(len(x.encode('utf-8')) for x in out)}
+        line = f"模板渲染[{fmt}]: {elapsed:.3f}s ({results['legacy']['seconds'] / elapsed:.2f}x)"
+        if fmt == 'text':
+            identical = out == legacy_out
+            results[fmt]['identical'] = identical
+            line += " 输出一致" if identical else " 输出不一致!"
+        print(line)
+    return results
+
+
+def bench_export(holdings, users, funds):
+    """导出一次运行的计算结果，并比较 JSON Lines 与列式文件的读取耗时"""
+    user_data, _ = build_synthetic_book(holdings, users, funds)
+    records = []
+    for user, data in user_data.items():
+        for fund in data['funds']:
+            records.append({
+                'username': user,
+                'code': fund['code'],
+                'name': fund['name'],
+                'buy_date': fund['buy_date'],
+                'buy_amount': fund['buy_amount'],
+                'shares': fund['buy_amount'] / fund['nav'],
+                'nav': fund['nav'],
+                'nav_date': fund['nav_date'],
+                'nav_source': 1 if fund['valid'] else 0,
+                'current_value': fund['buy_amount'] + fund['profit'],
+                'profit': fund['profit'],
+                'return_absolute': fund['profit'] / fund['buy_amount'] * 100 if fund['valid'] else None,
+                'return_annualized': fund['profit'] / fund['buy_amount'] * 100 / 3 if fund['valid'] else None,
+                'valid': fund['valid']
+            })
+
+    results = {}
+    with tempfile.TemporaryDirectory() as export_dir:
+        def write():
+            exporter = ResultExporter(export_dir, "20250630_200000")
+            for record in records:
+                exporter.add(record)
+            return exporter.close()
+
+        elapsed, stats = _time_call(write)
+        results['write'] = dict(stats, seconds=elapsed)
+        print(f"导出{stats['rows']}条: {elapsed:.3f}s, JSON Lines {stats['jsonl_bytes'] / 1024 / 1024:.2f}MB, "
+              f"列式 {stats['columnar_bytes'] / 1024 / 1024:.2f}MB")
+
+        def read_jsonl():
+            with open(os.path.join(export_dir, "20250630_200000.jsonl"), encoding='utf-8') as f:
+                return [json.loads(line) for line in f]
+
+        elapsed, _ = _time_call(read_jsonl)
+        results['read_jsonl'] = elapsed
+        print(f"读取 JSON Lines: {elapsed * 1000:.1f}ms")
+
+        path = os.path.join(export_dir, "20250630_200000.frcol")
+        elapsed, _ = _time_call(lambda: read_columnar_export(path, decode_strings=False))
+        results['read_columnar'] = elapsed
+        print(f"读取列式文件(全部列): {elapsed * 1000:.1f}ms")
+        elapsed, _ = _time_call(lambda: read_columnar_export(path, columns=['code', 'profit', 'return_annualized']))
+        results['read_columnar_subset'] = elapsed
+        print(f"读取列式文件(3列, 解码字符串): {elapsed * 1000:.1f}ms")
+    return results
+
+
+# ========== pingzhongdata 解析 ==========
+def pingzhongdata_body(code, points):
+    """按线上格式生成 pingzhongdata JS：净值走势之后还有累计净值走势等同样长度的历史数据"""
+    ac_points = [[point['x'], round(point['y'] * 1.2, 4), None] for point in points]
+    return (
+        f'var fS_name = "模拟基金{code}";var fS_code = "{code}";var syl_1y="12.34";'
+        f'var Data_netWorthTrend = {json.dumps(points)};var Data_ACWorthTrend = {json.dumps(ac_points)};'
+        f'var Data_grandTotal = [{{"name":"模拟基金{code}","data":{json.dumps(ac_points)}}}];'
+    )
+
+
+def legacy_pingzhongdata_parse(js_content):
+    """原解析方式：整段文本正则提取后 json.loads 整个走势数组"""
+    name_match = re.search(r'var fS_name\s*=\s*"([^"]+)"', js_content)
+    nav_data = json.loads(re.search(r'var Data_netWorthTrend\s*=\s*(\[.*?\])', js_content).group(1))
+    change_match = re.search(r'var syl_1y\s*=\s*"([^"]*)"', js_content)
+    return name_match.group(1), nav_data[-2:], change_match.group(1)
+
+
+def bench_pingzhongdata(points, repeat=20):
+    """对比原整段解析与流式解析一份 pingzhongdata 响应的耗时、读取字节数和 Python 分配峰值"""
+    end = datetime(2025, 6, 30)
+    trend = [{'x': int((end - timedelta(days=points - 1 - i)).timestamp() * 1000), 'y': round(1 + i / points, 4),
+              'equityReturn': 0.12, 'unitMoney': ""} for i in range(points)]
+    data = pingzhongdata_body("000001", trend).encode('utf-8')
+
+    def legacy():
+        return legacy_pingzhongdata_parse(data.decode('utf-8'))
+
+    def streaming(history=False):
+        extractor = PingzhongdataExtractor(history=history)
+        for start in range(0, len(data), STREAM_CHUNK_SIZE):
+            if extractor.feed(data[start:start + STREAM_CHUNK_SIZE]):
+                break
+        else:
+            extractor.close()
+        return extractor
+
+    extractor = streaming()
+    expected = legacy()
+    identical = (extractor.values['fS_name'], list(extractor.points), extractor.values['syl_1y']) == expected
+    print(f"响应 {len(data) / 1024:.1f}KB, 净值点 {points}, 结果一致: {identical}")
+
+    results = {'bytes': len(data), 'identical': identical}
+    for name, func, bytes_read in (('legacy', legacy, len(data)),
+                                   ('streaming', streaming, extractor.bytes_fed),
+                                   ('streaming_history', lambda: streaming(True), None)):
+        elapsed = min(_time_call(func)[0] for _ in range(repeat))
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {'seconds': elapsed, 'peak_bytes': peak, 'bytes_read': bytes_read}
+        read = f", 读取 {bytes_read / 1024:.1f}KB" if bytes_read else ""
+        print(f"  {name:<18} {elapsed * 1000:8.2f}ms, 分配峰值 {peak / 1024:8.1f}KB{read}")
+    return results
+
+
+# ========== 合成持仓数据 ==========
+def synthetic_user_name(index):
+    """生成只含字母的用户名（满足 funds.txt 的用户名校验规则）"""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord('a') + rem) + letters
+    return "User" + letters
+
+
+def synthetic_fund_code(index):
+    return f"{100000 + index * 7:06d}"
+
+
+def generate_funds_file(path, rows, users, funds, seed=42):
+    """生成合成的 funds.txt：rows 行持仓，用户数与基金数可配置"""
+    rng = random.Random(seed)
+    start = datetime(2018, 1, 1)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("# 用户名,基金代码,买入日期,买入金额(元),持仓份额\n")
+        for i in range(rows):
+            user = synthetic_user_name(i % users)
+            code = synthetic_fund_code(rng.randrange(funds))
+            buy_date = (start + timedelta(days=rng.randrange(2500))).strftime("%Y-%m-%d")
+            amount = rng.uniform(1000, 500000)
+            shares = amount / rng.uniform(0.5, 3.0)
+            f.write(f"{user},{code},{buy_date},{amount:.2f},{shares:.2f}\n")
+
+
+# ========== 本地替身服务器 ==========
+MOCK_ENDPOINTS = ('fundgz', 'esongfund', 'pingzhongdata', 'bark', 'gotify', 'wecom')
+
+
+class MockServer:
+    """本地替身服务器：同时模拟三个基金净值接口和 Bark / Gotify / 企业微信推送接口
+
+    响应格式与线上接口一致（fundgz 的 jsonpgz 回调、esongfund 的 JSON、pingzhongdata 的 JS 变量），
+    可按接口注入延迟与失败率，并统计请求数与响应字节数；净值接口带 ETag / Last-Modified，
+    条件请求命中时返回不带响应体的 304。lagging 比例的基金在 publish() 之前仍返回上一交易日的净值
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rates=None, history_points=1000,
+                 nav_date="2025-06-30", seed=42, previous_nav_date=None, lagging=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rates = dict(failure_rates or {})
+        self.history_points = history_points
+        self.nav_date = nav_date
+        self.previous_nav_date = previous_nav_date or nav_date
+        self.lagging = lagging
+        self.published = False
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {name: {'requests': 0, 'failures': 0, 'bytes': 0, 'sent': 0, 'not_modified': 0}
+                      for name in MOCK_ENDPOINTS}
+        self.validators = {}  # 请求路径 -> 上次响应的 ETag / Last-Modified（命中时不必再生成响应体）
+        self.httpd = None
+
+    def fund_nav(self, code):
+        """按基金代码生成确定的净值"""
+        return round(0.5 + (int(code) % 997) / 300, 4)
+
+    def code_nav_date(self, code):
+        """该基金当前对外提供的净值日期"""
+        if not self.published and int(code) % 1000 < self.lagging * 1000:
+            return self.previous_nav_date
+        return self.nav_date
+
+    def publish(self):
+        """公布全部基金的最新净值（此前返回的 ETag 随之失效）"""
+        with self.lock:
+            self.published = True
+            self.validators.clear()
+
+    def _body(self, endpoint, path, query):
+        if endpoint == 'fundgz':
+            code = path.rsplit('/', 1)[-1][:-len('.js')]
+            data = {
+                'fundcode': code, 'name': f"模拟基金{code}", 'jzrq': self.code_nav_date(code),
+                'dwjz': f"{self.fund_nav(code):.4f}", 'gsz': f"{self.fund_nav(code):.4f}",
+                'gszzl': "0.12", 'gztime': f"{self.nav_date} 15:00"
+            }
+            return f"jsonpgz({json.dumps(data, ensure_ascii=False)});", 'application/javascript'
+        if endpoint == 'esongfund':
+            code = query.get('fundCode', [''])[0]
+            data = {'code': 200, 'data': {
+                'fundName': f"模拟基金{code}", 'netValueDate': self.code_nav_date(code),
+                'netValue': self.fund_nav(code), 'dayGrowth': "0.12", 'fundType': "混合型"
+            }}
+            return json.dumps(data, ensure_ascii=False), 'application/json'
+        if endpoint == 'pingzhongdata':
+            code = path.rsplit('/', 1)[-1][:-len('.js')]
+            end = datetime.strptime(self.code_nav_date(code), "%Y-%m-%d")
+            nav = self.fund_nav(code)
+            points = [
+                {'x': int((end - timedelta(days=self.history_points - 1 - i)).timestamp() * 1000),
+                 'y': round(nav * (0.6 + 0.4 * i / max(1, self.history_points - 1)), 4),
+                 'equityReturn': 0.12, 'unitMoney': ""}
+                for i in range(self.history_points)
+            ]
+            return pingzhongdata_body(code, points), 'application/javascript'
+        if endpoint == 'wecom':
+            if path.endswith('/gettoken'):
+                return json.dumps({'errcode': 0, 'errmsg': 'ok', 'access_token': 'mock-token'}), 'application/json'
+            return json.dumps({'errcode': 0, 'errmsg': 'ok'}), 'application/json'
+        if endpoint == 'gotify':
+            return json.dumps({'id': 1}), 'application/json'
+        return json.dumps({'code': 200, 'message': 'success'}), 'application/json'
+
+    @staticmethod
+    def route(path):
+        if path.startswith('/js/'):
+            return 'fundgz'
+        if path.startswith('/eap/'):
+            return 'esongfund'
+        if path.startswith('/pingzhongdata/'):
+            return 'pingzhongdata'
+        if path.startswith('/cgi-bin/'):
+            return 'wecom'
+        if path.startswith('/message') or path == '/health':
+            return 'gotify'
+        return 'bark'
+
+    def _plan(self, path):
+        """决定一个请求的接口、延迟（秒）和是否注入失败"""
+        endpoint = self.route(urlsplit(path).path)
+        with self.lock:
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            failed = self.rng.random() < self.failure_rates.get(endpoint, 0.0)
+        return endpoint, delay, failed
+
+    def _validators(self, endpoint, data):
+        """净值接口响应的 ETag 和 Last-Modified（推送接口不提供）"""
+        if endpoint not in ('fundgz', 'esongfund', 'pingzhongdata'):
+            return {}
+        last_modified = datetime.strptime(self.nav_date, "%Y-%m-%d").replace(hour=15)
+        return {
+            'ETag': '"' + hashlib.sha1(data).hexdigest()[:16] + '"',
+            'Last-Modified': formatdate(last_modified.timestamp(), usegmt=True),
+        }
+
+    @staticmethod
+    def _not_modified(headers, validators):
+        """按 If-None-Match / If-Modified-Since 判断客户端缓存是否仍然有效"""
+        headers = {key.lower(): value for key, value in headers.items()}
+        if not validators:
+            return False
+        if 'if-none-match' in headers:
+            return headers['if-none-match'] == validators['ETag']
+        if 'if-modified-since' in headers:
+            try:
+                since = parsedate_to_datetime(headers['if-modified-since'])
+            except (TypeError, ValueError):
+                return False
+            return since >= parsedate_to_datetime(validators['Last-Modified'])
+        return False
+
+    def _respond(self, path, endpoint, failed, request_headers=None, request_bytes=0):
+        """生成响应 (状态码, 响应体字节, 响应头) 并计入统计（request_bytes 为请求地址与请求体的字节数）"""
+        parsed = urlsplit(path)
+        known = self.validators.get(path)
+        not_modified = not failed and known is not None and self._not_modified(request_headers or {}, known)
+        if not_modified:
+            status, data, headers = 304, b"", dict(known)
+        elif failed:
+            status, data, headers = 500, b"mock failure", {'Content-Type': "text/plain; charset=utf-8"}
+        else:
+            body, content_type = self._body(endpoint, parsed.path, parse_qs(parsed.query))
+            status, data = 200, body.encode('utf-8')
+            validators = self._validators(endpoint, data)
+            if validators:
+                self.validators[path] = validators
+            headers = dict(validators, **{'Content-Type': f"{content_type}; charset=utf-8"})
+        with self.lock:
+            stats = self.stats[endpoint]
+            stats['requests'] += 1
+            stats['failures'] += failed
+            stats['not_modified'] += not_modified
+            stats['bytes'] += len(data)
+            stats['sent'] += request_bytes
+        return status, data, headers
+
+    def handle(self, handler):
+        length = int(handler.headers.get('Content-Length') or 0)
+        if length:
+            handler.rfile.read(length)
+
+        endpoint, delay, failed = self._plan(handler.path)
+        if delay:
+            time.sleep(delay)
+        status, data, headers = self._respond(handler.path, endpoint, failed, handler.headers,
+                                              len(handler.path) + length)
+
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        if status != 304:
+            handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def fake_client(self, max_connections=32, max_per_host=8):
+        """返回不经过网络的进程内 HTTP 客户端替身，响应与延迟/失败注入同本服务器一致"""
+        async def handler(method, url, headers, body):
+            parts = urlsplit(url)
+            path = parts.path + ('?' + parts.query if parts.query else '')
+            endpoint, delay, failed = self._plan(path)
+            if delay:
+                await asyncio.sleep(delay)
+            status, data, response_headers = self._respond(path, endpoint, failed, headers, len(path) + len(body))
+            return HttpResponse(status, {name.lower(): value for name, value in response_headers.items()}, data, url)
+
+        return FakeHttpClient(handler, max_connections, max_per_host)
+
+    def start(self):
+        """在后台线程启动服务器，返回基础地址"""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写出，保持连接时不关闭 Nagle 会在客户端延迟确认下每个请求多等约40ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server.handle(self)
+
+            def do_POST(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 256  # 并发建立连接时默认的5会丢弃 SYN，客户端要等1秒重传
+
+        self.httpd = Server(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+# ========== 完整流程基准 ==========
+def _peak_rss_mb():
+    """进程峰值常驻内存（MB），不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def bench_config(base_url, mobile=False, backend='files', max_retries=1, processes=1, conditional=True,
+                 bark_method='post'):
+    """指向替身服务器的运行配置"""
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULT_CONFIG)
+    config['mobile'].update({'enabled': '1' if mobile else '0', 'bark_enabled': '1', 'gotify_enabled': '1',
+                             'wecom_enabled': '1'})
+    config['advanced'].update({
+        'bark_url': base_url, 'bark_token': 'mock',
+        'gotify_url': base_url, 'gotify_token': 'mock',
+        'wecom_corpid': 'mock', 'wecom_agentid': '1', 'wecom_secret': 'mock', 'wecom_proxy_url': base_url,
+        'max_retries': str(max_retries), 'retry_delay': '0'
+    })
+    config['sources'].update({'fundgz_url': base_url, 'esongfund_url': base_url, 'pingzhongdata_url': base_url})
+    config['push']['send_interval'] = '0'
+    config['push']['retry_queue_wait'] = '0'
+    config['push']['bark_method'] = bark_method
+    config['output']['backend'] = backend
+    config['compute']['processes'] = str(processes)
+    config['cache']['conditional_requests'] = '1' if conditional else '0'
+    config['calendar']['holidays_file'] = HOLIDAYS_FILE
+    return config
+
+
+def run_pipeline(rows, users, funds, latency_ms=0.0, jitter_ms=0.0, failure_rates=None, history_points=1000,
+                 mobile=False, pc=True, backend='files', trace_memory=False, seed=42, fake_network=False,
+                 processes=1, runs=1, conditional=True, delta=0.0, bark_method='post'):
+    """生成合成数据、启动替身服务器并完整运行一次 ReportWorker，返回各阶段耗时与内存峰值
+
+    fake_network 为 True 时不启动 HTTP 服务器，改用进程内的 FakeHttpClient（只衡量本程序自身的开销）；
+    runs 大于1时在同一目录中连续运行多次（后续运行可利用前一次留下的缓存），
+    顶层结果为最后一次运行，每次运行的耗时与请求统计记录在 result['runs'] 中；
+    delta 大于0时替身服务器按交易日历提供当前应有的净值，其中 delta 比例的基金第一次运行时仍是上一交易日，
+    之后公布并以增量模式运行（至少运行两次）
+    """
+    if QCoreApplication.instance() is None:
+        QCoreApplication([])
+
+    server = MockServer(latency_ms, jitter_ms, failure_rates, history_points, seed=seed)
+    if delta:
+        calendar = TradingCalendar(load_holidays(HOLIDAYS_FILE))
+        server.nav_date = calendar.expected_nav_date()
+        server.previous_nav_date = calendar.previous_trading_day(
+            datetime.strptime(server.nav_date, "%Y-%m-%d").date()
+        ).isoformat()
+        server.lagging = delta
+        runs = max(runs, 2)
+    base_url = "http://mock.invalid" if fake_network else server.start()
+    result = {
+        'rows': rows, 'users': users, 'funds': funds, 'latency_ms': latency_ms,
+        'failure_rates': dict(failure_rates or {}), 'mobile': mobile, 'pc': pc, 'backend': backend,
+        'fake_network': fake_network, 'processes': processes, 'conditional': conditional, 'delta': delta,
+        'bark_method': bark_method
+    }
+    try:
+        with tempfile.TemporaryDirectory() as base_dir:
+            os.makedirs(os.path.join(base_dir, "config"))
+            start = time.perf_counter()
+            generate_funds_file(os.path.join(base_dir, "config", "funds.txt"), rows, users, funds, seed)
+            result['generate_seconds'] = time.perf_counter() - start
+
+            config = bench_config(base_url, mobile, backend, processes=processes, conditional=conditional,
+                                  bark_method=bark_method)
+            result['runs'] = []
+            for index in range(max(1, runs)):
+                if delta and index:
+                    server.publish()
+                worker = ReportWorker(config, base_dir, mobile, pc, True, True,
+                                      server.fake_client if fake_network else None, delta=bool(delta and index))
+                log_counts = defaultdict(int)
+                errors = []
+
+                def on_log(message, level):
+                    log_counts[level] += 1
+                    if level == 'error' and len(errors) < 5:
+                        errors.append(message)
+
+                worker.log_signal.connect(on_log)
+
+                before = {name: dict(stats) for name, stats in server.stats.items()}
+                if trace_memory:
+                    tracemalloc.start()
+                start = time.perf_counter()
+                worker.run()
+                result['total_seconds'] = time.perf_counter() - start
+                if trace_memory:
+                    result['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                    tracemalloc.stop()
+
+                result['stages'] = dict(worker.stage_timings)
+                result['log_messages'] = dict(log_counts)
+                result['errors'] = errors
+                result['runs'].append({
+                    'delta': worker.delta,
+                    'updated_funds': len(worker.updated_codes),
+                    'total_seconds': result['total_seconds'],
+                    'stages': result['stages'],
+                    'server': {
+                        name: {key: value - before[name][key] for key, value in stats.items()}
+                        for name, stats in server.stats.items()
+                    },
+                })
+    finally:
+        server.stop()
+    result['peak_rss_mb'] = _peak_rss_mb()
+    result['server'] = result['runs'][-1]['server'] if result.get('runs') else server.stats
+    return result
+
+
+# 标准规模：(名称, 持仓行数, 用户数, 基金数)
+SUITE_SIZES = {
+    '1k': (1000, 100, 50),
+    '100k': (100000, 5000, 800),
+    '1m': (1000000, 50000, 3000),
+}
+
+
+def run_suite(sizes, output, compare=None, threshold=0.10, extra_args=()):
+    """每个规模在独立进程中运行（峰值内存互不影响），结果写入 JSON 基线，可与旧基线对比"""
+    results = {
+        'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'scenarios': {}
+    }
+    for size in sizes:
+        rows, users, funds = SUITE_SIZES[size]
+        cmd = [sys.executable, os.path.abspath(__file__), 'pipeline', '--rows', str(rows), '--users', str(users),
+               '--funds', str(funds), '--json', *extra_args]
+        print(f"运行规模 {size}: {' '.join(cmd[2:])}", file=sys.stderr)
+        proc = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8')
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            raise SystemExit(f"规模 {size} 运行失败")
+        results['scenarios'][size] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"基准结果已写入: {output}", file=sys.stderr)
+
+    regressions = []
+    if compare:
+        with open(compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for size, current in results['scenarios'].items():
+            old = baseline.get('scenarios', {}).get(size)
+            if not old:
+                continue
+            metrics = [('total_seconds', current['total_seconds'], old['total_seconds']),
+                       ('peak_rss_mb', current.get('peak_rss_mb'), old.get('peak_rss_mb'))]
+            metrics += [(f"stages.{name}", value, old.get('stages', {}).get(name))
+                        for name, value in current['stages'].items()]
+            for name, new_value, old_value in metrics:
+                if not new_value or not old_value:
+                    continue
+                change = new_value / old_value - 1
+                flag = "  <-- 退化" if change > threshold else ""
+                print(f"[{size}] {name}: {old_value:.3f} -> {new_value:.3f} ({change:+.1%}){flag}")
+                if flag:
+                    regressions.append(f"{size}:{name}")
+    return regressions
+
+
+def print_pipeline_result(result):
+    print(f"持仓 {result['rows']} 行 / 用户 {result['users']} / 基金 {result['funds']}: "
+          f"总耗时 {result['total_seconds']:.3f}s")
+    for name, seconds in result['stages'].items():
+        print(f"  {name:<10} {seconds:.3f}s")
+    if result.get('peak_rss_mb') is not None:
+        print(f"  峰值内存 {result['peak_rss_mb']:.1f}MB")
+    if result.get('tracemalloc_peak_mb') is not None:
+        print(f"  Python分配峰值 {result['tracemalloc_peak_mb']:.1f}MB")
+    for endpoint, stats in result['server'].items():
+        if stats['requests']:
+            print(f"  {endpoint:<14} 请求 {stats['requests']}, 失败 {stats['failures']}, "
+                  f"未修改 {stats['not_modified']}, {stats['bytes'] / 1024:.1f}KB, 上行 {stats['sent'] / 1024:.1f}KB")
+    if len(result.get('runs', ())) > 1:
+        for index, run in enumerate(result['runs'], 1):
+            fetch = run['stages'].get('fetch', 0.0)
+            requests = sum(stats['requests'] for stats in run['server'].values())
+            size = sum(stats['bytes'] for stats in run['server'].values())
+            not_modified = sum(stats['not_modified'] for stats in run['server'].values())
+            mode = f"增量, {run['updated_funds']}只基金更新, " if run['delta'] else ""
+            print(f"  第{index}次运行: {mode}总耗时 {run['total_seconds']:.3f}s, fetch {fetch:.3f}s, "
+                  f"请求 {requests}（304 {not_modified}）, 响应 {size / 1024:.1f}KB")
+    for message in result['errors']:
+        print(f"  错误: {message}")
+
+
+def parse_failure_rates(items):
+    """解析 --fail fundgz=0.3 形式的失败率参数"""
+    rates = {}
+    for item in items or []:
+        endpoint, _, value = item.partition('=')
+        if endpoint not in MOCK_ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"未知接口: {endpoint}")
+        rates[endpoint] = float(value)
+    return rates
+
+
+def add_pipeline_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="替身服务器每个请求的延迟")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="延迟的随机抖动范围")
+    parser.add_argument('--fail', action='append', metavar='ENDPOINT=RATE',
+                        help=f"按接口注入失败率，接口: {', '.join(MOCK_ENDPOINTS)}")
+    parser.add_argument('--history-points', type=int, default=1000, help="pingzhongdata 返回的历史净值点数")
+    parser.add_argument('--mobile', action='store_true', help="同时推送到替身 Bark/Gotify/企业微信")
+    parser.add_argument('--no-pc', action='store_true', help="不生成电脑端报告")
+    parser.add_argument('--backend', choices=('files', 'zip', 'sqlite'), default='files')
+    parser.add_argument('--trace-memory', action='store_true', help="使用 tracemalloc 统计 Python 分配峰值（有额外开销）")
+    parser.add_argument('--fake-network', action='store_true', help="不走真实网络，使用进程内 HTTP 客户端替身")
+    parser.add_argument('--processes', type=int, default=1, help="分片计算的进程数（0 为全部 CPU 核心）")
+
+
+def pipeline_kwargs(args):
+    return {
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'failure_rates': parse_failure_rates(args.fail),
+        'history_points': args.history_points,
+        'mobile': args.mobile,
+        'pc': not args.no_pc,
+        'backend': args.backend,
+        'trace_memory': args.trace_memory,
+        'fake_network': args.fake_network,
+        'processes': args.processes,
+    }
+
+
+def pipeline_cli_args(args):
+    """把流程参数转发给 suite 的子进程"""
+    forwarded = ['--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+                 '--history-points', str(args.history_points), '--backend', args.backend,
+                 '--processes', str(args.processes)]
+    for item in args.fail or []:
+        forwarded += ['--fail', item]
+    for flag, enabled in (('--mobile', args.mobile), ('--no-pc', args.no_pc), ('--trace-memory', args.trace_memory),
+                          ('--fake-network', args.fake_network)):
+        if enabled:
+            forwarded.append(flag)
+    return forwarded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="基金报告推送系统性能基准测试")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_render = sub.add_parser('renderer', help="报告渲染：原字符串拼接 vs 预编译模板")
+    p_render.add_argument('--holdings', type=int, default=100000)
+    p_render.add_argument('--users', type=int, default=5000)
+    p_render.add_argument('--funds', type=int, default=800)
+
+    p_export = sub.add_parser('export', help="计算结果导出：JSON Lines vs 列式二进制")
+    p_export.add_argument('--holdings', type=int, default=100000)
+    p_export.add_argument('--users', type=int, default=5000)
+    p_export.add_argument('--funds', type=int, default=800)
+
+    p_pzd = sub.add_parser('pingzhongdata', help="pingzhongdata 响应：原整段解析 vs 流式解析")
+    p_pzd.add_argument('--points', type=int, default=3000, help="历史净值点数")
+
+    p_generate = sub.add_parser('generate', help="生成合成的 funds.txt")
+    p_generate.add_argument('path')
+    p_generate.add_argument('--rows', type=int, default=1000)
+    p_generate.add_argument('--users', type=int, default=100)
+    p_generate.add_argument('--funds', type=int, default=50)
+    p_generate.add_argument('--seed', type=int, default=42)
+
+    p_pipeline = sub.add_parser('pipeline', help="使用替身服务器完整运行一次报告流程")
+    p_pipeline.add_argument('--rows', type=int, default=1000)
+    p_pipeline.add_argument('--users', type=int, default=100)
+    p_pipeline.add_argument('--funds', type=int, default=50)
+    p_pipeline.add_argument('--json', action='store_true', help="以 JSON 输出结果")
+    p_pipeline.add_argument('--runs', type=int, default=1, help="在同一目录中连续运行的次数（观察缓存效果）")
+    p_pipeline.add_argument('--no-conditional', action='store_true', help="关闭净值接口的条件请求（对照）")
+    p_pipeline.add_argument('--delta', type=float, default=0.0, metavar='RATE',
+                            help="第一次运行时尚未公布最新净值的基金比例，之后以增量模式再运行")
+    p_pipeline.add_argument('--bark-get', action='store_true', help="Bark 使用 URL 编码的 GET 请求（对照）")
+    add_pipeline_arguments(p_pipeline)
+
+    p_suite = sub.add_parser('suite', help="按标准规模运行完整流程并记录 JSON 基线")
+    p_suite.add_argument('--sizes', default='1k,100k', help=f"逗号分隔，可选: {', '.join(SUITE_SIZES)}")
+    p_suite.add_argument('--output', default='benchmark_baseline.json')
+    p_suite.add_argument('--compare', help="与之前的基线文件对比")
+    p_suite.add_argument('--threshold', type=float, default=0.10, help="判定为退化的变化比例")
+    add_pipeline_arguments(p_suite)
+
+    args = parser.parse_args(argv)
+    if args.command == 'renderer':
+        results = bench_renderer(args.holdings, args.users, args.funds)
+        return 0 if results['text'].get('identical') else 1
+    if args.command == 'export':
+        bench_export(args.holdings, args.users, args.funds)
+    if args.command == 'pingzhongdata':
+        return 0 if bench_pingzhongdata(args.points)['identical'] else 1
+    if args.command == 'generate':
+        generate_funds_file(args.path, args.rows, args.users, args.funds, args.seed)
+    if args.command == 'pipeline':
+        result = run_pipeline(args.rows, args.users, args.funds, runs=args.runs,
+                              conditional=not args.no_conditional, delta=args.delta,
+                              bark_method='get' if args.bark_get else 'post', **pipeline_kwargs(args))
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            print_pipeline_result(result)
+    if args.command == 'suite':
+        sizes = [size.strip().lower() for size in args.sizes.split(',') if size.strip()]
+        for size in sizes:
+            if size not in SUITE_SIZES:
+                parser.error(f"未知规模: {size}")
+        regressions = run_suite(sizes, args.output, args.compare, args.threshold, pipeline_cli_args(args))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,22 +3,47 @@ import os
 import configparser
 import re
 import json
-import requests
 import time
 import csv
+import argparse
+import tempfile
+import sqlite3
+import zipfile
+import zlib
+import struct
+import string
+from array import array
+from math import nan as NAN
+import io
+import hashlib
+import codecs
+import html
+import threading
+import signal
+import multiprocessing
+import asyncio
+import cProfile
+import pstats
+import tracemalloc
+import logging
+from logging.handlers import RotatingFileHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from collections import defaultdict, OrderedDict
-import urllib3
+from collections import defaultdict, OrderedDict, deque
+import httpx
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QGroupBox, QLabel, QLineEdit, QPushButton, QTextEdit, 
                              QCheckBox, QDialog, QFormLayout, QMessageBox, QDialogButtonBox,
                              QDoubleSpinBox, QSpinBox, QFileDialog, QDesktopWidget, QStatusBar,
-                             QSizePolicy, QScrollArea, QGridLayout, QTextBrowser)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QFont, QPalette, QColor, QDoubleValidator, QTextCursor
-from urllib.parse import quote  # 添加URL编码支持
-
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+                             QSizePolicy, QScrollArea, QGridLayout, QTextBrowser, QProgressBar)
+from PyQt5.QtCore import Qt, QThread, QObject, QTimer, pyqtSignal, QCoreApplication
+from PyQt5.QtGui import QFont, QPalette, QColor, QDoubleValidator, QTextCursor, QTextCharFormat
+from urllib.parse import quote, urlsplit, urljoin  # 添加URL编码支持
+from urllib.request import getproxies, proxy_bypass
 
 # 默认配置（增加企业微信推送选项）
 DEFAULT_CONFIG = {
@@ -37,7 +62,35 @@ DEFAULT_CONFIG = {
         'max_message_bytes': '2048',
         'max_retries': '3',
         'retry_delay': '5',
-        'target_return': '5.0'
+        'target_return': '5.0',
+        'profile': '0'
+    },
+    'output': {
+        'backend': 'files', 'format': 'text', 'write_workers': '8', 'fsync': '0',
+        'export_jsonl': '0', 'export_columnar': '0'
+    },
+    'sources': {
+        'fundgz_url': 'http://fundgz.1234567.com.cn',
+        'esongfund_url': 'https://j4.esongfund.com',
+        'pingzhongdata_url': 'https://fund.eastmoney.com'
+    },
+    'push': {
+        'send_interval': '0.5', 'change_only': '0', 'min_profit_change': '100', 'min_return_change': '0.5',
+        'delta_message': '0', 'routes_file': 'config/routes.txt', 'delivery': 'fallback', 'channel_down_after': '3',
+        'probe': '1', 'probe_timeout': '3', 'retry_queue_wait': '30', 'retry_queue_rounds': '3',
+        'channel_max_bytes': 'bark=8000,wecom=2048', 'bark_method': 'post', 'bark_batch': '1'
+    },
+    'network': {'max_connections': '32', 'max_per_host': '8', 'timeout': '10'},
+    'compute': {'processes': '1', 'shard_min_rows': '20000'},
+    'cache': {'metadata_refresh_days': '7', 'conditional_requests': '1'},
+    'poll': {'interval': '600', 'backoff': '2', 'max_interval': '3600', 'until': '23:30'},
+    'calendar': {'holidays_file': 'config/holidays.txt', 'nav_publish_time': '19:00', 'skip_current': '1'},
+    'retention': {'enabled': '0', 'keep_days': '30', 'keep_weeks': '12', 'keep_months': '24'},
+    'metrics': {'prometheus_file': '', 'http_port': '0'},
+    'resume': {'enabled': '1', 'max_age_minutes': '60'},
+    'log': {
+        'max_lines': '5000', 'flush_interval_ms': '100',
+        'file': 'logs/fundreport.log', 'file_max_bytes': '5242880', 'file_backups': '5'
     }
 }
 
@@ -78,7 +131,9 @@ class FundReportSystem(QMainWindow):
         self.set_refreshed_style()
         
         self.setup_ui()
+        self.log_sink = LogSink(self.log_area, self.status_bar)
         self.load_config()
+        self.setup_log_sink()
         self.check_funds_file()
         
         # 居中显示窗口
@@ -217,6 +272,12 @@ class FundReportSystem(QMainWindow):
             QPushButton#helpButton {
                 background-color: #FF9800;  /* 橙色 */
             }
+            QPushButton#cancelButton {
+                background-color: #E57373;  /* 红色 */
+            }
+            QPushButton#cancelButton:disabled, QPushButton#pauseButton:disabled {
+                background-color: #C8D3DE;
+            }
         """)
     
     def setup_ui(self):
@@ -303,6 +364,20 @@ class FundReportSystem(QMainWindow):
         self.run_btn.setFixedHeight(45)
         config_layout.addWidget(self.run_btn)
         
+        # 运行控制按钮（仅在运行期间可用）
+        control_layout = QHBoxLayout()
+        self.pause_btn = QPushButton("暂停")
+        self.pause_btn.setObjectName("pauseButton")
+        self.pause_btn.setFixedHeight(35)
+        self.pause_btn.setEnabled(False)
+        control_layout.addWidget(self.pause_btn)
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.setObjectName("cancelButton")
+        self.cancel_btn.setFixedHeight(35)
+        self.cancel_btn.setEnabled(False)
+        control_layout.addWidget(self.cancel_btn)
+        config_layout.addLayout(control_layout)
+        
         # 添加弹性空间使按钮位于顶部
         config_layout.addStretch(1)
         
@@ -324,6 +399,16 @@ class FundReportSystem(QMainWindow):
         self.status_bar.setSizeGripEnabled(False)
         self.setStatusBar(self.status_bar)
         
+        # 运行进度（阶段、完成数、速度、预计剩余时间），仅在运行期间显示
+        self.progress_label = QLabel()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFixedWidth(160)
+        self.progress_bar.setTextVisible(True)
+        self.status_bar.addPermanentWidget(self.progress_label)
+        self.status_bar.addPermanentWidget(self.progress_bar)
+        self.progress_label.hide()
+        self.progress_bar.hide()
+        
         # 设置主窗口
         self.setCentralWidget(main_widget)
         
@@ -332,6 +417,8 @@ class FundReportSystem(QMainWindow):
         self.pc_cb.toggled.connect(self.toggle_pc)
         self.adv_btn.clicked.connect(self.show_advanced)
         self.run_btn.clicked.connect(self.run_report)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.cancel_btn.clicked.connect(self.cancel_report)
         help_btn.clicked.connect(self.show_help)
         
         # 初始状态
@@ -524,30 +611,27 @@ class FundReportSystem(QMainWindow):
         help_dialog.exec_()
     
     def log_message(self, message, level="info"):
-        """添加日志消息"""
-        if level == "error":
-            color = "#e74c3c"  # 红色
-            prefix = "[错误] "
-        elif level == "warning":
-            color = "#f39c12"  # 黄色
-            prefix = "[警告] "
-        elif level == "success":
-            color = "#27ae60"  # 绿色
-            prefix = "[成功] "
-        else:
-            color = "#2980b9"  # 蓝色
-            prefix = "[信息] "
-        
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        html_message = f'<span style="color:{color}">[{timestamp}] {prefix}{message}</span>'
-        
-        self.log_area.append(html_message)
-        
-        # 自动滚动到底部
-        self.log_area.moveCursor(QTextCursor.End)
-        
-        # 更新状态栏
-        self.status_bar.showMessage(f"最新状态: {message}", 5000)
+        """添加日志消息（由日志缓冲批量输出到日志区和日志文件）"""
+        self.log_sink.write(message, level)
+    
+    def setup_log_sink(self):
+        """按 [log] 配置调整日志区行数上限、刷新间隔并打开日志文件"""
+        self.log_sink.max_lines = max(1, self.config.getint('log', 'max_lines', fallback=5000))
+        self.log_area.document().setMaximumBlockCount(self.log_sink.max_lines)
+        self.log_sink.timer.setInterval(max(0, self.config.getint('log', 'flush_interval_ms', fallback=100)))
+        try:
+            self.log_sink.set_file_logger(create_file_logger(self.config, self.base_dir))
+        except Exception as e:
+            self.log_message(f"无法打开日志文件: {str(e)}", "warning")
+    
+    def closeEvent(self, event):
+        """关闭窗口前取消仍在进行的运行，并输出尚未刷新的日志"""
+        worker = getattr(self, 'worker', None)
+        if worker is not None and worker.isRunning():
+            worker.control.cancel()
+            worker.wait()
+        self.log_sink.flush()
+        super().closeEvent(event)
     
     def load_config(self):
         """从配置文件加载设置"""
@@ -681,11 +765,15 @@ class FundReportSystem(QMainWindow):
             self.by_user_cb.isChecked()
         )
         self.worker.log_signal.connect(self.log_message)
+        self.worker.progress_signal.connect(self.on_progress)
         self.worker.finished.connect(self.on_report_finished)
         
         # 禁用按钮防止重复点击
         self.run_btn.setEnabled(False)
         self.run_btn.setText("处理中...")
+        self.pause_btn.setText("暂停")
+        self.pause_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(True)
         
         self.worker.start()
     
@@ -700,10 +788,47 @@ class FundReportSystem(QMainWindow):
             return False
         return True
     
+    def toggle_pause(self):
+        """暂停/继续当前运行（在当前项目完成后生效）"""
+        control = self.worker.control
+        if control.paused:
+            control.resume()
+            self.pause_btn.setText("暂停")
+            self.run_btn.setText("处理中...")
+            self.log_message("运行已继续", "info")
+        else:
+            control.pause()
+            self.pause_btn.setText("继续")
+            self.run_btn.setText("已暂停")
+            self.log_message("运行将在当前项目完成后暂停", "warning")
+    
+    def cancel_report(self):
+        """取消当前运行：已写入的报告照常保存，已完成的部分留待下次运行复用"""
+        self.worker.control.cancel()
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        self.run_btn.setText("正在取消...")
+        self.log_message("正在取消运行...", "warning")
+    
+    def on_progress(self, progress):
+        """显示工作线程上报的运行进度"""
+        total = progress['total']
+        # 总数未知时显示为忙碌状态
+        self.progress_bar.setRange(0, total if total else 0)
+        self.progress_bar.setValue(min(progress['done'], total))
+        self.progress_label.setText(format_progress(progress))
+        self.progress_label.show()
+        self.progress_bar.show()
+    
     def on_report_finished(self):
         """报告生成完成后的处理"""
         self.run_btn.setEnabled(True)
         self.run_btn.setText("生成并推送报告")
+        self.pause_btn.setText("暂停")
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        self.progress_label.hide()
+        self.progress_bar.hide()
         self.log_message("报告生成任务已完成", "success")
 
 # 高级配置对话框（使用滚动区域）
@@ -806,6 +931,9 @@ class AdvancedConfigDialog(QDialog):
         self.retry_delay.setRange(1, 60)
         other_layout.addRow("重试延迟(秒):", self.retry_delay)
         
+        self.profile_enabled = QCheckBox("性能分析模式（报告目录下生成 profile 分析结果）")
+        other_layout.addRow(self.profile_enabled)
+        
         scroll_layout.addWidget(other_group)
         
         # 设置滚动区域内容
@@ -845,6 +973,7 @@ class AdvancedConfigDialog(QDialog):
         self.max_message_bytes.setValue(config.getint('advanced', 'max_message_bytes', fallback=2048))
         self.max_retries.setValue(config.getint('advanced', 'max_retries', fallback=3))
         self.retry_delay.setValue(config.getint('advanced', 'retry_delay', fallback=5))
+        self.profile_enabled.setChecked(config.getboolean('advanced', 'profile', fallback=False))
     
     def accept(self):
         """保存配置并关闭对话框"""
@@ -862,510 +991,3877 @@ class AdvancedConfigDialog(QDialog):
             'target_return': str(self.target_return.value()),
             'max_message_bytes': str(self.max_message_bytes.value()),
             'max_retries': str(self.max_retries.value()),
-            'retry_delay': str(self.retry_delay.value())
+            'retry_delay': str(self.retry_delay.value()),
+            'profile': '1' if self.profile_enabled.isChecked() else '0'
         }
         
         self.parent.log_message("高级配置已保存")
         super().accept()
 
-# 报告工作线程
-class ReportWorker(QThread):
-    log_signal = pyqtSignal(str, str)  # 消息, 级别
-    finished = pyqtSignal()
-    
-    def __init__(self, config, base_dir, mobile_enabled, pc_enabled, by_fund, by_user):
-        super().__init__()
-        self.config = config
-        self.base_dir = base_dir
-        self.mobile_enabled = mobile_enabled
-        self.pc_enabled = pc_enabled
-        self.by_fund = by_fund
-        self.by_user = by_user
-        self.fund_data = {}  # 存储基金数据
-        self.config_dir = os.path.join(base_dir, "config")
-        self.funds_file = os.path.join(self.config_dir, "funds.txt")
-        self.report_dir = os.path.join(base_dir, "report")
-        self.target_return = config.getfloat('advanced', 'target_return', fallback=5.0)
-        self.max_message_bytes = config.getint('advanced', 'max_message_bytes', fallback=2048)
-        self.max_retries = config.getint('advanced', 'max_retries', fallback=3)
-        self.retry_delay = config.getint('advanced', 'retry_delay', fallback=5)
-    
-    def get_number_emoji(self, number):
-        """数字转序号emoji"""
-        number_emojis = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣',
-                        '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
-        return number_emojis[number-1] if 1 <= number <= 10 else f'{number}.'
-    
-    def split_long_content(self, content, max_bytes=None):
-        """智能分割长内容"""
-        if max_bytes is None:
-            max_bytes = self.max_message_bytes
-        
-        chunks = []
-        current_chunk = []
-        current_bytes = 0
-        
-        for line in content.split('\n'):
-            line_bytes = line.encode('utf-8')
-            line_length = len(line_bytes) + 1  # 包含换行符
-            
-            if current_bytes + line_length > max_bytes:
-                chunks.append('\n'.join(current_chunk))
-                current_chunk = []
-                current_bytes = 0
-                
-            current_chunk.append(line)
-            current_bytes += line_length
-        
-        if current_chunk:
-            chunks.append('\n'.join(current_chunk))
-        
-        return chunks
+# ========== 报告模板渲染 ==========
+# 报告模板：使用 str.format 语法，{字段:格式} 取值，{字段!e} 按报告格式转义文本，加载时编译为渲染函数
+# 每种报告由若干片段组成，渲染器按数据结构依次调用片段写入同一个缓冲区
+REPORT_RULE = "▔▔▔▔▔▔▔▔▔▔▔▔▔▔"
+
+REPORT_TEMPLATES = {
+    'text': {
+        # 客户持仓报告（手机推送）
+        'user_push.header': "{emoji} {user!e} 持仓详情:{count}支\n" + REPORT_RULE + "\n",
+        'user_push.fund': "{number} {name!e} | {code}\n├ 购买日期:{buy_date}\n├ 购买金额:{buy_amount_wan:.2f}万\n",
+        'user_push.nav': "├ 最新净值:{nav:.4f} | {nav_md}\n",
+        'user_push.nav_unknown': "├ 最新净值:未知\n",
+        'user_push.profit': "├ 持仓收益:{profit:+,.2f}\n",
+        'user_push.profit_unknown': "├ 持仓收益:未知\n",
+        'user_push.returns': "└ 收益率:{annualized}\n",
+        'user_push.returns_unknown': "└ 收益率:未知\n",
+        'user_push.footer': "",
+        # 客户报告（电脑端文件）
+        'user_file.header': "",
+        'user_file.fund': "基金代码: {code}\n基金名称: {name!e}\n购买日期: {buy_date}\n购买金额: {buy_amount:,.2f}\n",
+        'user_file.valid': "最新净值: {nav:.4f} ({nav_date})\n持仓收益: {profit:+,.2f}\n年化收益率: {annualized}\n\n",
+        'user_file.unknown': "最新净值: 未知\n持仓收益: 未知\n年化收益率: 未知\n\n",
+        'user_file.footer': "",
+        # 基金报告（电脑端文件）
+        'fund.header': "基金报告: {name!e} ({code})\n" + "=" * 50 + "\n持有客户数: {user_count}人 | 总持仓数: {holding_count}笔\n\n总买入金额: {total_amount:,.2f}元\n总持仓收益: {total_profit:+,.2f}元\n\n",
+        'fund.user': "客户: {user!e}\n" + "-" * 30 + "\n",
+        'fund.holding': "购买日期: {buy_date}\n买入金额: {buy_amount:,.2f}元\n",
+        'fund.valid': "最新净值: {nav:.4f} ({nav_md})\n持仓收益: {profit:+,.2f}\n收益率: {annualized}\n\n",
+        'fund.unknown': "最新净值: 未知\n持仓收益: 未知\n收益率: 未知\n\n",
+        'fund.user_separator': "\n\n",
+        'fund.footer': "",
+        # 业绩达标总结
+        'summary.header': "📊 业绩达标总结(≥{target}%)\n" + REPORT_RULE + "\n",
+        'summary.empty': "今日无达标基金\n",
+        'summary.user': "👤 {user!e}:\n",
+        'summary.fund': "  · {name!e} ({code}): {annualized:.2f}%\n",
+        'summary.user_end': "\n",
+        'summary.failed': "⚠️ 报告推送异常:\n以下{count}位用户报告未成功推送:\n{users!e}\n请检查网络连接或手动处理\n",
+        'summary.footer': "⏰ 报告生成: {time_str}\n",
+    },
+    'markdown': {
+        'user_push.header': "## {emoji} {user!e} 持仓详情: {count}支\n\n",
+        'user_push.fund': "### {number} {name!e} | {code}\n\n- 购买日期: {buy_date}\n- 购买金额: {buy_amount_wan:.2f}万\n",
+        'user_push.nav': "- 最新净值: {nav:.4f} | {nav_md}\n",
+        'user_push.nav_unknown': "- 最新净值: 未知\n",
+        'user_push.profit': "- 持仓收益: {profit:+,.2f}\n",
+        'user_push.profit_unknown': "- 持仓收益: 未知\n",
+        'user_push.returns': "- 收益率: {annualized}\n\n",
+        'user_push.returns_unknown': "- 收益率: 未知\n\n",
+        'user_push.footer': "",
+        'user_file.header': "# 客户报告: {user!e}\n\n| 基金代码 | 基金名称 | 购买日期 | 购买金额 | 最新净值 | 净值日期 | 持仓收益 | 年化收益率 |\n|---|---|---|---:|---:|---|---:|---:|\n",
+        'user_file.fund': "| {code} | {name!e} | {buy_date} | {buy_amount:,.2f} ",
+        'user_file.valid': "| {nav:.4f} | {nav_date} | {profit:+,.2f} | {annualized} |\n",
+        'user_file.unknown': "| 未知 | 未知 | 未知 | 未知 |\n",
+        'user_file.footer': "",
+        'fund.header': "# 基金报告: {name!e} ({code})\n\n- 持有客户数: {user_count}人\n- 总持仓数: {holding_count}笔\n- 总买入金额: {total_amount:,.2f}元\n- 总持仓收益: {total_profit:+,.2f}元\n\n",
+        'fund.user': "## 客户: {user!e}\n\n| 购买日期 | 买入金额(元) | 最新净值 | 持仓收益 | 收益率 |\n|---|---:|---:|---:|---:|\n",
+        'fund.holding': "| {buy_date} | {buy_amount:,.2f} ",
+        'fund.valid': "| {nav:.4f} ({nav_md}) | {profit:+,.2f} | {annualized} |\n",
+        'fund.unknown': "| 未知 | 未知 | 未知 |\n",
+        'fund.user_separator': "\n",
+        'fund.footer': "",
+        'summary.header': "# 📊 业绩达标总结(≥{target}%)\n\n",
+        'summary.empty': "今日无达标基金\n\n",
+        'summary.user': "## 👤 {user!e}\n\n",
+        'summary.fund': "- {name!e} ({code}): {annualized:.2f}%\n",
+        'summary.user_end': "\n",
+        'summary.failed': "> ⚠️ 报告推送异常: 以下{count}位用户报告未成功推送: {users!e}，请检查网络连接或手动处理\n\n",
+        'summary.footer': "⏰ 报告生成: {time_str}\n",
+    },
+    'html': {
+        'user_push.header': "<!DOCTYPE html>\n<html><head><meta charset=utf-8><title>{user!e}</title></head><body>\n<h2>{emoji} {user!e} 持仓详情: {count}支</h2>\n",
+        'user_push.fund': "<h3>{number} {name!e} | {code}</h3>\n<ul>\n<li>购买日期: {buy_date}</li>\n<li>购买金额: {buy_amount_wan:.2f}万</li>\n",
+        'user_push.nav': "<li>最新净值: {nav:.4f} | {nav_md}</li>\n",
+        'user_push.nav_unknown': "<li>最新净值: 未知</li>\n",
+        'user_push.profit': "<li>持仓收益: {profit:+,.2f}</li>\n",
+        'user_push.profit_unknown': "<li>持仓收益: 未知</li>\n",
+        'user_push.returns': "<li>收益率: {annualized}</li>\n</ul>\n",
+        'user_push.returns_unknown': "<li>收益率: 未知</li>\n</ul>\n",
+        'user_push.footer': "</body></html>\n",
+        'user_file.header': "<!DOCTYPE html>\n<html><head><meta charset=utf-8><title>{user!e}</title></head><body>\n<h1>客户报告: {user!e}</h1>\n<table border=1 cellspacing=0 cellpadding=4>\n<tr><th>基金代码</th><th>基金名称</th><th>购买日期</th><th>购买金额</th><th>最新净值</th><th>净值日期</th><th>持仓收益</th><th>年化收益率</th></tr>\n",
+        'user_file.fund': "<tr><td>{code}</td><td>{name!e}</td><td>{buy_date}</td><td>{buy_amount:,.2f}</td>",
+        'user_file.valid': "<td>{nav:.4f}</td><td>{nav_date}</td><td>{profit:+,.2f}</td><td>{annualized}</td></tr>\n",
+        'user_file.unknown': "<td>未知</td><td>未知</td><td>未知</td><td>未知</td></tr>\n",
+        'user_file.footer': "</table>\n</body></html>\n",
+        'fund.header': "<!DOCTYPE html>\n<html><head><meta charset=utf-8><title>{name!e}</title></head><body>\n<h1>基金报告: {name!e} ({code})</h1>\n<p>持有客户数: {user_count}人 | 总持仓数: {holding_count}笔</p>\n<p>总买入金额: {total_amount:,.2f}元<br>总持仓收益: {total_profit:+,.2f}元</p>\n",
+        'fund.user': "<h2>客户: {user!e}</h2>\n<table border=1 cellspacing=0 cellpadding=4>\n<tr><th>购买日期</th><th>买入金额(元)</th><th>最新净值</th><th>持仓收益</th><th>收益率</th></tr>\n",
+        'fund.holding': "<tr><td>{buy_date}</td><td>{buy_amount:,.2f}</td>",
+        'fund.valid': "<td>{nav:.4f} ({nav_md})</td><td>{profit:+,.2f}</td><td>{annualized}</td></tr>\n",
+        'fund.unknown': "<td>未知</td><td>未知</td><td>未知</td></tr>\n",
+        'fund.user_separator': "",
+        'fund.footer': "</body></html>\n",
+        'summary.header': "<!DOCTYPE html>\n<html><head><meta charset=utf-8><title>业绩达标总结</title></head><body>\n<h1>📊 业绩达标总结(≥{target}%)</h1>\n",
+        'summary.empty': "<p>今日无达标基金</p>\n",
+        'summary.user': "<h2>👤 {user!e}</h2>\n<ul>\n",
+        'summary.fund': "<li>{name!e} ({code}): {annualized:.2f}%</li>\n",
+        'summary.user_end': "</ul>\n",
+        'summary.failed': "<p>⚠️ 报告推送异常: 以下{count}位用户报告未成功推送: {users!e}<br>请检查网络连接或手动处理</p>\n",
+        'summary.footer': "<p>⏰ 报告生成: {time_str}</p>\n</body></html>\n",
+    },
+}
+
+# 报告格式对应的文件扩展名
+REPORT_FORMAT_EXTENSIONS = {'text': '.txt', 'markdown': '.md', 'html': '.html'}
+
+# 模板中可选的文本转义函数
+REPORT_ESCAPES = {
+    'text': str,
+    'markdown': lambda value: str(value).replace('|', '\\|'),
+    'html': lambda value: html.escape(str(value)),
+}
+
+def compile_template(source):
+    """把模板编译为渲染函数 render(d, e)：d 为字段值字典，e 为转义函数
+
+    模板在编译时解析为文本片段和 (字段名, 格式, 是否转义) 的序列；字段只能是简单名称，
+    不支持属性、下标和嵌套格式，转换只支持 !e
+    """
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(source):
+        if literal:
+            parts.append(literal)
+        if field is None:
+            continue
+        if not field.isidentifier():
+            raise ValueError(f"报告模板字段只能是简单名称: {{{field}}}")
+        if conversion not in (None, 'e'):
+            raise ValueError(f"报告模板不支持的转换: {{{field}!{conversion}}}")
+        if '{' in spec:
+            raise ValueError(f"报告模板不支持嵌套格式: {{{field}:{spec}}}")
+        parts.append((field, spec, conversion == 'e'))
+    parts = tuple(parts)
     
-    def get_fund_info(self, code):
-        """获取基金信息（三接口冗余查询）"""
-        # 接口1: fundgz.1234567.com.cn
-        try:
-            url1 = f"http://fundgz.1234567.com.cn/js/{code}.js"
-            response1 = requests.get(url1, headers={'Referer': 'http://fundf10.eastmoney.com/'}, timeout=10)
-            response1.raise_for_status()
-            
-            if "jsonpgz" in response1.text:
-                json_str = re.sub(r'^jsonpgz\(|\);$', '', response1.text)
-                fund_data = json.loads(json_str)
-                return {
-                    'code': fund_data['fundcode'],
-                    'name': fund_data['name'],
-                    'nav_date': fund_data['jzrq'],
-                    'nav': float(fund_data['dwjz']),
-                    'change': fund_data.get('jzzl', 'N/A'),
-                    'valid': True,
-                    'source': 1
-                }
-        except:
-            pass
-        
-        # 接口2: j4.esongfund.com
-        try:
-            url2 = f"https://j4.esongfund.com/eap/api/fund/public/portal/fundDetail/getFundBaseInfo?fundCode={code}"
-            response2 = requests.get(url2, headers={'Referer': 'http://fundf10.eastmoney.com/'}, timeout=10)
-            response2.raise_for_status()
-            data = response2.json()
-            
-            if data['code'] == 200:
-                info = data['data']
-                return {
-                    'code': code,
-                    'name': info['fundName'],
-                    'nav_date': info['netValueDate'],
-                    'nav': float(info['netValue']),
-                    'change': info['dayGrowth'],
-                    'valid': True,
-                    'source': 2
-                }
-        except:
-            pass
-        
-        # 接口3: fund.eastmoney.com/pingzhongdata
-        try:
-            url3 = f"https://fund.eastmoney.com/pingzhongdata/{code}.js"
-            response3 = requests.get(url3, headers={'Referer': 'http://fundf10.eastmoney.com/'}, timeout=10)
-            response3.encoding = 'utf-8'  # 显式设置编码
-            response3.raise_for_status()
-            js_content = response3.text
-            
-            # 提取基金名称
-            name_match = re.search(r'var fS_name\s*=\s*"([^"]+)"', js_content)
-            fund_name = name_match.group(1) if name_match else f"查询失败({code})"
-            
-            # 提取净值数据
-            nav_data_match = re.search(r'var Data_netWorthTrend\s*=\s*(\[.*?\])', js_content)
-            if nav_data_match:
-                nav_data = json.loads(nav_data_match.group(1))
-                if nav_data:
-                    # 获取最新净值数据点
-                    latest_point = nav_data[-1]
-                    nav_timestamp = latest_point['x'] / 1000
-                    nav_date = datetime.fromtimestamp(nav_timestamp).strftime('%Y-%m-%d')
-                    nav_value = latest_point['y']
-                    
-                    # 检查净值日期是否超过当前日期
-                    current_date = datetime.now().strftime('%Y-%m-%d')
-                    if nav_date > current_date:
-                        # 尝试使用前一个净值点
-                        if len(nav_data) > 1:
-                            prev_point = nav_data[-2]
-                            nav_timestamp = prev_point['x'] / 1000
-                            nav_date = datetime.fromtimestamp(nav_timestamp).strftime('%Y-%m-%d')
-                            nav_value = prev_point['y']
-                        else:
-                            return {
-                                'code': code,
-                                'name': fund_name + " [未开放]",
-                                'nav_date': "",
-                                'nav': 0.0,
-                                'change': "N/A",
-                                'valid': False,
-                                'source': 3
-                            }
-                    
-                    # 提取涨跌幅
-                    change_match = re.search(r'var syl_1y\s*=\s*"([^"]*)"', js_content)
-                    change_value = change_match.group(1) if change_match else "N/A"
-                    
-                    return {
-                        'code': code,
-                        'name': fund_name + " [未开放]",
-                        'nav_date': nav_date,
-                        'nav': float(nav_value),
-                        'change': change_value,
-                        'valid': True,
-                        'source': 3
-                    }
-        except Exception as e:
-            pass
-        
-        # 所有接口都失败时返回未知基金信息
-        return {
-            'code': code,
-            'name': f"查询失败({code})",
-            'nav_date': "",
-            'nav': 0.0,
-            'change': "N/A",
-            'valid': False,
-            'source': 0
+    def render(d, e):
+        out = []
+        for part in parts:
+            if part.__class__ is str:
+                out.append(part)
+            else:
+                field, spec, escape = part
+                value = d[field]
+                out.append(format(e(value) if escape else value, spec))
+        return "".join(out)
+    return render
+
+_compiled_templates = {}
+
+def get_compiled_templates(fmt):
+    """按格式编译并缓存全部报告模板"""
+    if fmt not in REPORT_TEMPLATES:
+        raise ValueError(f"未知的报告格式: {fmt}")
+    if fmt not in _compiled_templates:
+        _compiled_templates[fmt] = {
+            name: compile_template(source) for name, source in REPORT_TEMPLATES[fmt].items()
         }
-    
-    def calculate_returns(self, buy_date_str, nav_date_str, profit, amount, is_valid=True):
-        """计算收益率"""
-        if not is_valid:
-            return ("未知", "未知")
-        
-        try:
-            buy_date = datetime.strptime(buy_date_str, "%Y-%m-%d")
-            nav_date = datetime.strptime(nav_date_str, "%Y-%m-%d")
-            
-            if nav_date < buy_date:
-                return ("N/A", "N/A")
-                
-            delta = nav_date - buy_date
-            days = delta.days
-            
-            if days <= 0 or amount == 0:
-                return ("N/A", "N/A")
-            
-            absolute_return = (profit / float(amount)) * 100
-            years = days / 365
-            annualized_return = (absolute_return / years) if years > 0 else "N/A"
-            
-            return (
-                f"{absolute_return:+.2f}%",
-                f"{annualized_return:+.2f}%" if isinstance(annualized_return, float) else "N/A"
-            )
-        except:
-            return ("N/A", "N/A")
-    
-    def validate_fund_row(self, row, line_num):
-        """验证数据行有效性"""
-        if len(row) != 5:
-            return False
-        
-        username, code, buy_date, amount, shares = row
-        if not re.match(r'^[\u4e00-\u9fa5A-Za-z]{2,20}$', username):
-            return False
-        
-        try:
-            datetime.strptime(buy_date, '%Y-%m-%d')
-            float(amount)
-            float(shares)
-        except ValueError:
-            return False
-        
-        return True
-    
-    def generate_user_report(self, user, data, emoji):
-        """生成用户报告（用于推送）"""
+    return _compiled_templates[fmt]
+
+@lru_cache(maxsize=4096)
+def parse_report_date(date_str):
+    """解析 YYYY-MM-DD 日期（同一日期只解析一次）"""
+    return datetime.strptime(date_str, "%Y-%m-%d")
+
+@lru_cache(maxsize=4096)
+def format_month_day(date_str):
+    """把 YYYY-MM-DD 转换为 MM-DD"""
+    return parse_report_date(date_str).strftime("%m-%d")
+
+def get_number_emoji(number):
+    """数字转序号emoji"""
+    number_emojis = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣',
+                    '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
+    return number_emojis[number-1] if 1 <= number <= 10 else f'{number}.'
+
+def parse_return_value(return_str):
+    """从 "+12.34%" 形式的收益率文本中取出数值，无法解析时返回 None"""
+    if return_str in ["N/A", "未知"]:
+        return None
+    try:
+        return float(return_str.rstrip('%'))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def collect_performance_data(user_data, target_return):
+    """收集所有达到目标收益率的基金，返回 {用户名: [基金...]}（按用户顺序）"""
+    performance_data = OrderedDict()
+    for user, data in user_data.items():
+        for fund in data['funds']:
+            if not fund.get('valid', True) or 'returns' not in fund:
+                continue
+            return_value = parse_return_value(fund['returns']['annualized'])
+            if return_value is not None and return_value >= target_return:
+                performance_data.setdefault(user, []).append({
+                    'code': fund['code'],
+                    'name': fund['name'],
+                    'annualized': return_value
+                })
+    return performance_data
+
+class ReportRenderer:
+    """报告渲染器：各类报告使用预编译模板渲染到单个缓冲区，支持 text / markdown / html 三种格式
+
+    text 格式的输出与原有逐行拼接的报告逐字节一致
+    """
+
+    def __init__(self, fmt='text'):
+        self.fmt = fmt
+        self.t = get_compiled_templates(fmt)
+        self.e = REPORT_ESCAPES[fmt]
+        self.extension = REPORT_FORMAT_EXTENSIONS[fmt]
+
+    def _finish(self, buf):
+        # text 格式的推送/基金/汇总报告原本以换行连接各行，末尾没有换行
+        text = buf.getvalue()
+        if self.fmt == 'text' and text.endswith('\n'):
+            return text[:-1]
+        return text
+
+    def render_user_push(self, user, data, emoji):
+        """客户持仓报告（用于推送）"""
+        t, e = self.t, self.e
+        buf = io.StringIO()
+        w = buf.write
+
         # 对基金进行排序：先有效基金，再无效基金；每组内按购买日期排序
         sorted_funds = sorted(
-            data['funds'], 
-            key=lambda x: (
-                not x.get('valid', True),  # 有效基金排前面
-                datetime.strptime(x['buy_date'], "%Y-%m-%d")  # 按购买日期排序
-            )
+            data['funds'],
+            key=lambda x: (not x.get('valid', True), parse_report_date(x['buy_date']))
         )
-        
-        report = [
-            f"{emoji} {user} 持仓详情:{len(data['funds'])}支",
-            "▔▔▔▔▔▔▔▔▔▔▔▔▔▔"
-        ]
-        
+        w(t['user_push.header']({'emoji': emoji, 'user': user, 'count': len(data['funds'])}, e))
         for idx, fund in enumerate(sorted_funds, 1):
-            # 处理基金名称显示（保留[未开放]标记）
-            fund_title = f"{self.get_number_emoji(idx)} {fund['name']} | {fund['code']}"
-            
-            report.append(fund_title)
-            report.append(f"├ 购买日期:{fund['buy_date']}")
-            report.append(f"├ 购买金额:{fund['buy_amount']/10000:.2f}万")
-            
-            if fund.get('valid', True) and fund.get('nav_date'):
-                # 将日期格式从 "YYYY-MM-DD" 转换为 "MM-DD"
-                nav_date = datetime.strptime(fund['nav_date'], "%Y-%m-%d").strftime("%m-%d")
-                report.append(f"├ 最新净值:{fund['nav']:.4f} | {nav_date}")
+            valid = fund.get('valid', True)
+            d = dict(fund, number=get_number_emoji(idx), buy_amount_wan=fund['buy_amount'] / 10000)
+            w(t['user_push.fund'](d, e))
+            if valid and fund.get('nav_date'):
+                d['nav_md'] = format_month_day(fund['nav_date'])
+                w(t['user_push.nav'](d, e))
             else:
-                report.append(f"├ 最新净值:未知")
-            
-            if fund.get('valid', True) and 'profit' in fund:
-                report.append(f"├ 持仓收益:{fund['profit']:+,.2f}")
+                w(t['user_push.nav_unknown'](d, e))
+            w(t['user_push.profit'](d, e) if valid and 'profit' in fund else t['user_push.profit_unknown'](d, e))
+            if valid and 'returns' in fund:
+                d['annualized'] = fund['returns']['annualized']
+                w(t['user_push.returns'](d, e))
             else:
-                report.append(f"├ 持仓收益:未知")
-            
-            if fund.get('valid', True) and 'returns' in fund:
-                report.append(f"└ 收益率:{fund['returns']['annualized']}")
+                w(t['user_push.returns_unknown'](d, e))
+        w(t['user_push.footer']({}, e))
+        return self._finish(buf)
+
+    def render_user_file(self, user, data):
+        """客户报告（用于电脑端文件）"""
+        t, e = self.t, self.e
+        buf = io.StringIO()
+        w = buf.write
+        w(t['user_file.header']({'user': user}, e))
+        for fund in data['funds']:
+            w(t['user_file.fund'](fund, e))
+            if fund.get('valid', True):
+                w(t['user_file.valid'](dict(fund, annualized=fund['returns']['annualized']), e))
             else:
-                report.append(f"└ 收益率:未知")
-        
-        return '\n'.join(report)
-    
-    def generate_performance_summary(self, user_data, target_return, time_str, failed_users=None):
-        """生成业绩达标总结报告（用于推送）"""
-        # 收集所有达到目标收益率的基金
-        performance_data = defaultdict(list)
-        
-        for user, data in user_data.items():
-            for fund in data['funds']:
-                # 只处理有效基金
-                if not fund.get('valid', True) or 'returns' not in fund:
-                    continue
-                    
-                # 提取年化收益率数值
-                try:
-                    if fund['returns']['annualized'] in ["N/A", "未知"]:
-                        continue
-                        
-                    # 从字符串中提取数字部分（保留符号）
-                    return_str = fund['returns']['annualized'].rstrip('%')
-                    if return_str.startswith('+'):
-                        return_value = float(return_str[1:])
-                    elif return_str.startswith('-'):
-                        return_value = float(return_str)  # 保留负号
-                    else:
-                        return_value = float(return_str)
-                    
-                    # 检查是否达标（正收益且大于等于目标值）
-                    if return_value >= target_return:
-                        performance_data[user].append({
-                            'code': fund['code'],
-                            'name': fund['name'],
-                            'annualized': return_value
-                        })
-                except (ValueError, TypeError) as e:
-                    continue
-        
-        # 生成报告内容
-        if not performance_data:
-            report = [
-                f"📊 业绩达标总结(≥{target_return}%)",
-                "▔▔▔▔▔▔▔▔▔▔▔▔▔▔",
-                "今日无达标基金"
-            ]
-        else:
-            report = [
-                f"📊 业绩达标总结(≥{target_return}%)",
-                "▔▔▔▔▔▔▔▔▔▔▔▔▔▔"
-            ]
-            
-            for user, funds in performance_data.items():
-                report.append(f"👤 {user}:")
-                for fund in funds:
-                    report.append(f"  · {fund['name']} ({fund['code']}): {fund['annualized']:.2f}%")
-                report.append("")  # 添加空行分隔不同用户
-        
-        # 添加失败用户提示
-        if failed_users:
-            report.append("⚠️ 报告推送异常:")
-            report.append(f"以下{len(failed_users)}位用户报告未成功推送:")
-            report.append(", ".join(failed_users))
-            report.append("请检查网络连接或手动处理")
-        
-        report.append(f"⏰ 报告生成: {time_str}")
-        return '\n'.join(report)
-    
-    def generate_fund_report(self, fund_code, fund_name, holdings):
-        """生成基金报告：持有该基金的客户情况列表和详情"""
-        # 清洁基金名称（去除[未开放]标记）
-        clean_fund_name = fund_name.replace(" [未开放]", "")
-        
-        # 按客户分组并排序（按最早购买日期）
+                w(t['user_file.unknown'](fund, e))
+        w(t['user_file.footer']({}, e))
+        # 该报告原本每行自带换行，不做末尾处理
+        return buf.getvalue()
+
+    def render_fund(self, fund_code, fund_name, holdings):
+        """基金报告：持有该基金的客户情况列表和详情"""
+        t, e = self.t, self.e
+        buf = io.StringIO()
+        w = buf.write
+
+        # 按客户分组
         user_holdings = defaultdict(list)
         for holding in holdings:
             user_holdings[holding['username']].append(holding)
-        
         # 按每个客户最早购买该基金的日期排序
-        sorted_users = []
-        for user, funds in user_holdings.items():
-            # 获取该用户的最早购买日期
-            earliest_date = min([datetime.strptime(f['buy_date'], "%Y-%m-%d") for f in funds])
-            sorted_users.append((user, earliest_date))
-        
-        # 按最早购买日期排序
-        sorted_users.sort(key=lambda x: x[1])
-        
-        # 生成报告 - 使用简单字符避免乱码
-        report = [
-            f"基金报告: {clean_fund_name} ({fund_code})",
-            "=" * 50,
-            f"持有客户数: {len(user_holdings)}人 | 总持仓数: {len(holdings)}笔",
-            ""
-        ]
-        
-        # 添加汇总统计
-        total_amount = sum(h['buy_amount'] for h in holdings)
-        total_profit = sum(h['profit'] for h in holdings if h.get('valid', True))
-        report.append(f"总买入金额: {total_amount:,.2f}元")
-        report.append(f"总持仓收益: {total_profit:+,.2f}元")
-        report.append("")
-        
-        # 添加每个客户的持有详情（按购买时间排序）
-        for user, _ in sorted_users:
-            funds = user_holdings[user]
-            
-            # 按购买日期排序
-            sorted_funds = sorted(funds, key=lambda x: datetime.strptime(x['buy_date'], "%Y-%m-%d"))
-            
-            report.append(f"客户: {user}")
-            report.append("-" * 30)
-            
-            for fund in sorted_funds:
-                report.append(f"购买日期: {fund['buy_date']}")
-                report.append(f"买入金额: {fund['buy_amount']:,.2f}元")
-                
+        sorted_users = sorted(
+            user_holdings,
+            key=lambda user: min(parse_report_date(h['buy_date']) for h in user_holdings[user])
+        )
+
+        w(t['fund.header']({
+            'name': fund_name.replace(" [未开放]", ""),
+            'code': fund_code,
+            'user_count': len(user_holdings),
+            'holding_count': len(holdings),
+            'total_amount': sum(h['buy_amount'] for h in holdings),
+            'total_profit': sum(h['profit'] for h in holdings if h.get('valid', True))
+        }, e))
+
+        for user_idx, user in enumerate(sorted_users):
+            if user_idx:
+                w(t['fund.user_separator']({}, e))  # 用户间分隔（最后一个用户后不加）
+            w(t['fund.user']({'user': user}, e))
+            for fund in sorted(user_holdings[user], key=lambda x: parse_report_date(x['buy_date'])):
+                w(t['fund.holding'](fund, e))
                 if fund.get('valid', True) and fund.get('nav_date'):
-                    # 将净值日期格式化为MM-DD
-                    nav_date = datetime.strptime(fund['nav_date'], "%Y-%m-%d").strftime("%m-%d")
-                    report.append(f"最新净值: {fund['nav']:.4f} ({nav_date})")
-                    report.append(f"持仓收益: {fund['profit']:+,.2f}")
-                    report.append(f"收益率: {fund['returns_annualized']}")
-                else:
-                    report.append(f"最新净值: 未知")
-                    report.append(f"持仓收益: 未知")
-                    report.append(f"收益率: 未知")
-                
-                report.append("")  # 添加空行分隔不同购买记录
-            
-            if user != sorted_users[-1][0]:
-                report.append("\n")  # 用户间分隔线（最后一个用户不加）
-        
-        return '\n'.join(report)
-    
-    def sanitize_filename(self, name):
-        """清洗文件名中的非法字符"""
-        # 替换特殊字符和空格
-        name = re.sub(r'[\\/*?:"<>|]', '_', name)
-        # 替换中英文括号
-        name = name.replace('(', '_').replace(')', '_')
-        name = name.replace('（', '_').replace('）', '_')
-        # 替换空格
-        name = name.replace(' ', '_')
-        return name.strip()
-    
-    def send_bark_notification(self, title, message, retries=None):
-        """发送Bark通知（带重试机制）"""
-        if retries is None:
-            retries = self.max_retries
-            
-        attempts = 0
-        while attempts <= retries:
-            attempts += 1
-            try:
-                bark_url = self.config.get('advanced', 'bark_url', fallback='')
-                bark_token = self.config.get('advanced', 'bark_token', fallback='')
-                
-                if not bark_url or not bark_token:
-                    self.log_signal.emit("Bark配置不完整，无法发送通知", "error")
-                    return False
-                
-                # 修复：使用查询参数而不是路径参数
-                # 对标题和消息进行URL编码
-                encoded_title = quote(title, safe='')
-                encoded_message = quote(message, safe='')
-                
-                # 构建请求URL - 使用查询参数
-                url = f"{bark_url}/{bark_token}?title={encoded_title}&body={encoded_message}"
-                
-                # 发送请求
-                response = requests.get(url, verify=False, timeout=10)
-                
-                if response.status_code == 200:
-                    self.log_signal.emit(f"Bark通知发送成功: {title[:20]}...", "success")
-                    return True
-                else:
-                    self.log_signal.emit(f"Bark通知发送失败: {response.status_code}", "error")
-                    self.log_signal.emit(f"响应内容: {response.text[:100]}", "error")
-                    raise Exception(f"HTTP状态码: {response.status_code}")
-            except Exception as e:
-                error_msg = str(e)
-                self.log_signal.emit(f"Bark通知发送异常(尝试 {attempts}/{retries}): {error_msg}", "warning")
-                
-                if attempts <= retries:
-                    time.sleep(self.retry_delay)
-                else:
-                    self.log_signal.emit(f"⚠️ Bark推送失败: {title[:20]}...", "error")
-                    return False
-    
-    def send_gotify_notification(self, title, message, retries=None):
-        """发送Gotify通知（带重试机制）"""
-        if retries is None:
-            retries = self.max_retries
-            
-        attempts = 0
-        while attempts <= retries:
-            attempts += 1
-            try:
-                gotify_url = self.config.get('advanced', 'gotify_url', fallback='')
-                gotify_token = self.config.get('advanced', 'gotify_token', fallback='')
-                
-                if not gotify_url or not gotify_token:
-                    self.log_signal.emit("Gotify配置不完整，无法发送通知", "error")
-                    return False
-                
-                # 构建请求URL
-                url = f"{gotify_url}/message?token={gotify_token}"
-                
-                # 构建请求数据
-                data = {
-                    "title": title,
-                    "message": message,
-                    "priority": 5
-                }
-                
-                # 发送请求
-                response = requests.post(url, json=data, verify=False, timeout=10)
-                
-                if response.status_code == 200:
-                    self.log_signal.emit(f"Gotify通知发送成功: {title[:20]}...", "success")
-                    return True
-                else:
-                    self.log_signal.emit(f"Gotify通知发送失败: {response.status_code}", "error")
-                    self.log_signal.emit(f"响应内容: {response.text[:100]}", "error")
-                    raise Exception(f"HTTP状态码: {response.status_code}")
-            except Exception as e:
-                error_msg = str(e)
-                self.log_signal.emit(f"Gotify通知发送异常(尝试 {attempts}/{retries}): {error_msg}", "warning")
-                
-                if attempts <= retries:
-                    time.sleep(self.retry_delay)
+                    w(t['fund.valid'](dict(
+                        fund, nav_md=format_month_day(fund['nav_date']), annualized=fund['returns_annualized']
+                    ), e))
                 else:
-                    self.log_signal.emit(f"⚠️ Gotify推送失败: {title[:20]}...", "error")
-                    return False
-    
-    def send_wecom_notification(self, title, message, retries=None):
-        """发送企业微信通知（带重试机制）"""
-        if retries is None:
-            retries = self.max_retries
-            
+                    w(t['fund.unknown'](fund, e))
+        w(t['fund.footer']({}, e))
+        return self._finish(buf)
+
+    def render_performance_summary(self, user_data, target_return, time_str, failed_users=None):
+        """业绩达标总结报告"""
+        return self.render_performance_data(
+            collect_performance_data(user_data, target_return), target_return, time_str, failed_users
+        )
+
+    def render_performance_data(self, performance_data, target_return, time_str, failed_users=None):
+        """由已收集的达标基金渲染业绩达标总结报告（分片计算时各分片的结果合并后再渲染）"""
+        t, e = self.t, self.e
+        buf = io.StringIO()
+        w = buf.write
+
+        w(t['summary.header']({'target': target_return}, e))
+        if not performance_data:
+            w(t['summary.empty']({}, e))
+        for user, funds in performance_data.items():
+            w(t['summary.user']({'user': user}, e))
+            for fund in funds:
+                w(t['summary.fund'](fund, e))
+            w(t['summary.user_end']({}, e))
+        if failed_users:
+            w(t['summary.failed']({'count': len(failed_users), 'users': ", ".join(failed_users)}, e))
+        w(t['summary.footer']({'time_str': time_str}, e))
+        return self._finish(buf)
+
+def sanitize_filename(name):
+    """清洗文件名中的非法字符"""
+    # 替换特殊字符和空格
+    name = re.sub(r'[\\/*?:"<>|]', '_', name)
+    # 替换中英文括号
+    name = name.replace('(', '_').replace(')', '_')
+    name = name.replace('（', '_').replace('）', '_')
+    # 替换空格
+    name = name.replace(' ', '_')
+    return name.strip()
+
+def _default_file_mode():
+    """按当前 umask 新建普通文件时的权限（导入时读取一次，避免多线程写入时修改 umask）"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+DEFAULT_FILE_MODE = _default_file_mode()
+
+def make_temp_file(dir_name, prefix, target_path):
+    """在目标文件所在目录创建临时文件，返回 (fd, 路径)
+
+    mkstemp 创建的文件权限为 0600，重命名后会保留下来；这里改为目标文件已有的权限，
+    目标文件不存在时使用按 umask 新建文件的默认权限，与直接 open() 写入时一致
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, suffix=".tmp", dir=dir_name)
+    try:
+        mode = os.stat(target_path).st_mode & 0o777
+    except OSError:
+        mode = DEFAULT_FILE_MODE
+    try:
+        os.chmod(tmp_path, mode)
+    except OSError:
+        pass
+    return fd, tmp_path
+
+def atomic_write_bytes(file_path, data, fsync=False):
+    """原子写入文件：先写同目录临时文件，再重命名覆盖目标文件，返回写入字节数"""
+    dir_name, base_name = os.path.split(file_path)
+    fd, tmp_path = make_temp_file(dir_name, f".{base_name}.", file_path)
+    try:
+        with os.fdopen(fd, 'wb', buffering=1024 * 1024) as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        # 写入失败时清理临时文件，目标文件保持原样
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(data)
+
+def atomic_write_text(file_path, content, encoding='utf-8', fsync=False):
+    """原子写入文本文件，返回写入字节数"""
+    return atomic_write_bytes(file_path, content.encode(encoding), fsync)
+
+# 报告种类：按基金、按客户、汇总报告（已达目标收益）
+REPORT_KINDS = ('by_fund', 'by_user', 'summary')
+REPORT_BACKENDS = ('files', 'zip', 'sqlite')
+SUMMARY_REPORT_NAME = "已达目标收益"
+
+# 报告文件批量写入器
+class ReportFileWriter:
+    """报告写入阶段（目录文件后端）：目录一次性创建、线程池并行渲染与写入、临时文件+重命名保证原子性
+
+    每份报告保存为 report/<kind>/<key>/<timestamp>.txt，汇总报告保存为 report/已达目标收益.txt
+    （扩展名随报告格式变化，见 REPORT_FORMAT_EXTENSIONS）
+    """
+    backend = 'files'
+    parallel_store = True  # 存储动作是否可以在线程池中并行执行
+
+    def __init__(self, report_dir, timestamp, max_workers=8, fsync=False, encoding='utf-8', extension='.txt'):
+        self.report_dir = report_dir
+        self.timestamp = timestamp
+        self.extension = extension
+        self.max_workers = max(1, max_workers)
+        self.fsync = fsync
+        self.encoding = encoding
+        self.jobs = []  # (kind, key, name, 内容或渲染函数, 标签)
+        self.written = []  # 成功写入的 (kind, key, name)
+
+    def add(self, kind, key, content, label="", name=None):
+        """登记一份待写入的报告
+
+        kind 为 REPORT_KINDS 之一，key 为基金代码/用户名/汇总报告名，name 为基金名称（仅 by_fund 使用）；
+        content 可以是字符串，也可以是返回字符串的无参函数（延迟到线程池中渲染）
+        """
+        self.jobs.append((kind, key, name, content, label))
+
+    def report_path(self, kind, key, name=None):
+        if kind == 'summary':
+            return os.path.join(self.report_dir, f"{key}{self.extension}")
+        dir_name = sanitize_filename(f"{key}_{name}" if name else key)
+        return os.path.join(self.report_dir, kind, dir_name, f"{self.timestamp}{self.extension}")
+
+    def describe(self, kind, key, name=None):
+        """报告的存放位置描述（用于日志）"""
+        return self.report_path(kind, key, name)
+
+    def journal_items(self):
+        """本次运行写入的报告清单（供报告保留任务登记），格式为 [kind, key, 相对路径]"""
+        return [
+            [kind, key, os.path.relpath(self.report_path(kind, key, name), self.report_dir)]
+            for kind, key, name in self.written if kind != 'summary'
+        ]
+
+    def _open(self):
+        # 所有目录只创建一次，避免每个文件都 exists + makedirs
+        for dir_name in {os.path.dirname(self.report_path(kind, key, name)) for kind, key, name, _, _ in self.jobs}:
+            os.makedirs(dir_name, exist_ok=True)
+
+    def _render(self, job):
+        content = job[3]
+        text = content() if callable(content) else content
+        return text.encode(self.encoding)
+
+    def _store(self, job, data):
+        kind, key, name = job[:3]
+        return atomic_write_bytes(self.report_path(kind, key, name), data, self.fsync)
+
+    def _render_and_store(self, job):
+        return self._store(job, self._render(job))
+
+    def _close(self, ok):
+        pass
+
+    def write_all(self, on_result=None, stop=None):
+        """执行全部写入任务，返回吞吐统计
+
+        on_result(label, location, error) 在每份报告完成后回调，error 为 None 表示成功；
+        stop() 在每份报告开始前调用（可阻塞以暂停写入），返回 True 时跳过尚未开始的报告，
+        已完成的报告照常提交
+        """
+        start = time.perf_counter()
+        files = 0
+        failed = 0
+        skipped = 0
+        total_bytes = 0
+        ok = False
+
+        self._open()
+        try:
+            render = self._render_and_store if self.parallel_store else self._render
+            if stop is None:
+                task = render
+            else:
+                def task(job):
+                    return None if stop() else render(job)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(task, job): job for job in self.jobs}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        result = future.result()
+                        if result is None:
+                            skipped += 1
+                            continue
+                        # 归档类后端只能串行写入同一个文件，渲染结果在此线程中落盘
+                        total_bytes += result if self.parallel_store else self._store(job, result)
+                        files += 1
+                        self.written.append(job[:3])
+                        error = None
+                    except Exception as e:
+                        failed += 1
+                        error = e
+                    if on_result:
+                        on_result(job[4], self.describe(job[0], job[1], job[2]), error)
+            ok = True
+        finally:
+            self._close(ok)
+            self.jobs = []
+
+        elapsed = time.perf_counter() - start
+        return {
+            'files': files,
+            'failed': failed,
+            'skipped': skipped,
+            'bytes': total_bytes,
+            'elapsed': elapsed,
+            'files_per_sec': files / elapsed if elapsed > 0 else 0.0,
+            'mb_per_sec': total_bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0.0
+        }
+
+class ZipReportWriter(ReportFileWriter):
+    """单文件归档后端：一次运行的全部报告写入 report/archive/<timestamp>.zip
+
+    归档内路径为 <kind>/<key>.<扩展名>，按基金代码、用户名直接定位
+    """
+    backend = 'zip'
+    parallel_store = False
+
+    def journal_items(self):
+        return []
+
+    def archive_path(self):
+        return os.path.join(self.report_dir, "archive", f"{self.timestamp}.zip")
+
+    def describe(self, kind, key, name=None):
+        return f"{self.archive_path()}:{zip_entry_name(kind, key, self.extension)}"
+
+    def _open(self):
+        archive_path = self.archive_path()
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        fd, self.tmp_path = make_temp_file(os.path.dirname(archive_path), ".archive.", archive_path)
+        os.close(fd)
+        self.zip_file = zipfile.ZipFile(self.tmp_path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def _store(self, job, data):
+        kind, key = job[:2]
+        info = zipfile.ZipInfo(zip_entry_name(kind, key, self.extension), date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        self.zip_file.writestr(info, data)
+        return len(data)
+
+    def _close(self, ok):
+        try:
+            self.zip_file.close()
+            if ok:
+                if self.fsync:
+                    with open(self.tmp_path, 'rb') as f:
+                        os.fsync(f.fileno())
+                os.replace(self.tmp_path, self.archive_path())
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            if not ok:
+                # 归档未完成、关闭或重命名失败时清理临时文件，已有的同名归档保持原样
+                try:
+                    os.remove(self.tmp_path)
+                except OSError:
+                    pass
+
+class SqliteReportWriter(ReportFileWriter):
+    """单数据库后端：所有运行的报告写入 report/reports.db，按 (kind, key, run_ts) 建立索引
+
+    报告正文以 zlib 压缩后保存，每次运行一个事务提交
+    """
+    backend = 'sqlite'
+    parallel_store = False
+
+    def journal_items(self):
+        return []
+
+    def database_path(self):
+        return report_database_path(self.report_dir)
+
+    def describe(self, kind, key, name=None):
+        return f"{self.database_path()}:{kind}/{key}@{self.timestamp}"
+
+    def _open(self):
+        os.makedirs(self.report_dir, exist_ok=True)
+        self.conn = open_report_database(self.database_path())
+        if not self.fsync:
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _render(self, job):
+        # 压缩在线程池中完成，主线程只负责插入
+        return zlib.compress(super()._render(job), 6)
+
+    def _store(self, job, data):
+        kind, key = job[:2]
+        self.conn.execute(
+            "INSERT OR REPLACE INTO reports (kind, key, run_ts, label, content) VALUES (?, ?, ?, ?, ?)",
+            (kind, key, self.timestamp, job[4], data)
+        )
+        return len(data)
+
+    def _close(self, ok):
+        try:
+            if ok:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
+
+def zip_entry_name(kind, key, extension='.txt'):
+    """归档内的报告路径"""
+    return f"{kind}/{sanitize_filename(key)}{extension}"
+
+def report_database_path(report_dir):
+    return os.path.join(report_dir, "reports.db")
+
+def open_report_database(db_path):
+    """打开报告数据库（不存在则建表）"""
+    conn = sqlite3.connect(db_path)
+    # 新建数据库时启用增量回收，报告清理后可释放空间而无需整库 VACUUM
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS reports ("
+        " kind TEXT NOT NULL,"
+        " key TEXT NOT NULL,"
+        " run_ts TEXT NOT NULL,"
+        " label TEXT,"
+        " content BLOB NOT NULL,"
+        " PRIMARY KEY (kind, key, run_ts)"
+        ") WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_run_ts ON reports (run_ts)")
+    return conn
+
+def create_report_writer(backend, report_dir, timestamp, max_workers=8, fsync=False, extension='.txt'):
+    """按配置的输出后端创建报告写入器"""
+    writers = {
+        'files': ReportFileWriter,
+        'zip': ZipReportWriter,
+        'sqlite': SqliteReportWriter
+    }
+    if backend not in writers:
+        raise ValueError(f"未知的报告输出后端: {backend}")
+    return writers[backend](report_dir, timestamp, max_workers, fsync, extension=extension)
+
+def read_archived_report(report_dir, backend, kind, key, timestamp=None):
+    """查询单份历史报告，返回 (时间戳, 报告内容)，未找到时返回 None
+
+    kind 为 REPORT_KINDS 之一，key 为基金代码/用户名；timestamp 为空时返回最新一份
+    """
+    if kind not in REPORT_KINDS:
+        raise ValueError(f"未知的报告类型: {kind}")
+
+    if backend == 'sqlite':
+        db_path = report_database_path(report_dir)
+        if not os.path.exists(db_path):
+            return None
+        conn = sqlite3.connect(db_path)
+        try:
+            if timestamp:
+                row = conn.execute(
+                    "SELECT run_ts, content FROM reports WHERE kind = ? AND key = ? AND run_ts = ?",
+                    (kind, key, timestamp)
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT run_ts, content FROM reports WHERE kind = ? AND key = ? ORDER BY run_ts DESC LIMIT 1",
+                    (kind, key)
+                ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return row[0], zlib.decompress(row[1]).decode('utf-8')
+
+    if backend == 'zip':
+        archive_dir = os.path.join(report_dir, "archive")
+        if timestamp:
+            candidates = [f"{timestamp}.zip"]
+        elif os.path.isdir(archive_dir):
+            candidates = sorted((n for n in os.listdir(archive_dir) if n.endswith('.zip')), reverse=True)
+        else:
+            candidates = []
+        entries = [zip_entry_name(kind, key, ext) for ext in REPORT_FORMAT_EXTENSIONS.values()]
+        for archive_name in candidates:
+            archive_path = os.path.join(archive_dir, archive_name)
+            if not os.path.exists(archive_path):
+                continue
+            with zipfile.ZipFile(archive_path) as zf:
+                names = set(zf.namelist())
+                for entry in entries:
+                    if entry in names:
+                        return archive_name[:-len('.zip')], zf.read(entry).decode('utf-8')
+        return None
+
+    if backend == 'files':
+        if kind == 'summary':
+            paths = [os.path.join(report_dir, f"{key}{ext}") for ext in REPORT_FORMAT_EXTENSIONS.values()]
+            paths = [path for path in paths if os.path.exists(path)]
+            if not paths:
+                return None
+            file_path = max(paths, key=os.path.getmtime)
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y%m%d_%H%M%S"), f.read()
+        kind_dir = os.path.join(report_dir, kind)
+        if not os.path.isdir(kind_dir):
+            return read_archived_report(report_dir, 'zip', kind, key, timestamp)
+        safe_key = sanitize_filename(key)
+        # 基金目录名为 代码_名称，客户目录名为 用户名；基金改名后同一代码会有多个目录，在所有目录中取最新一份
+        candidates = []  # (时间戳, 文件路径)
+        for entry in os.scandir(kind_dir):
+            if not entry.is_dir():
+                continue
+            if entry.name != safe_key and not (kind == 'by_fund' and entry.name.startswith(f"{safe_key}_")):
+                continue
+            for name in os.listdir(entry.path):
+                stem, ext = os.path.splitext(name)
+                if ext in REPORT_FORMAT_EXTENSIONS.values() and (not timestamp or stem == timestamp):
+                    candidates.append((stem, os.path.join(entry.path, name)))
+        if candidates:
+            run_ts, file_path = max(candidates)
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return run_ts, f.read()
+        # 已被保留任务压缩整理的历史报告位于 report/archive 中
+        return read_archived_report(report_dir, 'zip', kind, key, timestamp)
+
+    raise ValueError(f"未知的报告输出后端: {backend}")
+
+REPORT_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+def select_retained_runs(timestamps, now, keep_days=30, keep_weeks=12, keep_months=24):
+    """按保留策略挑选需要保留的运行时间戳
+
+    最近 keep_days 天内的运行全部保留；更早的运行在 keep_weeks 周内每周保留最后一次、
+    在 keep_months 个月内每月保留最后一次，其余全部清理
+    """
+    detail_cutoff = now - timedelta(days=keep_days)
+    weekly_cutoff = now - timedelta(weeks=keep_weeks)
+    monthly_cutoff = (now.year * 12 + now.month - 1) - keep_months
+
+    keep = set()
+    weekly_latest = {}
+    monthly_latest = {}
+    for ts in timestamps:
+        run_time = datetime.strptime(ts, REPORT_TIMESTAMP_FORMAT)
+        if run_time >= detail_cutoff:
+            keep.add(ts)
+        if run_time >= weekly_cutoff:
+            week = run_time.isocalendar()[:2]
+            if ts > weekly_latest.get(week, ''):
+                weekly_latest[week] = ts
+        month_index = run_time.year * 12 + run_time.month - 1
+        if month_index > monthly_cutoff:
+            if ts > monthly_latest.get(month_index, ''):
+                monthly_latest[month_index] = ts
+
+    keep.update(weekly_latest.values())
+    keep.update(monthly_latest.values())
+    return keep
+
+# 报告保留与压缩整理
+class ReportRetention:
+    """报告保留任务：按策略清理旧报告，并把保留下来的按文件存放的历史报告压缩进 report/archive/<timestamp>.zip
+
+    每次运行在 report/.retention/runs.jsonl 中追加一条登记，整理时只读取登记而不扫描整个报告目录；
+    登记不存在时（首次启用）才会扫描一次现有目录建立登记；增量运行只包含部分客户的报告，
+    登记时带上标记，不会被选作周/月快照，超出完整保留期后直接删除
+    """
+
+    def __init__(self, report_dir, keep_days=30, keep_weeks=12, keep_months=24):
+        self.report_dir = report_dir
+        self.keep_days = keep_days
+        self.keep_weeks = keep_weeks
+        self.keep_months = keep_months
+        self.state_dir = os.path.join(report_dir, ".retention")
+        self.journal_file = os.path.join(self.state_dir, "runs.jsonl")
+        self.state_file = os.path.join(self.state_dir, "state.json")
+
+    @classmethod
+    def from_config(cls, config, report_dir):
+        return cls(
+            report_dir,
+            config.getint('retention', 'keep_days', fallback=30),
+            config.getint('retention', 'keep_weeks', fallback=12),
+            config.getint('retention', 'keep_months', fallback=24)
+        )
+
+    def record_run(self, timestamp, backend, items, delta=False):
+        """登记一次运行写入的报告（追加一行，开销与本次写入的报告数成正比）"""
+        if not os.path.exists(self.state_file):
+            # 尚未建立登记，留到整理时统一扫描
+            return
+        record = {'ts': timestamp, 'backend': backend, 'items': items}
+        if delta:
+            record['delta'] = True
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def invalidate(self):
+        """保留任务停用期间不再登记，删除登记以便再次启用时重新扫描"""
+        for path in (self.state_file, self.journal_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _bootstrap(self):
+        """首次整理：扫描一次现有报告目录建立登记"""
+        records = {}
+        for kind in ('by_fund', 'by_user'):
+            kind_dir = os.path.join(self.report_dir, kind)
+            if not os.path.isdir(kind_dir):
+                continue
+            for entry in os.scandir(kind_dir):
+                if not entry.is_dir():
+                    continue
+                # 基金目录名为 代码_名称，客户目录名为 用户名
+                key = entry.name.split('_', 1)[0] if kind == 'by_fund' else entry.name
+                for file_entry in os.scandir(entry.path):
+                    ts, ext = os.path.splitext(file_entry.name)
+                    if ext not in REPORT_FORMAT_EXTENSIONS.values() or not self._is_timestamp(ts):
+                        continue
+                    record = records.setdefault(('files', ts), {'ts': ts, 'backend': 'files', 'items': []})
+                    record['items'].append([kind, key, os.path.relpath(file_entry.path, self.report_dir)])
+
+        archive_dir = os.path.join(self.report_dir, "archive")
+        if os.path.isdir(archive_dir):
+            for name in os.listdir(archive_dir):
+                ts = name[:-len('.zip')]
+                if name.endswith('.zip') and self._is_timestamp(ts):
+                    records[('zip', ts)] = {'ts': ts, 'backend': 'zip', 'items': []}
+
+        db_path = report_database_path(self.report_dir)
+        if os.path.exists(db_path):
+            conn = sqlite3.connect(db_path)
+            try:
+                for (ts,) in conn.execute("SELECT DISTINCT run_ts FROM reports"):
+                    records[('sqlite', ts)] = {'ts': ts, 'backend': 'sqlite', 'items': []}
+            finally:
+                conn.close()
+
+        return list(records.values())
+
+    @staticmethod
+    def _is_timestamp(value):
+        try:
+            datetime.strptime(value, REPORT_TIMESTAMP_FORMAT)
+            return True
+        except ValueError:
+            return False
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return self._bootstrap(), []
+        journal = []
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                journal = [json.loads(line) for line in f if line.strip()]
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            snapshots = json.load(f).get('snapshots', [])
+        return journal, snapshots
+
+    def _save(self, journal, snapshots):
+        os.makedirs(self.state_dir, exist_ok=True)
+        atomic_write_text(
+            self.journal_file,
+            "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in journal)
+        )
+        atomic_write_text(self.state_file, json.dumps({'version': 1, 'snapshots': snapshots}, ensure_ascii=False))
+
+    def _remove_file(self, path, stats):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        stats['files_removed'] += 1
+        stats['bytes_freed'] += size
+        # 清理变空的报告目录
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+    def _delete(self, record, stats, conn_holder):
+        if record['backend'] == 'files':
+            for _, _, rel_path in record['items']:
+                self._remove_file(os.path.join(self.report_dir, rel_path), stats)
+        elif record['backend'] == 'zip':
+            self._remove_file(os.path.join(self.report_dir, "archive", f"{record['ts']}.zip"), stats)
+        elif record['backend'] == 'sqlite':
+            if 'conn' not in conn_holder:
+                conn_holder['conn'] = open_report_database(report_database_path(self.report_dir))
+            cursor = conn_holder['conn'].execute("DELETE FROM reports WHERE run_ts = ?", (record['ts'],))
+            stats['rows_removed'] += cursor.rowcount
+        stats['runs_deleted'] += 1
+
+    def _compact(self, record, stats):
+        """把按文件存放的一次运行压缩为 report/archive/<timestamp>.zip，返回整理后的登记"""
+        if record['backend'] != 'files':
+            return record
+        archive_dir = os.path.join(self.report_dir, "archive")
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_path = os.path.join(archive_dir, f"{record['ts']}.zip")
+        fd, tmp_path = make_temp_file(archive_dir, ".archive.", archive_path)
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                if os.path.exists(archive_path):
+                    # 同一时间戳已有归档时合并原有内容
+                    with zipfile.ZipFile(archive_path) as existing:
+                        for info in existing.infolist():
+                            zf.writestr(info, existing.read(info))
+                for kind, key, rel_path in record['items']:
+                    file_path = os.path.join(self.report_dir, rel_path)
+                    if os.path.exists(file_path):
+                        zf.write(file_path, zip_entry_name(kind, key, os.path.splitext(rel_path)[1]))
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        for _, _, rel_path in record['items']:
+            self._remove_file(os.path.join(self.report_dir, rel_path), stats)
+        stats['runs_compacted'] += 1
+        return {'ts': record['ts'], 'backend': 'zip', 'items': []}
+
+    def run(self, now=None):
+        """执行一次增量整理，返回统计信息"""
+        now = now or datetime.now()
+        stats = {
+            'runs_compacted': 0, 'runs_deleted': 0, 'files_removed': 0,
+            'rows_removed': 0, 'bytes_freed': 0, 'runs_pending': 0
+        }
+        journal, snapshots = self._load()
+        keep = select_retained_runs(
+            [record['ts'] for record in journal + snapshots if not record.get('delta')],
+            now, self.keep_days, self.keep_weeks, self.keep_months
+        )
+        detail_cutoff = (now - timedelta(days=self.keep_days)).strftime(REPORT_TIMESTAMP_FORMAT)
+
+        conn_holder = {}
+        pending = []
+        retained = []
+        try:
+            # 仍在完整保留期内的运行不做处理，留在登记中等待下次整理
+            for record in journal:
+                if record['ts'] >= detail_cutoff:
+                    pending.append(record)
+                elif record['ts'] in keep and not record.get('delta'):
+                    retained.append(self._compact(record, stats))
+                else:
+                    self._delete(record, stats, conn_holder)
+            # 已整理的快照随时间推移可能超出周/月保留窗口
+            for record in snapshots:
+                if record['ts'] in keep:
+                    retained.append(record)
+                else:
+                    self._delete(record, stats, conn_holder)
+            if 'conn' in conn_holder:
+                conn_holder['conn'].commit()
+                conn_holder['conn'].execute("PRAGMA incremental_vacuum")
+        finally:
+            if 'conn' in conn_holder:
+                conn_holder['conn'].close()
+            self._save(pending, retained)
+
+        stats['runs_pending'] = len(pending)
+        return stats
+
+# ========== 计算结果导出 ==========
+COLUMNAR_MAGIC = b"FRCOL1\n"
+
+# 列式导出的列定义：(列名, 类型)；str 列使用字典编码，日期列保存为 YYYYMMDD 整数（缺失为0），
+# 缺失的浮点数保存为 NaN
+EXPORT_COLUMNS = [
+    ('username', 'str'),
+    ('code', 'str'),
+    ('name', 'str'),
+    ('buy_date', 'date'),
+    ('buy_amount', 'f8'),
+    ('shares', 'f8'),
+    ('nav', 'f8'),
+    ('nav_date', 'date'),
+    ('nav_source', 'i1'),
+    ('current_value', 'f8'),
+    ('profit', 'f8'),
+    ('return_absolute', 'f8'),
+    ('return_annualized', 'f8'),
+    ('valid', 'i1'),
+]
+
+# 列类型对应的 array 类型码（str/date 列存储为 int32）
+COLUMN_TYPECODES = {'str': 'i', 'date': 'i', 'f8': 'd', 'i1': 'b'}
+
+def date_to_int(date_str):
+    """YYYY-MM-DD 转为 YYYYMMDD 整数，无法识别时返回 0"""
+    if len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-':
+        try:
+            return int(date_str[:4] + date_str[5:7] + date_str[8:])
+        except ValueError:
+            pass
+    return 0
+
+class ResultExporter:
+    """计算结果导出阶段：逐条持仓记录流式写入 JSON Lines，同时累积为带类型的列式二进制文件
+
+    文件写入 report/export/<timestamp>.jsonl 与 <timestamp>.frcol，均先写临时文件、完成后再重命名
+    """
+
+    def __init__(self, export_dir, timestamp, jsonl=True, columnar=True):
+        self.export_dir = export_dir
+        self.timestamp = timestamp
+        self.jsonl = jsonl
+        self.columnar = columnar
+        self.rows = 0
+        self.closed = False
+        self.jsonl_file = None
+        self.tmp_files = []
+
+        os.makedirs(export_dir, exist_ok=True)
+        if jsonl:
+            self.jsonl_path = os.path.join(export_dir, f"{timestamp}.jsonl")
+            fd, tmp_path = make_temp_file(export_dir, ".export.", self.jsonl_path)
+            self.tmp_files.append(tmp_path)
+            self.jsonl_file = os.fdopen(fd, 'w', encoding='utf-8', buffering=1024 * 1024)
+        if columnar:
+            self.columnar_path = os.path.join(export_dir, f"{timestamp}.frcol")
+            self.columns = {name: array(COLUMN_TYPECODES[col_type]) for name, col_type in EXPORT_COLUMNS}
+            self.dictionaries = {name: {} for name, col_type in EXPORT_COLUMNS if col_type == 'str'}
+
+    def add(self, record):
+        """追加一条持仓计算结果"""
+        self.rows += 1
+        if self.jsonl_file:
+            self.jsonl_file.write(json.dumps(record, ensure_ascii=False))
+            self.jsonl_file.write("\n")
+        if self.columnar:
+            for name, col_type in EXPORT_COLUMNS:
+                value = record[name]
+                if col_type == 'str':
+                    dictionary = self.dictionaries[name]
+                    value = dictionary.setdefault(value, len(dictionary))
+                elif col_type == 'date':
+                    value = date_to_int(value)
+                elif col_type == 'f8':
+                    value = NAN if value is None else value
+                else:
+                    value = int(value)
+                self.columns[name].append(value)
+
+    def _write_columnar(self):
+        """列式文件：魔数 + 4字节头部长度 + JSON头部（行数、列类型、偏移、字符串字典）+ 8字节对齐的小端列数据"""
+        header_columns = []
+        offset = 0
+        buffers = []
+        for name, col_type in EXPORT_COLUMNS:
+            column = self.columns[name]
+            if sys.byteorder != 'little':
+                column.byteswap()
+            data = column.tobytes()
+            padding = (-len(data)) % 8
+            entry = {'name': name, 'type': col_type, 'offset': offset, 'length': len(data)}
+            if col_type == 'str':
+                entry['dictionary'] = list(self.dictionaries[name])
+            header_columns.append(entry)
+            buffers.append(data + b"\0" * padding)
+            offset += len(data) + padding
+
+        header = json.dumps({
+            'version': 1,
+            'run_ts': self.timestamp,
+            'rows': self.rows,
+            'columns': header_columns
+        }, ensure_ascii=False).encode('utf-8')
+        # 数据区从8字节对齐的位置开始
+        prefix_len = len(COLUMNAR_MAGIC) + 4 + len(header)
+        header += b" " * ((-prefix_len) % 8)
+        return atomic_write_bytes(
+            self.columnar_path,
+            COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header + b"".join(buffers)
+        )
+
+    def close(self):
+        """完成导出，返回 {'rows', 'jsonl_bytes', 'columnar_bytes'}"""
+        stats = {'rows': self.rows, 'jsonl_bytes': 0, 'columnar_bytes': 0}
+        if self.jsonl_file:
+            self.jsonl_file.close()
+            os.replace(self.tmp_files[0], self.jsonl_path)
+            stats['jsonl_bytes'] = os.path.getsize(self.jsonl_path)
+        self.tmp_files = []
+        if self.columnar:
+            stats['columnar_bytes'] = self._write_columnar()
+        self.closed = True
+        return stats
+
+    def abort(self):
+        """运行中断时丢弃未完成的导出文件"""
+        if self.closed:
+            return
+        if self.jsonl_file:
+            self.jsonl_file.close()
+        for tmp_path in self.tmp_files:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        self.closed = True
+
+def read_columnar_export(file_path, columns=None, decode_strings=True):
+    """读取列式导出文件，返回 (头部信息, {列名: 数据})
+
+    数值列返回 array（日期列为 YYYYMMDD 整数），字符串列在 decode_strings 为真时返回字符串列表，
+    否则返回字典编码后的整数 array，对应的字典在头部信息中
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(COLUMNAR_MAGIC):
+        raise ValueError(f"不是有效的列式导出文件: {file_path}")
+    pos = len(COLUMNAR_MAGIC)
+    (header_len,) = struct.unpack_from('<I', data, pos)
+    pos += 4
+    header = json.loads(data[pos:pos + header_len].decode('utf-8'))
+    base = pos + header_len
+
+    result = {}
+    for column in header['columns']:
+        if columns is not None and column['name'] not in columns:
+            continue
+        values = array(COLUMN_TYPECODES[column['type']])
+        start = base + column['offset']
+        values.frombytes(data[start:start + column['length']])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        if column['type'] == 'str' and decode_strings:
+            dictionary = column['dictionary']
+            values = [dictionary[i] for i in values]
+        result[column['name']] = values
+    return header, result
+
+def format_retention_stats(stats):
+    return (
+        f"报告整理: 压缩{stats['runs_compacted']}次运行, 清理{stats['runs_deleted']}次运行"
+        f"({stats['files_removed']}个文件, {stats['rows_removed']}条记录), "
+        f"释放{stats['bytes_freed'] / 1024 / 1024:.2f}MB, {stats['runs_pending']}次运行仍在完整保留期内"
+    )
+
+# ========== 持仓数据校验 ==========
+USERNAME_PATTERN = re.compile(r'^[\u4e00-\u9fa5A-Za-z]{2,20}$')
+VALIDATION_LOG_SAMPLES = 20  # 日志中最多展示的无效行数
+
+# 无效行的错误类型（每行只记录第一个错误）
+VALIDATION_ERRORS = OrderedDict([
+    ('field_count', "字段数量不是5个"),
+    ('username', "用户名应为2-20个中文或英文字母"),
+    ('buy_date', "买入日期无效（应为YYYY-MM-DD）"),
+    ('amount', "买入金额不是数字"),
+    ('shares', "持仓份额不是数字"),
+])
+
+@lru_cache(maxsize=8192)
+def is_valid_date(date_str):
+    """日期格式校验；持仓文件中的买入日期大量重复，按值缓存后 strptime 只对不同日期执行一次"""
+    try:
+        datetime.strptime(date_str, '%Y-%m-%d')
+    except ValueError:
+        return False
+    return True
+
+def validate_fund_row(row, match_username=USERNAME_PATTERN.match):
+    """校验一行持仓数据，有效时返回 None，否则返回错误类型（见 VALIDATION_ERRORS）"""
+    if len(row) != 5:
+        return 'field_count'
+    username, code, buy_date, amount, shares = row
+    if match_username(username) is None:
+        return 'username'
+    if not is_valid_date(buy_date):
+        return 'buy_date'
+    try:
+        float(amount)
+    except ValueError:
+        return 'amount'
+    try:
+        float(shares)
+    except ValueError:
+        return 'shares'
+    return None
+
+class ValidationReport:
+    """持仓文件的校验结果：按错误类型计数，并保留全部无效行供导出"""
+    
+    def __init__(self):
+        self.valid_rows = 0
+        self.counts = OrderedDict()
+        self.errors = []  # [(行号, 错误类型, 原始行)]
+    
+    @property
+    def invalid_rows(self):
+        return len(self.errors)
+    
+    def add(self, line_num, error, row):
+        self.counts[error] = self.counts.get(error, 0) + 1
+        self.errors.append((line_num, error, row))
+    
+    def summary(self):
+        parts = [f"{VALIDATION_ERRORS[error]} {count}行" for error, count in self.counts.items()]
+        return f"跳过无效行 {self.invalid_rows} 行（有效 {self.valid_rows} 行）: " + "，".join(parts)
+    
+    def samples(self, limit=VALIDATION_LOG_SAMPLES):
+        for line_num, error, row in self.errors[:limit]:
+            yield f"第{line_num}行 [{VALIDATION_ERRORS[error]}]: {','.join(row)}"
+    
+    def to_csv(self):
+        """完整的无效行清单（行号, 错误类型, 错误说明, 原始内容）"""
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(['line', 'error', 'message', 'content'])
+        for line_num, error, row in self.errors:
+            writer.writerow([line_num, error, VALIDATION_ERRORS[error], ','.join(row)])
+        return buf.getvalue()
+
+# ========== 持仓收益计算与分片并行 ==========
+def calculate_return_values(buy_date_str, nav_date_str, profit, amount, is_valid=True):
+    """计算收益率数值（百分比），返回 (绝对收益率, 年化收益率)，无法计算时为 None"""
+    if not is_valid:
+        return (None, None)
+    
+    try:
+        buy_date = parse_report_date(buy_date_str)
+        nav_date = parse_report_date(nav_date_str)
+    except (ValueError, TypeError):
+        return (None, None)
+    
+    if nav_date < buy_date:
+        return (None, None)
+    
+    days = (nav_date - buy_date).days
+    if days <= 0 or amount == 0:
+        return (None, None)
+    
+    absolute_return = (profit / float(amount)) * 100
+    years = days / 365
+    return (absolute_return, absolute_return / years)
+
+def format_returns(absolute_return, annualized_return, is_valid=True):
+    """收益率数值转为报告文本"""
+    if not is_valid:
+        return ("未知", "未知")
+    if absolute_return is None:
+        return ("N/A", "N/A")
+    return (f"{absolute_return:+.2f}%", f"{annualized_return:+.2f}%")
+
+def compute_book(rows, fund_data, by_user=True, by_fund=True, flat=True):
+    """计算持仓收益
+
+    rows 为 [(用户名, 基金代码, 买入日期, 买入金额, 持仓份额)]，返回
+    (user_data 按用户的持仓, fund_holdings 按基金的持有情况, holdings 完整的逐条计算结果)；
+    分片任务只需要其中一部分时可用 by_user / by_fund / flat 跳过其余结构，跳过的返回 None
+    """
+    user_data = OrderedDict() if by_user else None  # 使用有序字典保持用户顺序
+    fund_holdings = defaultdict(list) if by_fund else None  # 按基金存储持有情况
+    holdings = [] if flat else None
+    for username, code, buy_date, amount, shares in rows:
+        fund_info = fund_data[code]
+        
+        # 计算收益
+        buy_amount = float(amount)
+        if fund_info.get('valid', True) and fund_info.get('nav_date'):
+            current_value = float(shares) * fund_info['nav']
+            profit = current_value - buy_amount
+            is_valid = True
+        else:
+            current_value = 0
+            profit = 0
+            is_valid = False
+        
+        abs_value, ann_value = calculate_return_values(
+            buy_date,
+            fund_info.get('nav_date', ''),
+            profit,
+            buy_amount,
+            is_valid
+        )
+        abs_return, ann_return = format_returns(abs_value, ann_value, is_valid)
+        
+        # 存储用户数据
+        if by_user:
+            if username not in user_data:
+                user_data[username] = {'funds': []}
+            user_data[username]['funds'].append({
+                'code': code,
+                'name': fund_info['name'],
+                'buy_date': buy_date,
+                'buy_amount': buy_amount,
+                'nav': fund_info['nav'],
+                'nav_date': fund_info.get('nav_date', ''),
+                'profit': profit,
+                'returns': {
+                    'absolute': abs_return,
+                    'annualized': ann_return
+                },
+                'valid': is_valid
+            })
+        
+        # 存储基金持有情况（用于生成基金报告）
+        if by_fund:
+            fund_holdings[code].append({
+                'username': username,
+                'buy_date': buy_date,
+                'buy_amount': buy_amount,
+                'shares': float(shares),
+                'nav': fund_info['nav'],
+                'nav_date': fund_info.get('nav_date', ''),
+                'profit': profit,
+                'returns_absolute': abs_return,
+                'returns_annualized': ann_return,
+                'valid': is_valid,
+                'fund_name': fund_info['name']  # 存储原始基金名称
+            })
+        
+        # 完整的持仓计算结果（用于导出）
+        if flat:
+            holdings.append({
+                'username': username,
+                'code': code,
+                'name': fund_info['name'],
+                'buy_date': buy_date,
+                'buy_amount': buy_amount,
+                'shares': float(shares),
+                'nav': fund_info['nav'],
+                'nav_date': fund_info.get('nav_date', ''),
+                'nav_source': fund_info.get('source', 0),
+                'current_value': current_value,
+                'profit': profit,
+                'return_absolute': abs_value,
+                'return_annualized': ann_value,
+                'valid': is_valid
+            })
+    return user_data, fund_holdings, holdings
+
+USER_EMOJIS = ['👤', '👥']  # 推送报告的用户标识符，按客户顺序交替使用
+
+def fund_display_name(fund_data, code):
+    return fund_data.get(code, {}).get('name', f"基金{code}")
+
+def compute_user_shard(rows, fund_data, user_index, options):
+    """进程池任务：计算一组客户的持仓并渲染其客户报告，返回可合并的结果
+
+    user_index 为 {用户名: 全局序号}（决定推送报告的标识符），options 见 ReportWorker.shard_options()
+    """
+    user_data, _, holdings = compute_book(rows, fund_data, by_fund=False, flat=options['export'])
+    result = {
+        'users': list(user_data),
+        'holding_count': len(rows),
+        'valid_count': sum(1 for data in user_data.values() for fund in data['funds'] if fund['valid']),
+        'performance': collect_performance_data(user_data, options['target_return']),
+    }
+    if options['user_files']:
+        renderer = ReportRenderer(options['file_format'])
+        result['user_files'] = [renderer.render_user_file(user, data) for user, data in user_data.items()]
+    if options.get('snapshots'):
+        result['snapshots'] = [user_position_snapshot(data, options['target_return']) for data in user_data.values()]
+    if options['user_push']:
+        renderer = ReportRenderer('text')
+        result['user_push'] = [
+            renderer.render_user_push(user, data, USER_EMOJIS[user_index[user] % len(USER_EMOJIS)])
+            for user, data in user_data.items()
+        ]
+    if options['export']:
+        result['holdings'] = holdings
+    return result
+
+def compute_fund_shard(rows, fund_data, options):
+    """进程池任务：计算一组基金的持有情况并渲染基金报告，返回 [(基金代码, 报告内容)]"""
+    _, fund_holdings, _ = compute_book(rows, fund_data, by_user=False, flat=False)
+    renderer = ReportRenderer(options['file_format'])
+    return [
+        (code, renderer.render_fund(code, fund_display_name(fund_data, code), holdings_list))
+        for code, holdings_list in fund_holdings.items()
+    ]
+
+def partition_keys(keys, weights, shard_count):
+    """按权重（持仓行数）把键贪心分配到 shard_count 个分片，分片内保持原有顺序"""
+    loads = [0] * shard_count
+    assignment = {}
+    for key in sorted(keys, key=lambda k: -weights[k]):
+        shard = loads.index(min(loads))
+        assignment[key] = shard
+        loads[shard] += weights[key]
+    shards = [[] for _ in range(shard_count)]
+    for key in keys:
+        shards[assignment[key]].append(key)
+    return [shard for shard in shards if shard]
+
+class ShardedBook:
+    """多进程分片计算的结果：客户与基金报告已在子进程中渲染完成"""
+    
+    def __init__(self, users, funds, performance, user_files, user_push, fund_files, holding_count, valid_count,
+                 holdings, user_snapshots=None):
+        self.users = users  # 客户顺序与单进程计算一致（首次出现的顺序）
+        self.funds = funds  # 基金代码顺序同上
+        self.performance = performance
+        self.user_files = user_files  # {用户名: 客户报告}
+        self.user_push = user_push  # {用户名: 推送报告}
+        self.fund_files = fund_files  # {基金代码: 基金报告}
+        self.holding_count = holding_count
+        self.valid_count = valid_count
+        self.holdings = holdings  # 仅在需要导出时按原始行顺序提供
+        self.user_snapshots = user_snapshots  # {用户名: 推送快照}，仅在按变化推送时提供
+
+def compute_sharded(rows, fund_data, options, processes, executor_factory=None, on_progress=None):
+    """把客户和基金分别分片，在进程池中并行计算和渲染，合并为 ShardedBook
+
+    客户分片渲染客户报告并收集达标基金，基金分片独立重算所持基金的收益并渲染基金报告，
+    两类任务同时提交，子进程之间不需要交换中间结果；on_progress(已完成分片数, 分片总数) 在每个分片合并后回调，
+    它抛出的异常会取消尚未开始的分片并向上传递
+    """
+    user_rows = OrderedDict()
+    fund_rows = OrderedDict()
+    for index, row in enumerate(rows):
+        user_rows.setdefault(row[0], []).append(index)
+        fund_rows.setdefault(row[1], []).append(index)
+    users = list(user_rows)
+    funds = list(fund_rows)
+    user_index = {user: idx for idx, user in enumerate(users)}
+    
+    # 每个进程分配多个分片，缓解分片间耗时不均
+    shard_count = processes * 2
+    user_shards = partition_keys(users, {u: len(v) for u, v in user_rows.items()}, shard_count)
+    fund_shards = partition_keys(funds, {c: len(v) for c, v in fund_rows.items()}, shard_count)
+    
+    def shard_rows(keys, groups):
+        indexes = sorted(i for key in keys for i in groups[key])
+        return indexes, [rows[i] for i in indexes]
+    
+    if executor_factory is None:
+        def executor_factory():
+            return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+    
+    executor = executor_factory()
+    try:
+        user_futures = []
+        for keys in user_shards:
+            indexes, subset = shard_rows(keys, user_rows)
+            codes = {row[1] for row in subset}
+            user_futures.append((indexes, executor.submit(
+                compute_user_shard, subset, {c: fund_data[c] for c in codes},
+                {u: user_index[u] for u in keys}, options
+            )))
+        fund_futures = []
+        for keys in fund_shards:
+            _, subset = shard_rows(keys, fund_rows)
+            fund_futures.append(executor.submit(
+                compute_fund_shard, subset, {c: fund_data[c] for c in keys}, options
+            ))
+        
+        shards_total = len(user_futures) + len(fund_futures)
+        shards_done = 0
+        if on_progress:
+            on_progress(0, shards_total)
+        
+        performance = {}
+        user_files = {}
+        user_push = {}
+        user_snapshots = {}
+        holding_count = valid_count = 0
+        holdings = [None] * len(rows) if options['export'] else None
+        for indexes, future in user_futures:
+            result = future.result()
+            shard_users = result['users']
+            performance.update(result['performance'])
+            if 'user_files' in result:
+                user_files.update(zip(shard_users, result['user_files']))
+            if 'user_push' in result:
+                user_push.update(zip(shard_users, result['user_push']))
+            if 'snapshots' in result:
+                user_snapshots.update(zip(shard_users, result['snapshots']))
+            holding_count += result['holding_count']
+            valid_count += result['valid_count']
+            if holdings is not None:
+                for index, holding in zip(indexes, result['holdings']):
+                    holdings[index] = holding
+            shards_done += 1
+            if on_progress:
+                on_progress(shards_done, shards_total)
+        fund_files = {}
+        for future in fund_futures:
+            fund_files.update(future.result())
+            shards_done += 1
+            if on_progress:
+                on_progress(shards_done, shards_total)
+    except BaseException:
+        # on_progress 抛出异常（如运行被取消）时不再等待尚未开始的分片
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+    
+    return ShardedBook(
+        users, funds, OrderedDict((user, performance[user]) for user in users if user in performance),
+        user_files, user_push, fund_files, holding_count, valid_count, holdings, user_snapshots
+    )
+
+# ========== 持仓变化推送 ==========
+def user_position_snapshot(data, target_return):
+    """客户持仓的推送快照：有效持仓的总收益、总收益率（%）和达到目标年化收益率的基金"""
+    profit = amount = 0.0
+    reached = {}
+    for fund in data['funds']:
+        if not fund.get('valid', True):
+            continue
+        profit += fund['profit']
+        amount += fund['buy_amount']
+        return_value = parse_return_value(fund['returns']['annualized'])
+        if return_value is not None and return_value >= target_return:
+            reached[fund['code']] = fund['name']
+    return {
+        'funds': len(data['funds']),
+        'profit': round(profit, 2),
+        'return': round(profit / amount * 100, 4) if amount else None,
+        'reached': reached,
+    }
+
+def position_changes(previous, current, min_profit, min_return):
+    """对比上次推送的快照，返回需要推送的变化说明（没有达到阈值的变化时为空列表）
+
+    总收益变化不小于 min_profit 元、总收益率变化不小于 min_return 个百分点、持仓数量变化，
+    或有基金新达到/跌破目标收益率时需要推送；没有上次的快照时视为需要推送
+    """
+    if previous is None:
+        return ["首次推送"]
+    changes = []
+    if current['funds'] != previous['funds']:
+        changes.append(f"持仓 {previous['funds']}只 → {current['funds']}只")
+    profit_change = current['profit'] - previous['profit']
+    if abs(profit_change) >= min_profit:
+        changes.append(f"持仓收益 {profit_change:+,.2f}")
+    if current['return'] is not None and previous['return'] is not None:
+        return_change = current['return'] - previous['return']
+        if abs(return_change) >= min_return:
+            changes.append(f"收益率 {return_change:+.2f}个百分点")
+    elif current['return'] != previous['return']:
+        changes.append("收益率可以计算" if current['return'] is not None else "收益率无法计算")
+    reached = [name for code, name in current['reached'].items() if code not in previous['reached']]
+    dropped = [name for code, name in previous['reached'].items() if code not in current['reached']]
+    if reached:
+        changes.append(f"新达到目标收益: {'、'.join(reached)}")
+    if dropped:
+        changes.append(f"跌破目标收益: {'、'.join(dropped)}")
+    return changes
+
+def render_position_delta(user, emoji, previous, current, changes):
+    """简短的持仓变化消息（代替完整的客户报告推送）"""
+    lines = [f"{emoji} {user} 持仓变化", ""]
+    lines.append(f"持仓收益: {current['profit']:+,.2f} (上次 {previous['profit']:+,.2f})")
+    if current['return'] is not None:
+        previous_return = f"{previous['return']:+.2f}%" if previous['return'] is not None else "N/A"
+        lines.append(f"收益率: {current['return']:+.2f}% (上次 {previous_return})")
+    lines.append("")
+    lines.extend(f"• {change}" for change in changes)
+    return "\n".join(lines)
+
+class PushSnapshotStore:
+    """每位客户最近一次推送成功时的持仓快照（JSON 文件），用于判断下次是否需要推送"""
+    
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.entries = {}
+        self.dirty = False
+    
+    def load(self):
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+        self.dirty = False
+        return self
+    
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+        atomic_write_text(self.file_path, json.dumps(self.entries, ensure_ascii=False, sort_keys=True))
+        self.dirty = False
+    
+    def get(self, user):
+        return self.entries.get(user)
+    
+    def record(self, user, snapshot):
+        if self.entries.get(user) != snapshot:
+            self.entries[user] = snapshot
+            self.dirty = True
+
+# ========== 推送消息分页 ==========
+# 分页按各渠道实际发送的字节数计算：Bark 以 JSON POST 发送（非 ASCII 字符原样按 UTF-8 发送），GET 模式下
+# 对内容做 URL 编码后放入请求地址，Gotify 以 JSON 发送（非 ASCII 字符转义为 \uXXXX），
+# 企业微信限制的是文本内容的 UTF-8 字节数。每行只编码为 UTF-8 一次，
+# 各种编码下的大小都由这份字节按权重表求得（URL 编码和 JSON 转义都可以逐字节计算）
+class WireCost:
+    """一种编码的逐字节权重表：UTF-8 字节 -> 该字节在编码结果中占用的字节数"""
+    
+    def __init__(self, weight):
+        self.table = bytes(weight(byte) for byte in range(256))
+        self.uniform = all(w == 1 for w in self.table)
+    
+    def size(self, data):
+        """UTF-8 字节串编码后的字节数"""
+        return len(data) if self.uniform else sum(data.translate(self.table))
+    
+    def measure(self, text):
+        return self.size(text.encode('utf-8'))
+
+URL_SAFE_BYTES = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_.-~")
+
+def json_byte_weight(byte, ensure_ascii=True):
+    """json.dumps 逐字节的开销：ASCII 按转义规则；ensure_ascii 时多字节字符计在首字节上（转义为一个或两个
+    \\uXXXX），否则按 UTF-8 原样输出
+    """
+    if byte < 0x80:
+        return len(json.dumps(chr(byte), ensure_ascii=ensure_ascii)) - 2
+    if not ensure_ascii:
+        return 1
+    if byte < 0xC0:
+        return 0
+    return 6 if byte < 0xF0 else 12
+
+WIRE_COSTS = {
+    'utf8': WireCost(lambda byte: 1),
+    'url': WireCost(lambda byte: 1 if byte in URL_SAFE_BYTES else 3),
+    'json': WireCost(json_byte_weight),
+    'json_utf8': WireCost(lambda byte: json_byte_weight(byte, ensure_ascii=False)),
+}
+
+BARK_METHODS = ('post', 'get')
+BARK_JSON_HEADERS = {'Content-Type': 'application/json; charset=utf-8'}
+
+def bark_payload(title, body, device_keys):
+    """Bark JSON 推送接口（POST /push）的请求体，多个设备 key 时为一次批量推送"""
+    payload = {"title": title, "body": body}
+    if len(device_keys) > 1:
+        payload["device_keys"] = list(device_keys)
+    else:
+        payload["device_key"] = device_keys[0]
+    return payload
+
+def bark_device_keys(text):
+    """解析逗号分隔的 Bark 设备 key"""
+    return [key.strip() for key in text.split(',') if key.strip()]
+
+# 分页预留的标题长度（页码按三位数计）
+PAGE_TITLE_RESERVE = "净值推送报告[999/999]"
+
+# 以这些前缀开头的行（以及空行）与上一行属于同一块：纯文本的 ├/└ 明细、Markdown 列表、HTML 列表
+BLOCK_CONTINUATIONS = ('├', '└', '│', '▔', '- ', '<ul', '<li', '</ul')
+BLOCK_BOUNDARY = re.compile(
+    r"\n(?!" + "|".join(map(re.escape, BLOCK_CONTINUATIONS)) + r"|[ \t]*(?:\n|$))"
+)
+
+def message_blocks(content):
+    """把报告内容切分为分页时不拆开的块（一只基金的标题行及其明细行为一块）"""
+    return BLOCK_BOUNDARY.split(content)
+
+def parse_channel_limits(text):
+    """解析"渠道=字节数"列表（逗号分隔），忽略无效项，返回 {渠道: 字节数}"""
+    limits = {}
+    for item in text.split(','):
+        channel, _, value = item.partition('=')
+        channel = channel.strip().lower()
+        if channel in PUSH_CHANNELS and value.strip().isdigit():
+            limits[channel] = int(value)
+    return limits
+
+def split_message(content, budgets):
+    """按字节预算把消息内容分页，返回分页列表
+
+    budgets 为 [(WireCost, 上限字节数)]，每页在每种编码下的字节数都不超过对应上限。内容按块编码、计算
+    一次大小，分页只拼接字符串，不再重新编码；单独一块超出一页时按行拆分，单独一行超出一页时按字符拆分
+    """
+    costs = [cost for cost, _ in budgets]
+    limits = [limit for _, limit in budgets]
+    newline = [cost.measure('\n') for cost in costs]
+    pages = []
+    page, used = [], [0] * len(costs)
+    
+    def measure(text):
+        data = text.encode('utf-8')
+        return [cost.size(data) for cost in costs]
+    
+    def fits(sizes):
+        if not page:
+            return all(size <= limit for size, limit in zip(sizes, limits))
+        return all(u + n + size <= limit for u, n, size, limit in zip(used, newline, sizes, limits))
+    
+    def add(text, sizes):
+        for i, size in enumerate(sizes):
+            used[i] += size + (newline[i] if page else 0)
+        page.append(text)
+    
+    def flush():
+        nonlocal page, used
+        if page:
+            pages.append('\n'.join(page))
+        page, used = [], [0] * len(costs)
+    
+    def place(text, sizes):
+        """放入当前页，放不下时换到新的一页；返回是否放得下"""
+        if not fits(sizes) and page:
+            flush()
+        if fits(sizes):
+            add(text, sizes)
+            return True
+        return False
+    
+    def add_long_line(line):
+        # 单独一行也放不下一页：按字符拆分到连续的几页
+        part, part_sizes = [], [0] * len(costs)
+        for char in line:
+            char_sizes = measure(char)
+            sizes = [part_size + char_size for part_size, char_size in zip(part_sizes, char_sizes)]
+            if part and not fits(sizes):
+                add(''.join(part), part_sizes)
+                flush()
+                part, sizes = [], char_sizes
+            part.append(char)
+            part_sizes = sizes
+        add(''.join(part), part_sizes)
+    
+    for block in message_blocks(content):
+        if place(block, measure(block)):
+            continue
+        for line in block.split('\n'):
+            line_sizes = measure(line)
+            if not place(line, line_sizes):
+                add_long_line(line)
+    flush()
+    return pages
+
+# ========== 推送路由 ==========
+PUSH_CHANNELS = ('bark', 'gotify', 'wecom')
+
+def load_push_routes(path):
+    """读取推送路由表（每行"用户名,渠道,目标"，# 开头为注释），返回 ({用户名: [(渠道, 目标)]}, 无效行列表)
+
+    目标为 Bark 设备 key、Gotify 应用 token 或企业微信成员 userid；同一客户可以有多行（推送给多个收件人）
+    """
+    routes = OrderedDict()
+    invalid = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for line_num, row in enumerate(csv.reader(f), 1):
+            if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+                continue
+            fields = [field.strip() for field in row]
+            if len(fields) != 3 or fields[1].lower() not in PUSH_CHANNELS or not fields[2]:
+                invalid.append(line_num)
+                continue
+            user, channel, target = fields
+            destination = (channel.lower(), target)
+            if destination not in routes.setdefault(user, []):
+                routes[user].append(destination)
+    return routes, invalid
+
+def group_routes(user_reports, routes, channels):
+    """按收件人分组客户报告，返回 ({(渠道, 目标): [客户报告...]}, 没有可用路由的客户报告)
+
+    只使用已启用渠道的路由；同一客户的多个企业微信收件人合并为一个目标（userid 以 | 连接），一次发送
+    """
+    enabled = {channel for channel, on in zip(PUSH_CHANNELS, channels) if on}
+    groups = OrderedDict()
+    unrouted = []
+    for report in user_reports:
+        destinations = [(channel, target) for channel, target in routes.get(report['user'], ()) if channel in enabled]
+        if not destinations:
+            unrouted.append(report)
+            continue
+        wecom_users = [target for channel, target in destinations if channel == 'wecom']
+        destinations = [d for d in destinations if d[0] != 'wecom']
+        if wecom_users:
+            destinations.append(('wecom', '|'.join(wecom_users)))
+        for destination in destinations:
+            groups.setdefault(destination, []).append(report)
+    return groups, unrouted
+
+def merge_bark_destinations(groups):
+    """把收到完全相同客户报告的多个 Bark 设备合并为一个目标（设备 key 以逗号连接），由一次批量请求发送"""
+    merged = OrderedDict()
+    devices = OrderedDict()
+    for (channel, target), reports in groups.items():
+        if channel == 'bark':
+            devices.setdefault(tuple(report['user'] for report in reports), (reports, []))[1].append(target)
+        else:
+            merged[(channel, target)] = reports
+    for reports, targets in devices.values():
+        merged[('bark', ','.join(targets))] = reports
+    return merged
+
+def batch_messages(items, budgets, separator="\n\n"):
+    """把 [(客户, 消息片段)] 按顺序合并为不超出字节预算的消息，返回 [(消息内容, 涉及的客户集合)]
+
+    budgets 与 split_message 相同，为 [(WireCost, 上限字节数)]
+    """
+    batches = []
+    parts, users, used = [], set(), [0] * len(budgets)
+    separator_sizes = [cost.measure(separator) for cost, _ in budgets]
+    for user, chunk in items:
+        data = chunk.encode('utf-8')
+        sizes = [cost.size(data) for cost, _ in budgets]
+        if parts and any(u + n + size > limit
+                         for u, n, size, (_, limit) in zip(used, separator_sizes, sizes, budgets)):
+            batches.append((separator.join(parts), users))
+            parts, users, used = [], set(), [0] * len(budgets)
+        used = [u + size + (n if parts else 0) for u, size, n in zip(used, sizes, separator_sizes)]
+        parts.append(chunk)
+        users.add(user)
+    if parts:
+        batches.append((separator.join(parts), users))
+    return batches
+
+# ========== 推送投递策略 ==========
+# fallback: 按 Bark、Gotify、企业微信的顺序逐个尝试，成功即停止；fanout: 同时发送到全部渠道；
+# race: 同时发送到全部渠道，第一个成功后取消其余渠道
+DELIVERY_POLICIES = ('fallback', 'fanout', 'race')
+
+class ChannelHealth:
+    """推送渠道在本次运行中的健康状态
+
+    推送前的探测失败，或运行中连续 down_after 次请求失败（不论属于哪条消息）的渠道判定为不可用：
+    其余消息不再等待该渠道的重试，直接跳过或暂存到重试队列；该渠道再次发送成功或探测恢复时重新启用
+    """
+    
+    def __init__(self, down_after=3):
+        self.down_after = max(1, down_after)
+        self.failures = defaultdict(int)  # 渠道 -> 连续失败的请求数
+        self.down = set()
+    
+    def record(self, channel, success):
+        """记录一次请求结果，渠道因此被判定为不可用时返回 True"""
+        if success:
+            self.reset(channel)
+            return False
+        self.failures[channel] += 1
+        if channel not in self.down and self.failures[channel] >= self.down_after:
+            self.down.add(channel)
+            return True
+        return False
+    
+    def mark_down(self, channel):
+        self.down.add(channel)
+    
+    def reset(self, channel):
+        self.failures[channel] = 0
+        self.down.discard(channel)
+    
+    def is_down(self, channel):
+        return channel in self.down
+
+# ========== 运行指标 ==========
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'stage_seconds': ('histogram', "各处理阶段耗时（秒）"),
+    'rows_total': ('counter', "持仓文件解析行数"),
+    'invalid_rows_total': ('counter', "按错误类型统计的无效行数"),
+    'fund_cache_total': ('counter', "基金净值查询缓存命中/未命中次数"),
+    'fund_metadata_total': ('counter', "按元数据缓存直接查询（fresh）/重新探测（probe）的基金数"),
+    'push_delivery_seconds': ('histogram', "按投递策略通过各渠道发送一条消息的总耗时（含重试，秒）"),
+    'push_delivery_total': ('counter', "按投递策略各渠道的投递结果（ok/failed/cancelled/skipped）"),
+    'push_probe_total': ('counter', "推送渠道探测结果（ok/failed）"),
+    'push_routed_messages_total': ('counter', "按路由合并后发送给各收件人的消息数"),
+    'push_diff_total': ('counter', "按变化推送时需要推送（changed）/无明显变化（unchanged）的客户数"),
+    'fund_nav_behind': ('gauge', "本次查询后净值仍落后于预期日期的基金数"),
+    'fund_type_lookup_total': ('counter', "单独查询基金类型的结果（ok/unknown/error）"),
+    'fund_nav_current_total': ('counter', "按交易日历已有预期最新净值（current）/需要查询（behind）的基金数"),
+    'fetch_conditional_total': ('counter', "净值接口条件请求结果（not_modified/unchanged/modified/miss）"),
+    'fetch_requests_total': ('counter', "净值接口请求次数"),
+    'fetch_seconds': ('histogram', "净值接口请求耗时（秒）"),
+    'fetch_bytes_total': ('counter', "净值接口响应字节数"),
+    'holdings_total': ('counter', "计算收益的持仓记录数"),
+    'render_seconds': ('histogram', "报告渲染耗时（秒）"),
+    'push_messages_total': ('counter', "推送消息条数"),
+    'push_retries_total': ('counter', "推送重试次数"),
+    'push_seconds': ('histogram', "推送请求耗时（秒）"),
+    'push_bytes_total': ('counter', "推送消息负载字节数"),
+    'report_files_total': ('counter', "写入的报告份数"),
+    'report_bytes_total': ('counter', "写入的报告字节数"),
+    'runs_total': ('counter', "报告任务运行次数"),
+    'last_run_timestamp_seconds': ('gauge', "最近一次运行结束时间（Unix时间戳）"),
+    'last_run_duration_seconds': ('gauge', "最近一次运行总耗时（秒）"),
+}
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsRegistry:
+    """线程安全的计数器/直方图/仪表盘指标集合
+
+    每个指标以 (名称, 排序后的标签) 为键；可合并到常驻进程的累计指标中，
+    并导出为 Prometheus 文本格式
+    """
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}  # 键 -> [各桶计数..., 总次数, 总和]
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+    
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+    
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [0] * (len(self.buckets) + 2) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            else:
+                hist[len(self.buckets)] += 1
+            hist[-2] += 1
+            hist[-1] += value
+    
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    
+    def merge(self, other):
+        """把另一份指标累加进来（仪表盘取对方的值）"""
+        with other._lock:
+            counters = dict(other.counters)
+            gauges = dict(other.gauges)
+            histograms = {key: list(hist) for key, hist in other.histograms.items()}
+        with self._lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self.gauges.update(gauges)
+            for key, hist in histograms.items():
+                mine = self.histograms.get(key)
+                if mine is None:
+                    self.histograms[key] = hist
+                else:
+                    self.histograms[key] = [a + b for a, b in zip(mine, hist)]
+    
+    def counter_total(self, name, **labels):
+        """按名称汇总计数器，labels 只匹配给定的标签"""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(
+                value for (metric, key_labels), value in self.counters.items()
+                if metric == name and wanted <= set(key_labels)
+            )
+    
+    def to_prometheus(self, prefix='fundreport_'):
+        """导出为 Prometheus 文本格式（exposition format 0.0.4）"""
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{escape_label_value(v)}"' for k, v in pairs) + "}"
+        
+        with self._lock:
+            series = defaultdict(list)
+            for (name, labels), value in self.counters.items():
+                series[name].append(('counter', labels, value))
+            for (name, labels), value in self.gauges.items():
+                series[name].append(('gauge', labels, value))
+            for (name, labels), hist in self.histograms.items():
+                series[name].append(('histogram', labels, list(hist)))
+        
+        lines = []
+        for name in sorted(series):
+            entries = series[name]
+            metric_type, help_text = METRIC_HELP.get(name, (entries[0][0], name))
+            full_name = prefix + name
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {entries[0][0]}")
+            for kind, labels, value in sorted(entries, key=lambda e: e[1]):
+                if kind != 'histogram':
+                    lines.append(f"{full_name}{fmt_labels(labels)} {value:g}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, value):
+                    cumulative += count
+                    lines.append(f"{full_name}_bucket{fmt_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{full_name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {value[-2]}")
+                lines.append(f"{full_name}_sum{fmt_labels(labels)} {value[-1]:.6f}")
+                lines.append(f"{full_name}_count{fmt_labels(labels)} {value[-2]}")
+        return "\n".join(lines) + "\n"
+    
+    def summary_lines(self):
+        """生成运行结束时打印的指标摘要"""
+        lines = []
+        rows_valid = self.counter_total('rows_total', result='valid')
+        rows_invalid = self.counter_total('rows_total', result='invalid')
+        lines.append(f"解析: 有效{rows_valid}行, 无效{rows_invalid}行")
+        
+        hits = self.counter_total('fund_cache_total', result='hit')
+        misses = self.counter_total('fund_cache_total', result='miss')
+        if hits + misses:
+            lines.append(f"净值查询: {misses}只基金, 重复代码复用{hits}次 (复用率{hits / (hits + misses):.0%})")
+        fresh = self.counter_total('fund_metadata_total', result='fresh')
+        probe = self.counter_total('fund_metadata_total', result='probe')
+        if fresh + probe:
+            lines.append(f"基金元数据: {fresh}只直接查询已知接口, {probe}只重新探测")
+        current = self.counter_total('fund_nav_current_total', result='current')
+        behind = self.counter_total('fund_nav_current_total', result='behind')
+        if current:
+            lines.append(f"交易日历: {current}只基金已有最新净值未查询, {behind}只需要查询")
+        conditional = {
+            result: self.counter_total('fetch_conditional_total', result=result)
+            for result in ('not_modified', 'unchanged', 'modified', 'miss')
+        }
+        changed = self.counter_total('push_diff_total', result='changed')
+        unchanged = self.counter_total('push_diff_total', result='unchanged')
+        if changed + unchanged:
+            lines.append(f"按变化推送: {changed}位客户需要推送, {unchanged}位无明显变化")
+        if any(conditional.values()):
+            lines.append(
+                f"条件请求: 未修改(304){conditional['not_modified']}次, 内容未变{conditional['unchanged']}次, "
+                f"已更新{conditional['modified']}次, 无缓存{conditional['miss']}次"
+            )
+        
+        with self._lock:
+            fetch = defaultdict(lambda: [0, 0.0])
+            push = defaultdict(lambda: [0, 0.0])
+            for (name, labels), hist in self.histograms.items():
+                label_map = dict(labels)
+                if name == 'fetch_seconds':
+                    target = fetch[label_map.get('source', '')]
+                elif name == 'push_seconds':
+                    target = push[label_map.get('channel', '')]
+                else:
+                    continue
+                target[0] += hist[-2]
+                target[1] += hist[-1]
+        for source, (count, total) in fetch.items():
+            ok = self.counter_total('fetch_requests_total', source=source, result='ok')
+            size = self.counter_total('fetch_bytes_total', source=source)
+            lines.append(
+                f"数据源 {source}: 请求{count}次, 成功{ok}次, 平均{total / count * 1000:.1f}ms, "
+                f"接收{size / 1024:.1f}KB"
+            )
+        for channel, (count, total) in push.items():
+            ok = self.counter_total('push_messages_total', channel=channel, result='ok')
+            failed = self.counter_total('push_messages_total', channel=channel, result='failed')
+            retries = self.counter_total('push_retries_total', channel=channel)
+            size = self.counter_total('push_bytes_total', channel=channel)
+            avg = total / count * 1000 if count else 0.0
+            lines.append(
+                f"推送 {channel}: 成功{ok}条, 失败{failed}条, 重试{retries}次, "
+                f"平均{avg:.1f}ms, 负载{size / 1024:.1f}KB"
+            )
+        
+        delivery = defaultdict(lambda: [0, 0.0])
+        with self._lock:
+            for (name, labels), hist in self.histograms.items():
+                label_map = dict(labels)
+                if name == 'push_delivery_seconds' and label_map.get('result') in ('ok', 'failed'):
+                    target = delivery[(label_map.get('policy', ''), label_map.get('channel', ''))]
+                    target[0] += hist[-2]
+                    target[1] += hist[-1]
+            policies = {policy for (metric, labels) in self.counters for key, policy in labels
+                        if metric == 'push_delivery_total' and key == 'policy'}
+        for policy in sorted(policies):
+            parts = []
+            for channel in PUSH_CHANNELS:
+                counts = {
+                    result: self.counter_total('push_delivery_total', policy=policy, channel=channel, result=result)
+                    for result in ('ok', 'failed', 'cancelled', 'skipped')
+                }
+                if not any(counts.values()):
+                    continue
+                count, total = delivery[(policy, channel)]
+                part = (f"{channel} 成功{counts['ok']}/失败{counts['failed']}/取消{counts['cancelled']}/"
+                        f"跳过{counts['skipped']}")
+                if count:
+                    part += f", 平均{total / count * 1000:.1f}ms"
+                parts.append(part)
+            lines.append(f"投递策略 {policy}: " + "; ".join(parts))
+        
+        files = self.counter_total('report_files_total')
+        if files:
+            size = self.counter_total('report_bytes_total')
+            lines.append(f"报告输出: {files}份, {size / 1024 / 1024:.2f}MB")
+        return lines
+
+def start_metrics_server(metrics, port, host='127.0.0.1'):
+    """在后台线程启动只读的 /metrics HTTP 端点，返回服务器对象（shutdown() 停止）"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_prometheus_file(metrics, file_path):
+    """以原子替换方式写出 Prometheus 文本文件（供 node_exporter textfile 收集器读取）"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    atomic_write_text(file_path, metrics.to_prometheus())
+
+# ========== 异步网络引擎 ==========
+class HttpError(Exception):
+    """HTTP 请求失败（连接错误、超时或错误状态码）"""
+
+class HttpResponse:
+    """HTTP 响应（接口与 requests.Response 的常用部分一致）"""
+    
+    def __init__(self, status_code, headers, content, url):
+        self.status_code = status_code
+        self.headers = headers  # 键为小写的响应头
+        self.content = content
+        self.body_bytes = len(content)  # 响应体（解压后）字节数；流式读取时 content 为空，只记录该值
+        self.url = url
+        match = re.search(r'charset=([\w-]+)', headers.get('content-type', ''), re.I)
+        self.encoding = match.group(1) if match else None
+    
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+    
+    def json(self):
+        return json.loads(self.text)
+    
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HttpError(f"HTTP状态码: {self.status_code} ({self.url})")
+
+def feed_consumer(response, consumer):
+    """把已完整读取的成功响应体按块交给流式消费者（与流式读取的结果一致）"""
+    if consumer is None or not 200 <= response.status_code < 300:
+        return response
+    content = response.content
+    for start in range(0, len(content), STREAM_CHUNK_SIZE):
+        if consumer.feed(content[start:start + STREAM_CHUNK_SIZE]):
+            break
+    else:
+        consumer.close()
+    response.content = b""
+    response.body_bytes = consumer.bytes_fed
+    return response
+
+def request_origin(url):
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    return scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80)
+
+def encode_request_body(json_data=None, data=None):
+    """编码请求体，返回 (字节, Content-Type)"""
+    if json_data is not None:
+        return json.dumps(json_data).encode('utf-8'), 'application/json'
+    if data is None:
+        return b"", None
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return data, 'application/x-www-form-urlencoded'
+
+class AsyncHttpClient:
+    """基于 httpx.AsyncClient 的异步 HTTP 客户端
+
+    在一个事件循环内并发执行全部净值查询和推送请求：全局并发数和单个主机并发数分别用信号量限制；
+    连接池（空闲超过 IDLE_TIMEOUT 秒的连接不再复用）、gzip、分块传输、TLS 和代理认证由 httpx 处理。
+    重定向由本类跟随（跳转到其他主机时不再携带调用方的请求头），系统代理（HTTP_PROXY/HTTPS_PROXY）
+    按请求选择。请求一旦发出就不会自动重发，推送等非幂等请求不会因连接被服务器关闭而重复发送
+    """
+    
+    MAX_REDIRECTS = 5
+    IDLE_TIMEOUT = 15
+    
+    def __init__(self, max_connections=32, max_per_host=8, timeout=10):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.proxies = getproxies()
+        self._global_limit = None
+        self._host_limits = {}
+        self._clients = {}  # (verify, 代理地址) -> httpx.AsyncClient
+    
+    def _limits(self, host):
+        # 信号量在事件循环中首次使用时创建
+        if self._global_limit is None:
+            self._global_limit = asyncio.Semaphore(self.max_connections)
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._global_limit, limit
+    
+    def _proxy_for(self, scheme, host):
+        """按系统代理设置选择代理地址，不使用代理时返回 None"""
+        proxy = self.proxies.get(scheme)
+        if not proxy or proxy_bypass(host):
+            return None
+        return proxy if '://' in proxy else f"http://{proxy}"
+    
+    def _client(self, verify, proxy):
+        # 每种 (证书校验, 代理) 组合共用一个连接池，在事件循环中首次使用时创建
+        client = self._clients.get((verify, proxy))
+        if client is None:
+            client = self._clients[(verify, proxy)] = httpx.AsyncClient(
+                verify=verify, proxy=proxy, trust_env=False, follow_redirects=False, timeout=None,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections,
+                                    keepalive_expiry=self.IDLE_TIMEOUT),
+            )
+        return client
+    
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+    
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+    
+    async def request(self, method, url, headers=None, json=None, data=None, timeout=None, verify=True,
+                      consumer=None):
+        """发送请求并返回 HttpResponse
+
+        consumer 不为空时成功响应的响应体不保存在 content 中，而是边读取边交给 consumer.feed(解压后的字节)：
+        feed 返回 True 表示不再需要剩余部分，此时停止读取并关闭该连接；读完时调用 consumer.close()。
+        consumer.bytes_fed 记录已处理的字节数
+        """
+        body, content_type = encode_request_body(json, data)
+        base_headers = {'User-Agent': 'FundReportSystem', 'Accept': '*/*', 'Accept-Encoding': 'gzip, deflate'}
+        if content_type:
+            base_headers['Content-Type'] = content_type
+        request_headers = dict(base_headers, **(headers or {}))
+        timeout = self.timeout if timeout is None else timeout
+        
+        for _ in range(self.MAX_REDIRECTS + 1):
+            host = urlsplit(url).hostname or ''
+            global_limit, host_limit = self._limits(host)
+            async with global_limit, host_limit:
+                try:
+                    response = await asyncio.wait_for(
+                        self._send(method, url, request_headers, body, verify, consumer), timeout
+                    )
+                except (asyncio.TimeoutError, httpx.TimeoutException):
+                    raise HttpError(f"请求超时({timeout}秒): {url}") from None
+                except httpx.ProxyError as e:
+                    raise HttpError(f"代理拒绝连接: {e} ({url})") from e
+                except (httpx.TransportError, OSError) as e:
+                    raise HttpError(f"连接失败: {e.__class__.__name__} {e} ({url})") from e
+            
+            location = response.headers.get('location')
+            if response.status_code not in (301, 302, 303, 307, 308) or not location:
+                return response
+            next_url = urljoin(url, location)
+            if request_origin(next_url) != request_origin(url):
+                # 跳转到其他主机：调用方的请求头（认证信息、Referer、条件请求头等）只属于原主机
+                request_headers = dict(base_headers)
+            url = next_url
+            if response.status_code in (301, 302, 303) and method != 'GET':
+                method, body = 'GET', b""
+                request_headers.pop('Content-Type', None)
+        raise HttpError(f"重定向次数过多: {url}")
+    
+    async def _send(self, method, url, headers, body, verify, consumer=None):
+        """完成一次请求（不跟随重定向）"""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise HttpError(f"不支持的协议: {url}")
+        client = self._client(verify, self._proxy_for(scheme, parts.hostname))
+        request = client.build_request(method, url, headers=headers, content=body or None)
+        response = await client.send(request, stream=True)
+        try:
+            if consumer is not None and 200 <= response.status_code < 300:
+                async for data in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                    if consumer.feed(data):
+                        break  # 剩余的响应体不再读取，关闭响应时连接随之丢弃
+                else:
+                    consumer.close()
+                content = b""
+            else:
+                content = await response.aread()
+        finally:
+            await response.aclose()
+        result = HttpResponse(response.status_code, {name: value for name, value in response.headers.items()},
+                              content, url)
+        if consumer is not None and 200 <= response.status_code < 300:
+            result.body_bytes = consumer.bytes_fed
+        return result
+    
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+class FakeHttpClient(AsyncHttpClient):
+    """测试用的进程内 HTTP 客户端替身
+
+    请求不经过网络，直接交给 handler(method, url, headers, body) 处理，handler 可以是普通函数或协程，
+    返回 HttpResponse 或 (状态码, 响应体, Content-Type)；并发限制与真实客户端一致
+    """
+    
+    def __init__(self, handler, max_connections=32, max_per_host=8, timeout=10):
+        super().__init__(max_connections, max_per_host, timeout)
+        self.handler = handler
+        self.requests = []  # 收到的请求 (方法, 地址)
+    
+    async def _send(self, method, url, headers, body, verify, consumer=None):
+        self.requests.append((method, url))
+        result = self.handler(method, url, headers, body)
+        if asyncio.iscoroutine(result):
+            result = await result
+        if not isinstance(result, HttpResponse):
+            status, content, content_type = result
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            result = HttpResponse(status, {'content-type': content_type}, content, url)
+        return feed_consumer(result, consumer)
+
+# ========== 交易日历 ==========
+def load_holidays(path):
+    """读取休市日文件（每行一个 YYYY-MM-DD，# 之后为注释），返回日期集合"""
+    holidays = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                holidays.add(datetime.strptime(line, "%Y-%m-%d").date())
+    return holidays
+
+def parse_clock_time(text):
+    """解析 HH:MM，返回 (时, 分)"""
+    hour, minute = (int(part) for part in text.strip().split(':'))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"无效的时间: {text}")
+    return hour, minute
+
+class TradingCalendar:
+    """本地交易日历：判断交易日，并推算当前应当能查到的最新净值日期
+
+    交易日为周一至周五中不在休市日文件里的日期；交易日 T 的净值在当天 publish_time 之后陆续公布，
+    此前最新净值为上一个交易日。QDII 等基金的净值晚公布 lag 个交易日
+    """
+    
+    def __init__(self, holidays=(), publish_time=(19, 0), clock=datetime.now):
+        self.holidays = set(holidays)
+        self.publish_time = publish_time
+        self.clock = clock
+        self.years = {day.year for day in self.holidays}  # 休市日数据覆盖的年份
+    
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+    
+    def previous_trading_day(self, day):
+        """day 之前（不含 day）最近的交易日"""
+        day -= timedelta(days=1)
+        while not self.is_trading_day(day):
+            day -= timedelta(days=1)
+        return day
+    
+    def covers(self, day):
+        """休市日数据是否包含 day 所在的年份（不包含时只能按周末判断）"""
+        return day.year in self.years
+    
+    def expected_nav_date(self, now=None, lag=0):
+        """当前时刻应当已经公布的最新净值日期（YYYY-MM-DD）"""
+        now = now or self.clock()
+        day = now.date()
+        if not (self.is_trading_day(day) and (now.hour, now.minute) >= self.publish_time):
+            day = self.previous_trading_day(day)
+        for _ in range(lag):
+            day = self.previous_trading_day(day)
+        return day.isoformat()
+
+def fund_nav_lag(fund_type, name=''):
+    """按基金类型推算净值公布的滞后交易日数（QDII 基金晚一个交易日）；类型未知时按名称中的"QDII"判断"""
+    return 1 if 'QDII' in f"{fund_type or ''} {name or ''}".upper() else 0
+
+# ========== 基金元数据与净值响应缓存 ==========
+CLOSED_FUND_SUFFIX = " [未开放]"  # 只能从 pingzhongdata 获取净值的基金名称后缀
+
+class FundMetadataStore:
+    """基金元数据（名称、类型、是否未开放、最近一次成功的净值接口）的长期缓存
+
+    基金名称等信息很少变化，保存在 JSON 文件中；记录在 refresh_days 天内有效，有效期内查询净值时
+    直接从最近一次成功的接口开始，跳过已知查不到该基金的接口；过期后按默认顺序重新探测并刷新记录。
+    同时保存每只基金最近一次查到的净值，已是预期最新日期的基金可以不再查询
+    """
+    
+    def __init__(self, file_path, refresh_days=7, clock=time.time):
+        self.file_path = file_path
+        self.max_age = refresh_days * 86400
+        self.clock = clock
+        self.entries = {}
+        self.dirty = False
+    
+    def load(self):
+        """读取缓存文件（不存在或损坏时从空缓存开始）"""
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+        self.dirty = False
+        return self
+    
+    def save(self):
+        """有变化时以原子替换方式写回缓存文件"""
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+        atomic_write_text(self.file_path, json.dumps(self.entries, ensure_ascii=False, sort_keys=True))
+        self.dirty = False
+    
+    def is_fresh(self, entry):
+        return entry is not None and 0 <= self.clock() - entry['updated'] <= self.max_age
+    
+    def preferred_source(self, code):
+        """有效期内最近一次成功的接口编号（1-3），没有有效记录时返回 None"""
+        entry = self.entries.get(code)
+        return entry['source'] if self.is_fresh(entry) else None
+    
+    def name(self, code):
+        """缓存中的基金名称（不论是否过期，不含"未开放"后缀），没有记录时返回 None"""
+        entry = self.entries.get(code)
+        return entry['name'] if entry else None
+    
+    def nav_lag(self, code):
+        """该基金净值公布的滞后交易日数（按缓存的基金类型和名称）"""
+        entry = self.entries.get(code)
+        return fund_nav_lag(entry.get('type'), entry.get('name')) if entry else 0
+    
+    def needs_type(self, code):
+        """已有记录但基金类型未知、也还没有单独查询过类型"""
+        entry = self.entries.get(code)
+        return entry is not None and not entry.get('type') and not entry.get('type_checked')
+    
+    def set_type(self, code, fund_type):
+        """记录单独查询到的基金类型（为空表示接口没有提供，之后不再查询）"""
+        entry = self.entries.get(code)
+        if entry is None:
+            return
+        entry['type'] = fund_type or entry.get('type', '')
+        entry['type_checked'] = True
+        self.dirty = True
+    
+    def latest_nav(self, code):
+        """最近一次查到的有效净值查询结果，没有时返回 None"""
+        entry = self.entries.get(code)
+        latest = entry.get('latest') if entry else None
+        return dict(latest) if latest and latest.get('valid') else None
+    
+    def current_nav(self, code, expected_date):
+        """最近一次查到的净值日期不早于 expected_date 时返回该次查询结果，否则返回 None"""
+        latest = self.latest_nav(code)
+        if latest and latest.get('nav_date', '') >= expected_date:
+            return latest
+        return None
+    
+    def record(self, code, info):
+        """根据一次成功的净值查询结果更新记录；接口或名称变化、记录过期时刷新更新时间"""
+        name = info['name']
+        closed = name.endswith(CLOSED_FUND_SUFFIX)
+        if closed:
+            name = name[:-len(CLOSED_FUND_SUFFIX)]
+        entry = self.entries.get(code)
+        latest = dict(info) if info.get('valid') else (entry or {}).get('latest')
+        fund_type = info.get('type') or (entry or {}).get('type', '')
+        if (self.is_fresh(entry) and entry['source'] == info['source'] and entry['name'] == name
+                and entry['closed'] == closed):
+            if entry.get('latest') != latest or entry.get('type', '') != fund_type:
+                entry['latest'] = latest
+                entry['type'] = fund_type
+                self.dirty = True
+            return
+        self.entries[code] = {
+            'name': name,
+            'type': fund_type,
+            'type_checked': (entry or {}).get('type_checked', False),
+            'closed': closed,
+            'source': info['source'],
+            'updated': self.clock(),
+            'latest': latest,
+        }
+        self.dirty = True
+
+class NavResponseCache:
+    """净值接口响应的验证信息与解析结果缓存（按接口和基金代码）
+
+    保存服务器返回的 ETag / Last-Modified 和响应体哈希，下次请求时发送 If-None-Match / If-Modified-Since：
+    服务器返回 304，或返回的内容与上次完全相同时，直接使用缓存的解析结果，不再解析响应体。
+    流式读取的响应 content 为空，由调用方传入消费者在读取过程中计算的 body_hash
+    """
+    
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.entries = {}  # 接口名 -> {基金代码: 记录}
+        self.dirty = False
+    
+    def load(self):
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+        self.dirty = False
+        return self
+    
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+        atomic_write_text(self.file_path, json.dumps(self.entries, ensure_ascii=False, sort_keys=True))
+        self.dirty = False
+    
+    def get(self, source, code):
+        return self.entries.get(source, {}).get(code)
+    
+    def request_headers(self, source, code):
+        """条件请求头（没有缓存记录或服务器未提供验证信息时为空）"""
+        entry = self.get(source, code)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def match(self, source, code, response, body_hash=None):
+        """响应对应缓存中的内容时返回缓存的解析结果：304，或响应体哈希与上次相同"""
+        entry = self.get(source, code)
+        if entry is None:
+            return None
+        if response.status_code == 304:
+            return dict(entry['info'])
+        if body_hash is None:
+            body_hash = content_hash(response.content) if response.content else ''
+        if response.status_code == 200 and body_hash and entry.get('hash') == body_hash:
+            return dict(entry['info'])
+        return None
+    
+    def store(self, source, code, response, info, body_hash=None):
+        """保存一次成功解析的响应的验证信息和解析结果"""
+        if body_hash is None:
+            body_hash = content_hash(response.content) if response.content else ''
+        self.entries.setdefault(source, {})[code] = {
+            'etag': response.headers.get('etag', ''),
+            'last_modified': response.headers.get('last-modified', ''),
+            'hash': body_hash,
+            'info': info,
+        }
+        self.dirty = True
+
+def content_hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+# ========== pingzhongdata 流式解析 ==========
+STREAM_CHUNK_SIZE = 64 * 1024  # 流式读取响应体的块大小
+
+class PingzhongdataExtractor:
+    """pingzhongdata/{code}.js 的流式解析器
+
+    响应体是一串 `var 名称 = 值;` 语句，逐块 feed() 时只提取需要的变量：字符串变量（基金名称、近一月收益率）
+    保存原值，净值走势数组默认只保留最后 keep_points 个点，history 为 True 时把全部点直接解码为
+    x（毫秒时间戳）/ y（净值）两个数值数组。内存只保留未处理完的尾部文本，与历史长短无关；
+    所需变量全部取到后 feed() 返回 True，调用方可以不再读取剩余的响应体。已读取的字节同时计入
+    SHA-1，hexdigest() 相同说明解析所用的内容相同，供条件请求缓存比较
+    """
+    
+    SCALARS = ('fS_name', 'syl_1y')
+    TREND = 'Data_netWorthTrend'
+    VAR_RE = re.compile(r'var\s+(\w+)\s*=\s*')
+    SCALAR_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|([^;"]*);')
+    POINT_RE = re.compile(r'\{[^{}]*\}')
+    TAIL_CHARS = 4096  # 只需要最后几个点时保留的走势文本尾部长度
+    
+    def __init__(self, keep_points=2, history=False, scalars=SCALARS):
+        self.keep_points = keep_points
+        self.history = history
+        self.wanted = set(scalars) | {self.TREND}
+        self.values = {}  # 字符串变量
+        self.points = deque(maxlen=keep_points)  # 最后几个净值点（解析后的字典）
+        self.history_x = array('q')
+        self.history_y = array('d')
+        self.point_count = 0
+        self.trend_found = False
+        self.bytes_fed = 0
+        self.done = False
+        self._hash = hashlib.sha1()
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._buffer = ""
+        self._variable = None  # 正在读取的变量
+        self._trend_tail = ""
+    
+    def feed(self, data):
+        """处理一块响应体，返回是否已取到全部所需变量"""
+        if self.done:
+            return True
+        self.bytes_fed += len(data)
+        self._hash.update(data)
+        self._buffer += self._decoder.decode(data)
+        self._parse()
+        return self.done
+    
+    def close(self):
+        """响应体读取完毕"""
+        if not self.done:
+            self._buffer += self._decoder.decode(b"", True)
+            self._parse()
+    
+    def hexdigest(self):
+        """已读取部分的 SHA-1（与 content_hash 算法相同），尚未读取任何内容时为空"""
+        return self._hash.hexdigest() if self.bytes_fed else ''
+    
+    def _parse(self):
+        buffer = self._buffer
+        pos = 0
+        while not self.done:
+            if self._variable is None:
+                match = self.VAR_RE.search(buffer, pos)
+                if not match or match.end() == len(buffer):
+                    # 保留末尾一小段，避免漏掉被分块截断的 var 语句
+                    pos = match.start() if match else max(pos, len(buffer) - 64)
+                    break
+                name = match.group(1)
+                pos = match.end()
+                if name in self.wanted:
+                    self._variable = name
+                    if name == self.TREND:
+                        if buffer[pos] != '[':
+                            self._variable = None
+                            continue
+                        pos += 1
+                        self.trend_found = True
+                        self._trend_tail = ""
+            elif self._variable == self.TREND:
+                pos = self._parse_trend(buffer, pos)
+                if self._variable is not None:
+                    break
+            else:
+                match = self.SCALAR_RE.match(buffer, pos)
+                if not match:
+                    break
+                if match.group(1) is not None:
+                    try:
+                        value = json.loads(f'"{match.group(1)}"')
+                    except ValueError:
+                        value = match.group(1)
+                else:
+                    value = match.group(2).strip()
+                self.values[self._variable] = value
+                self.wanted.discard(self._variable)
+                self._variable = None
+                pos = match.end()
+            if not self.wanted:
+                self.done = True
+        self._buffer = buffer[pos:]
+    
+    def _parse_trend(self, buffer, pos):
+        """处理走势数组中的一段文本，返回下一个未处理的位置；遇到数组结尾时结束该变量"""
+        end = buffer.find(']', pos)
+        stop = len(buffer) if end < 0 else end
+        if self.history:
+            # 完整的点直接解码进数值数组，被截断的点留到下一块
+            last = buffer.rfind('}', pos, stop)
+            if last >= 0:
+                self._add_history(buffer[pos:last + 1])
+                pos = last + 1
+            if end < 0:
+                return pos
+        else:
+            self.point_count += buffer.count('{', pos, stop)
+            self._trend_tail = (self._trend_tail + buffer[pos:stop])[-self.TAIL_CHARS:]
+            if end < 0:
+                return stop
+            for point in self.POINT_RE.findall(self._trend_tail)[-self.keep_points:]:
+                self.points.append(json.loads(point))
+            self._trend_tail = ""
+        self.wanted.discard(self.TREND)
+        self._variable = None
+        return end + 1
+    
+    def _add_history(self, text):
+        points = json.loads(f"[{text.strip().lstrip(',')}]")
+        for point in points:
+            y = point.get('y')
+            self.history_x.append(int(point['x']))
+            self.history_y.append(NAN if y is None else float(y))
+        self.point_count += len(points)
+        self.points.extend(points[-self.keep_points:])
+
+# ========== 性能分析 ==========
+PROFILE_TOP_N = 25
+
+class RunProfiler:
+    """单次报告运行的性能分析
+
+    cProfile 记录工作线程内的函数耗时，tracemalloc 在每个处理阶段结束时记录内存快照；
+    结束后写出 .prof（可用 pstats / snakeviz 查看）和热点函数、内存分配的文本摘要
+    """
+    
+    def __init__(self, output_dir, timestamp, top_n=PROFILE_TOP_N):
+        self.output_dir = output_dir
+        self.timestamp = timestamp
+        self.top_n = top_n
+        self.profile = None
+        self.stages = []
+        self._previous = None
+        self._started = 0.0
+    
+    def start(self):
+        tracemalloc.start()
+        self._previous = tracemalloc.take_snapshot()
+        self._started = time.perf_counter()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+    
+    def mark(self, stage, elapsed):
+        """阶段结束：记录内存占用并保存快照（快照对比留到 stop() 中进行，避免计入函数耗时）"""
+        current, peak = tracemalloc.get_traced_memory()
+        self.stages.append({
+            'stage': stage, 'elapsed': elapsed, 'current': current, 'peak': peak,
+            'snapshot': tracemalloc.take_snapshot()
+        })
+        tracemalloc.reset_peak()
+    
+    def stop(self):
+        """停止分析并写出结果，返回 (.prof 路径, 摘要路径)"""
+        self.profile.disable()
+        total = time.perf_counter() - self._started
+        final_snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        
+        # 各阶段相对上一阶段新增分配最多的代码行
+        previous = self._previous
+        for item in self.stages:
+            snapshot = item.pop('snapshot')
+            item['growth'] = [
+                stat for stat in snapshot.compare_to(previous, 'lineno')[:self.top_n] if stat.size_diff > 0
+            ]
+            previous = snapshot
+        self._previous = None
+        final_stats = final_snapshot.statistics('lineno')[:self.top_n]
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        prof_path = os.path.join(self.output_dir, f"{self.timestamp}.prof")
+        summary_path = os.path.join(self.output_dir, f"{self.timestamp}.txt")
+        self.profile.dump_stats(prof_path)
+        atomic_write_text(summary_path, self.render_summary(total, final_stats))
+        return prof_path, summary_path
+    
+    def hot_functions(self, sort_key='tottime', limit=None):
+        """按指定排序返回热点函数 [(位置, 调用次数, 自身耗时, 累计耗时)]"""
+        stats = pstats.Stats(self.profile)
+        stats.sort_stats(sort_key)
+        result = []
+        for func in stats.fcn_list:
+            cc, nc, tt, ct, callers = stats.stats[func]
+            file_name, line, name = func
+            if os.path.basename(file_name) == 'tracemalloc.py' or name.startswith("<built-in method _tracemalloc."):
+                continue  # 阶段快照本身的开销
+            location = f"{os.path.basename(file_name)}:{line}({name})" if line else name
+            result.append((location, nc, tt, ct))
+            if len(result) >= (limit or self.top_n):
+                break
+        return result
+    
+    def render_summary(self, total, final_stats):
+        lines = [f"报告运行性能分析 {self.timestamp}", f"总耗时: {total:.3f}秒", "", "== 阶段耗时与内存 =="]
+        for item in self.stages:
+            lines.append(
+                f"{item['stage']:<10} {item['elapsed']:>9.3f}秒  当前{item['current'] / 1024 / 1024:>8.2f}MB  "
+                f"峰值{item['peak'] / 1024 / 1024:>8.2f}MB"
+            )
+        
+        for title, sort_key in (("自身耗时", 'tottime'), ("累计耗时", 'cumulative')):
+            lines += ["", f"== 热点函数（按{title}，前{self.top_n}） ==",
+                      f"{'调用次数':>10} {'自身(秒)':>10} {'累计(秒)':>10}  函数"]
+            for location, calls, tottime, cumtime in self.hot_functions(sort_key):
+                lines.append(f"{calls:>10} {tottime:>10.3f} {cumtime:>10.3f}  {location}")
+        
+        for item in self.stages:
+            if not item['growth']:
+                continue
+            lines += ["", f"== 阶段 {item['stage']} 新增内存分配 =="]
+            for stat in item['growth'][:10]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"{stat.size_diff / 1024:>10.1f}KB {stat.count_diff:>+9}块  "
+                    f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                )
+        
+        lines += ["", f"== 运行结束时仍占用的内存（前{self.top_n}） =="]
+        for stat in final_stats:
+            frame = stat.traceback[0]
+            lines.append(
+                f"{stat.size / 1024:>10.1f}KB {stat.count:>9}块  {os.path.basename(frame.filename)}:{frame.lineno}"
+            )
+        return "\n".join(lines) + "\n"
+
+# ========== 运行进度 ==========
+# 上报进度的阶段及显示名称
+PROGRESS_STAGES = {
+    'fetch': "获取净值",
+    'compute': "计算收益",
+    'push': "推送报告",
+    'write': "写入报告",
+}
+PROGRESS_INTERVAL = 0.2  # 两次进度回调的最短间隔（秒）
+HEADLESS_PROGRESS_INTERVAL = 5.0  # 无界面模式打印进度行的间隔（秒）
+
+def format_duration(seconds):
+    """把秒数格式化为 m:ss 或 h:mm:ss"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def format_progress(progress):
+    """进度字典的单行描述，如：获取净值 120/500 (24%) 35.2项/秒 预计剩余 0:11"""
+    done, total = progress['done'], progress['total']
+    text = f"{progress['label']} {done}/{total}"
+    if total:
+        text += f" ({done * 100 // total}%)"
+    if progress['finished']:
+        return f"{text} 用时 {format_duration(progress['elapsed'])}"
+    if progress['rate'] > 0:
+        text += f" {progress['rate']:.1f}项/秒"
+    if progress['eta'] is not None:
+        text += f" 预计剩余 {format_duration(progress['eta'])}"
+    return text
+
+class ProgressTracker:
+    """记录当前阶段的完成数/总数，节流后通过 emit(进度字典) 回调输出
+
+    advance 可在任意线程调用，计数在锁内累加；距上次回调不足 interval 秒时只累加不回调，
+    阶段开始和结束时总会回调一次
+    """
+    
+    def __init__(self, emit, interval=PROGRESS_INTERVAL, clock=time.monotonic):
+        self.emit = emit
+        self.interval = interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.stage = None
+        self.total = 0
+        self.done = 0
+        self.started = 0.0
+        self.last_emit = 0.0
+    
+    def begin(self, stage, total):
+        """开始一个阶段，total 为该阶段的项目总数"""
+        with self._lock:
+            self.stage = stage
+            self.total = total
+            self.done = 0
+            self.started = self.clock()
+            self._emit(False)
+    
+    def advance(self, count=1):
+        """当前阶段又完成了 count 项"""
+        with self._lock:
+            self.done += count
+            if self.clock() - self.last_emit >= self.interval:
+                self._emit(False)
+    
+    def update(self, done, total=None):
+        """直接设置当前阶段的完成数（以及总数）"""
+        with self._lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+            if self.clock() - self.last_emit >= self.interval:
+                self._emit(False)
+    
+    def finish(self):
+        """结束当前阶段（完成数补齐为总数）"""
+        with self._lock:
+            if self.stage is None:
+                return
+            self.done = max(self.done, self.total)
+            self._emit(True)
+            self.stage = None
+    
+    def snapshot(self, finished=False):
+        elapsed = self.clock() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.done, 0)
+        return {
+            'stage': self.stage,
+            'label': PROGRESS_STAGES.get(self.stage, self.stage),
+            'done': self.done,
+            'total': self.total,
+            'elapsed': elapsed,
+            'rate': rate,
+            'eta': remaining / rate if rate > 0 and elapsed >= 1.0 else None,  # 刚开始时速度不稳定，不估算
+            'finished': finished,
+        }
+    
+    def _emit(self, finished):
+        self.last_emit = self.clock()
+        self.emit(self.snapshot(finished))
+
+# ========== 运行控制 ==========
+class RunCancelled(Exception):
+    """运行被用户取消"""
+
+class RunControl:
+    """运行的取消与暂停/继续（由界面线程或信号处理函数设置，工作线程在各阶段的项目之间检查）"""
+    POLL_INTERVAL = 0.1  # 事件循环中检查取消/暂停的间隔（秒）
+    
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()  # 未暂停时置位
+        self._running.set()
+    
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+    
+    @property
+    def paused(self):
+        return not self._running.is_set()
+    
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()  # 唤醒处于暂停中的等待
+    
+    def pause(self):
+        if not self.cancelled:
+            self._running.clear()
+    
+    def resume(self):
+        self._running.set()
+    
+    def checkpoint(self):
+        """暂停时阻塞直到继续；已取消时抛出 RunCancelled"""
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise RunCancelled()
+    
+    async def acheckpoint(self):
+        """checkpoint 的协程版本，暂停期间不阻塞事件循环"""
+        while not self._running.is_set():
+            await asyncio.sleep(self.POLL_INTERVAL)
+        if self._cancelled.is_set():
+            raise RunCancelled()
+    
+    def should_stop(self):
+        """供线程池任务使用：暂停时阻塞，返回是否已取消"""
+        self._running.wait()
+        return self._cancelled.is_set()
+
+def checkpointed(items, callback, every=4096):
+    """逐项产出 items，每产出 every 项调用一次 callback(已产出项数)
+
+    用于在长循环（读取持仓文件、计算收益）中检查取消/暂停，callback 抛出的异常会中止循环
+    """
+    iterator = iter(items)
+    done = 0
+    while True:
+        chunk = list(islice(iterator, every))
+        if not chunk:
+            return
+        if done:
+            callback(done)
+        yield from chunk
+        done += len(chunk)
+
+# 取消运行时记录已完成的部分，下次运行在有效期内直接复用
+RESUME_FILE_NAME = ".resume.json"
+
+def funds_file_signature(file_path):
+    """持仓文件的大小与修改时间，文件变化后不再复用上次取消时的进度"""
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+# ========== 日志输出 ==========
+# 日志级别对应的颜色与前缀
+LOG_LEVEL_STYLES = {
+    'error': ("#e74c3c", "[错误] "),    # 红色
+    'warning': ("#f39c12", "[警告] "),  # 黄色
+    'success': ("#27ae60", "[成功] "),  # 绿色
+}
+LOG_DEFAULT_STYLE = ("#2980b9", "[信息] ")  # 蓝色
+
+def log_level_style(level):
+    """返回日志级别的 (颜色, 前缀)"""
+    return LOG_LEVEL_STYLES.get(level, LOG_DEFAULT_STYLE)
+
+def create_file_logger(config, base_dir):
+    """按 [log] 配置创建滚动日志文件（单个文件超过 file_max_bytes 后轮换）；未配置文件路径时返回 None"""
+    log_file = config.get('log', 'file', fallback='logs/fundreport.log').strip()
+    if not log_file:
+        return None
+    if not os.path.isabs(log_file):
+        log_file = os.path.join(base_dir, log_file)
+    log_file = os.path.abspath(log_file)
+    
+    logger = logging.getLogger(f"fundreport.{log_file}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        handler = RotatingFileHandler(
+            log_file,
+            maxBytes=config.getint('log', 'file_max_bytes', fallback=5 * 1024 * 1024),
+            backupCount=config.getint('log', 'file_backups', fallback=5),
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+def format_file_log(timestamp, level, message):
+    """日志文件中的单行格式"""
+    return f"{timestamp:%Y-%m-%d %H:%M:%S} {log_level_style(level)[1]}{message}"
+
+# 界面日志缓冲：消息先进入队列，由定时器每隔 interval_ms 批量写入日志区，
+# 日志区最多保留 max_lines 行（超出后自动丢弃最早的行），完整日志写入滚动日志文件
+class LogSink(QObject):
+    def __init__(self, log_area, status_bar, max_lines=5000, interval_ms=100):
+        super().__init__(log_area)
+        self.log_area = log_area
+        self.status_bar = status_bar
+        self.max_lines = max(1, max_lines)
+        self.file_logger = None
+        self.pending = []
+        self.formats = {}
+        
+        # 文档块数上限即日志区的环形缓冲
+        self.log_area.document().setMaximumBlockCount(self.max_lines)
+        
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(max(0, interval_ms))
+        self.timer.timeout.connect(self.flush)
+    
+    def set_file_logger(self, file_logger):
+        """设置完整日志写入的文件 logger"""
+        self.file_logger = file_logger
+    
+    def write(self, message, level="info"):
+        """缓存一条日志（须在界面线程调用），等待定时器批量输出"""
+        self.pending.append((datetime.now(), level, message))
+        if not self.timer.isActive():
+            self.timer.start()
+    
+    def char_format(self, level):
+        """日志级别对应的文字格式"""
+        char_format = self.formats.get(level)
+        if char_format is None:
+            char_format = QTextCharFormat()
+            char_format.setForeground(QColor(log_level_style(level)[0]))
+            self.formats[level] = char_format
+        return char_format
+    
+    def flush(self):
+        """把缓存的日志一次性写入日志文件与日志区，并只滚动、更新状态栏一次"""
+        self.timer.stop()
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        
+        if self.file_logger:
+            for timestamp, level, message in batch:
+                self.file_logger.info(format_file_log(timestamp, level, message))
+        
+        # 日志区放不下的部分直接跳过，不再插入后被立即丢弃
+        skipped = 0
+        if len(batch) > self.max_lines:
+            skipped = len(batch) - self.max_lines + 1  # 留一行给省略提示
+            batch = batch[skipped:]
+        
+        document = self.log_area.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        first = document.isEmpty()
+        if skipped > 0:
+            if not first:
+                cursor.insertBlock()
+            cursor.insertText(f"…… 省略 {skipped} 条日志（完整内容见日志文件）", self.char_format('warning'))
+            first = False
+        for timestamp, level, message in batch:
+            if not first:
+                cursor.insertBlock()
+            first = False
+            cursor.insertText(
+                f"[{timestamp:%H:%M:%S}] {log_level_style(level)[1]}{message}", self.char_format(level)
+            )
+        cursor.endEditBlock()
+        
+        # 自动滚动到底部
+        self.log_area.moveCursor(QTextCursor.End)
+        
+        # 更新状态栏
+        self.status_bar.showMessage(f"最新状态: {batch[-1][2]}", 5000)
+
+# 报告工作线程
+class ReportWorker(QThread):
+    log_signal = pyqtSignal(str, str)  # 消息, 级别
+    progress_signal = pyqtSignal(object)  # 进度字典（见 ProgressTracker.snapshot）
+    finished = pyqtSignal()
+    
+    def __init__(self, config, base_dir, mobile_enabled, pc_enabled, by_fund, by_user, http_client_factory=None,
+                 delta=False):
+        super().__init__()
+        self.metrics = MetricsRegistry()  # 本次运行的指标
+        self.config = config
+        self.base_dir = base_dir
+        self.mobile_enabled = mobile_enabled
+        self.pc_enabled = pc_enabled
+        self.by_fund = by_fund
+        self.by_user = by_user
+        self.fund_data = {}  # 存储基金数据
+        self.config_dir = os.path.join(base_dir, "config")
+        self.funds_file = os.path.join(self.config_dir, "funds.txt")
+        self.report_dir = os.path.join(base_dir, "report")
+        self.target_return = config.getfloat('advanced', 'target_return', fallback=5.0)
+        self.max_message_bytes = config.getint('advanced', 'max_message_bytes', fallback=2048)
+        # 各渠道单次请求的字节上限：Bark 为请求地址长度，Gotify 为请求体大小，企业微信为文本内容字节数
+        self.channel_max_bytes = parse_channel_limits(
+            config.get('push', 'channel_max_bytes', fallback=DEFAULT_CONFIG['push']['channel_max_bytes'])
+        )
+        # Bark 默认使用 JSON POST 接口（内容不做 URL 编码）；多个设备 key 时可一次请求批量推送
+        self.bark_method = config.get('push', 'bark_method', fallback='post').strip().lower()
+        if self.bark_method not in BARK_METHODS:
+            self.bark_method = 'post'
+        self.bark_batch = self.bark_method == 'post' and config.getboolean('push', 'bark_batch', fallback=True)
+        self.max_retries = config.getint('advanced', 'max_retries', fallback=3)
+        self.retry_delay = config.getint('advanced', 'retry_delay', fallback=5)
+        self.write_workers = config.getint('output', 'write_workers', fallback=8)
+        self.write_fsync = config.getboolean('output', 'fsync', fallback=False)
+        self.output_backend = config.get('output', 'backend', fallback='files')
+        self.export_jsonl = config.getboolean('output', 'export_jsonl', fallback=False)
+        self.export_columnar = config.getboolean('output', 'export_columnar', fallback=False)
+        # 基金净值接口地址（可指向本地替身服务器进行测试）
+        self.fundgz_url = config.get('sources', 'fundgz_url', fallback='http://fundgz.1234567.com.cn').rstrip('/')
+        self.esongfund_url = config.get('sources', 'esongfund_url', fallback='https://j4.esongfund.com').rstrip('/')
+        self.pingzhongdata_url = config.get('sources', 'pingzhongdata_url', fallback='https://fund.eastmoney.com').rstrip('/')
+        self.send_interval = config.getfloat('push', 'send_interval', fallback=0.5)
+        # 按变化推送：只推送持仓收益/收益率变化达到阈值或跨越目标收益率的客户，快照保存在本地
+        self.change_only = config.getboolean('push', 'change_only', fallback=False)
+        self.min_profit_change = config.getfloat('push', 'min_profit_change', fallback=100)
+        self.min_return_change = config.getfloat('push', 'min_return_change', fallback=0.5)
+        self.delta_message = config.getboolean('push', 'delta_message', fallback=False)
+        # 推送路由表：按客户推送给指定的收件人，没有路由的客户仍推送到全局配置的目标
+        self.routes_file = config.get('push', 'routes_file', fallback='config/routes.txt').strip()
+        self.routes = {}  # {用户名: [(渠道, 目标)]}，推送前读取
+        # 投递策略（见 DELIVERY_POLICIES）与渠道健康状态：已判定不可用的渠道不再逐条消耗重试
+        self.delivery_policy = config.get('push', 'delivery', fallback='fallback').strip().lower()
+        if self.delivery_policy not in DELIVERY_POLICIES:
+            self.delivery_policy = 'fallback'
+        self.channel_health = ChannelHealth(config.getint('push', 'channel_down_after', fallback=3))
+        # 推送前用短超时探测各渠道；渠道不可用期间的消息暂存到重试队列，等待后重新探测，恢复时补发
+        self.probe_enabled = config.getboolean('push', 'probe', fallback=True)
+        self.probe_timeout = config.getfloat('push', 'probe_timeout', fallback=3)
+        self.retry_queue_wait = config.getfloat('push', 'retry_queue_wait', fallback=30)
+        self.retry_queue_rounds = config.getint('push', 'retry_queue_rounds', fallback=3)
+        self.retry_queue = []  # [(补发协程函数, 放弃时的回调)]
+        self.push_snapshots = PushSnapshotStore(os.path.join(base_dir, "cache", "push_snapshots.json"))
+        self.position_snapshots = None  # 本次计算的推送快照 {用户名: 快照}
+        self.position_changes = None  # 需要推送的客户 {用户名: 变化说明}
+        # 网络请求在工作线程内的同一个事件循环中并发执行
+        self.max_connections = config.getint('network', 'max_connections', fallback=32)
+        self.max_per_host = config.getint('network', 'max_per_host', fallback=8)
+        self.request_timeout = config.getfloat('network', 'timeout', fallback=10)
+        self.http_client_factory = http_client_factory or self.create_http_client
+        # 基金名称、状态和最近成功的接口长期缓存，有效期内直接查询已知可用的接口
+        self.fund_metadata = FundMetadataStore(
+            os.path.join(base_dir, "cache", "fund_meta.json"),
+            config.getfloat('cache', 'metadata_refresh_days', fallback=7)
+        )
+        # 净值接口响应的 ETag / Last-Modified / 内容哈希，未变化时直接使用上次的解析结果
+        self.conditional_requests = config.getboolean('cache', 'conditional_requests', fallback=True)
+        self.nav_cache = NavResponseCache(os.path.join(base_dir, "cache", "nav_responses.json"))
+        # 交易日历：推算每只基金应有的最新净值日期，已是最新的基金不再查询
+        self.calendar = TradingCalendar()  # 获取净值前按配置读取休市日
+        self.skip_current_navs = config.getboolean('calendar', 'skip_current', fallback=True)
+        self.loop = None
+        self.http = None
+        # 大持仓文件的计算与渲染分片到多个进程（processes 为 0 时使用全部 CPU 核心）
+        self.compute_processes = config.getint('compute', 'processes', fallback=1) or os.cpu_count() or 1
+        self.shard_min_rows = config.getint('compute', 'shard_min_rows', fallback=20000)
+        self.stage_timings = OrderedDict()  # 各阶段耗时（秒）
+        self.progress = ProgressTracker(self.progress_signal.emit)
+        self.control = RunControl()  # 取消与暂停/继续
+        # 取消运行时记录已完成的部分（已获取的净值、已推送的客户），下次运行在有效期内复用
+        self.resume_enabled = config.getboolean('resume', 'enabled', fallback=True)
+        self.resume_max_age = config.getfloat('resume', 'max_age_minutes', fallback=60) * 60
+        self.resume_path = os.path.join(self.report_dir, RESUME_FILE_NAME)
+        self.pushed_users = set()
+        self.summary_pushed = False
+        # 增量模式：只查询净值落后于预期日期的基金，只重新计算、推送持有净值有更新基金的客户
+        # （不推送业绩总结，不写按基金分类的报告，也不读写运行进度）
+        self.delta = delta
+        if delta:
+            self.resume_enabled = False
+            self.summary_pushed = True
+        self.expected_navs = {}  # 本次查询的基金代码 -> (预期净值日期, 查询前缓存的净值)
+        self.nav_checked_at = None  # 推算预期净值日期的时刻
+        self.updated_codes = set()  # 本次查询后净值有更新的基金
+        self.behind_codes = []  # 本次查询后净值仍落后于预期日期的基金
+        self.profile_enabled = config.getboolean('advanced', 'profile', fallback=False)
+        self.profiler = None  # 仅在性能分析模式下运行期间存在
+        self.validation_report = None  # 最近一次读取持仓文件的校验结果
+        self.push_renderer = ReportRenderer('text')  # 推送消息始终使用纯文本
+        self.config_warnings = []  # 配置项取值无效时改用默认值的提示，运行开始时写入日志
+        report_format = config.get('output', 'format', fallback='text').strip().lower()
+        if report_format not in REPORT_TEMPLATES:
+            self.config_warnings.append(f"未知的报告格式 {report_format}（可选 {'/'.join(REPORT_TEMPLATES)}），已改用 text")
+            report_format = 'text'
+        self.file_renderer = ReportRenderer(report_format)
+    
+    @contextmanager
+    def stage(self, name):
+        """记录一个处理阶段的耗时（同名阶段累加）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_timings[name] = self.stage_timings.get(name, 0.0) + elapsed
+            self.metrics.observe('stage_seconds', elapsed, stage=name)
+            if self.profiler is not None:
+                self.profiler.mark(name, elapsed)
+    
+    def get_number_emoji(self, number):
+        """数字转序号emoji"""
+        return get_number_emoji(number)
+    
+    def message_budgets(self, channels, destination=None):
+        """消息分页的字节预算：每个会用到的渠道（destination 为路由收件人时只有该渠道）加上标题、地址等
+        固定部分后不超过该渠道的字节上限；内容同时不超过 max_message_bytes 个 UTF-8 字节，
+        但会用到的渠道都以请求体（POST）发送且设置了字节上限时，以各渠道的上限为准
+        """
+        get = lambda key: self.config.get('advanced', key, fallback='')
+        title = PAGE_TITLE_RESERVE
+        if destination is not None:
+            targets = {destination[0]: destination[1]}
+        else:
+            targets = {channel: None for channel, on in zip(PUSH_CHANNELS, channels) if on}
+        budgets = []
+        generic_cap = not targets
+        for channel, target in targets.items():
+            limit = self.channel_max_bytes.get(channel)
+            if not limit or (channel == 'bark' and self.bark_method != 'post'):
+                generic_cap = True  # 没有单独上限或内容放在请求地址中（Bark GET）的渠道仍受通用上限约束
+            if not limit:
+                continue
+            if channel == 'bark':
+                # 不批量推送时逐个设备发送，按最长的设备 key 计算
+                device_keys = bark_device_keys(target or get('bark_token')) or ['']
+                if not self.bark_batch:
+                    device_keys = [max(device_keys, key=len)]
+                if self.bark_method == 'post':
+                    envelope = json.dumps(bark_payload(title, "", device_keys), ensure_ascii=False)
+                    budgets.append((WIRE_COSTS['json_utf8'], limit - WIRE_COSTS['utf8'].measure(envelope)))
+                else:
+                    envelope = f"{get('bark_url')}/{device_keys[0]}?title={quote(title, safe='')}&body="
+                    budgets.append((WIRE_COSTS['url'], limit - len(envelope)))
+            elif channel == 'gotify':
+                envelope = json.dumps({"title": title, "message": "", "priority": 5})
+                budgets.append((WIRE_COSTS['json'], limit - len(envelope)))
+            else:
+                budgets.append((WIRE_COSTS['utf8'], limit - WIRE_COSTS['utf8'].measure(f"{title}\n\n")))
+        if generic_cap:
+            budgets.insert(0, (WIRE_COSTS['utf8'], self.max_message_bytes))
+        return budgets
+    
+    def split_long_content(self, content, channels=()):
+        """按会用到的渠道的实际发送字节数分页，基金明细块尽量不跨页"""
+        return split_message(content, self.message_budgets(channels))
+    
+    def use_sharding(self, row_count):
+        return self.compute_processes > 1 and row_count >= self.shard_min_rows
+    
+    def shard_options(self, export):
+        """分片任务需要的设置（传给子进程，只包含可序列化的简单值）"""
+        return {
+            'target_return': self.target_return,
+            'file_format': self.file_renderer.fmt,
+            'user_files': self.pc_enabled and self.by_user,
+            'user_push': self.mobile_enabled,
+            'snapshots': self.mobile_enabled and self.change_only,
+            'export': export,
+        }
+    
+    def create_http_client(self):
+        return AsyncHttpClient(self.max_connections, self.max_per_host, self.request_timeout)
+    
+    def run_async(self, coro):
+        """在本线程的事件循环中执行协程（首次调用时创建事件循环和 HTTP 客户端）"""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.http = self.http_client_factory()
+        return self.loop.run_until_complete(self._run_cancellable(coro))
+    
+    async def _run_cancellable(self, coro):
+        """执行协程；运行被取消时立即中止其中所有等待（网络请求、重试间隔、发送间隔）并抛出 RunCancelled"""
+        task = asyncio.ensure_future(coro)
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=RunControl.POLL_INTERVAL)
+            if done and not self.control.cancelled:
+                return task.result()
+            if self.control.cancelled:
+                # 取消本次调用产生的全部任务（gather 中某个任务先抛出 RunCancelled 时其余任务仍在运行）
+                pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+                for t in pending:
+                    t.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    return task.result()
+                raise RunCancelled()
+    
+    def close_network(self):
+        if self.loop is None:
+            return
+        try:
+            self.loop.run_until_complete(self.http.close())
+        finally:
+            self.loop.close()
+            self.loop = None
+            self.http = None
+    
+    def load_calendar(self):
+        """按配置读取休市日文件；文件缺失或无效时只按周末判断交易日"""
+        holidays = ()
+        holidays_file = self.config.get('calendar', 'holidays_file', fallback='config/holidays.txt').strip()
+        if holidays_file:
+            if not os.path.isabs(holidays_file):
+                holidays_file = os.path.join(self.base_dir, holidays_file)
+            try:
+                holidays = load_holidays(holidays_file)
+            except (OSError, ValueError) as e:
+                self.log_signal.emit(f"读取休市日文件失败，仅按周末判断交易日: {str(e)}", "warning")
+        try:
+            publish_time = parse_clock_time(self.config.get('calendar', 'nav_publish_time', fallback='19:00'))
+        except ValueError:
+            publish_time = (19, 0)
+        return TradingCalendar(holidays, publish_time)
+    
+    def reuse_current_navs(self, codes):
+        """已缓存预期最新净值的基金直接使用缓存结果，返回仍需查询的基金代码"""
+        now = self.nav_checked_at = self.calendar.clock()
+        if codes and not self.calendar.covers(now.date()):
+            self.log_signal.emit(f"休市日文件不包含{now.year}年，仅按周末推算最新净值日期", "warning")
+        pending = []
+        for code in codes:
+            expected = self.calendar.expected_nav_date(now, self.fund_metadata.nav_lag(code))
+            previous = self.fund_metadata.latest_nav(code)
+            if self.skip_current_navs and previous and previous['nav_date'] >= expected:
+                self.fund_data[code] = previous
+                continue
+            self.expected_navs[code] = (expected, previous)
+            pending.append(code)
+        current = len(codes) - len(pending)
+        self.metrics.inc('fund_nav_current_total', current, result='current')
+        self.metrics.inc('fund_nav_current_total', len(pending), result='behind')
+        if current:
+            self.log_signal.emit(
+                f"{current}只基金已有预期最新净值（{self.calendar.expected_nav_date(now)}），"
+                f"仅查询其余{len(pending)}只", "info"
+            )
+        return pending
+    
+    def track_nav_updates(self, codes):
+        """对比查询前缓存的净值，记录净值有更新的基金和仍落后于预期日期的基金
+
+        本次查询才得知基金类型（如 QDII）时按新的滞后天数重新推算预期日期；增量模式下所有接口都查询失败的基金
+        沿用查询前缓存的净值，视为未更新并留待下次查询
+        """
+        self.updated_codes = set()
+        self.behind_codes = []
+        fallback = 0
+        for code in codes:
+            expected, previous = self.expected_navs[code]
+            lag = self.fund_metadata.nav_lag(code)
+            expected = min(expected, self.calendar.expected_nav_date(self.nav_checked_at, lag))
+            info = self.fund_data.get(code)
+            if not info or not info.get('valid'):
+                if self.delta and previous and previous.get('valid'):
+                    self.fund_data[code] = previous
+                    fallback += 1
+                self.behind_codes.append(code)
+                continue
+            if info['nav_date'] < expected:
+                self.behind_codes.append(code)
+            if previous is None or (info['nav_date'], info['nav']) != (previous['nav_date'], previous['nav']):
+                self.updated_codes.add(code)
+        self.metrics.set('fund_nav_behind', len(self.behind_codes))
+        if fallback:
+            self.log_signal.emit(f"{fallback}只基金查询失败，沿用上次查询的净值", "warning")
+    
+    def delta_rows(self, rows):
+        """增量模式下需要重新计算的持仓：持有净值有更新基金的客户的全部持仓"""
+        users = {row[0] for row in rows if row[1] in self.updated_codes}
+        return [row for row in rows if row[0] in users]
+    
+    async def lookup_fund_types(self, codes):
+        """基金类型决定净值公布的滞后天数，但只有 esongfund 接口提供：对通过其他接口查到、类型未知的基金
+        单独查询一次类型并保存到元数据缓存
+        """
+        codes = [code for code in codes if self.fund_metadata.needs_type(code)]
+        
+        async def lookup(code):
+            url = f"{self.esongfund_url}/eap/api/fund/public/portal/fundDetail/getFundBaseInfo?fundCode={code}"
+            try:
+                response = await self.http.get(url, headers={'Referer': 'http://fundf10.eastmoney.com/'})
+                response.raise_for_status()
+                data = response.json()
+            except Exception:
+                self.metrics.inc('fund_type_lookup_total', result='error')
+                return  # 下次运行再查询
+            fund_type = (data.get('data') or {}).get('fundType', '') if data.get('code') == 200 else ''
+            self.fund_metadata.set_type(code, fund_type)
+            self.metrics.inc('fund_type_lookup_total', result='ok' if fund_type else 'unknown')
+        
+        await asyncio.gather(*(lookup(code) for code in codes))
+    
+    async def fetch_funds(self, codes):
+        """并发查询多只基金，结果逐只存入 self.fund_data（运行被取消时保留已完成的部分）"""
+        async def fetch_one(code):
+            await self.control.acheckpoint()
+            self.fund_data[code] = await self.get_fund_info(code)
+            self.progress.advance()
+        
+        await asyncio.gather(*(fetch_one(code) for code in codes))
+    
+    # 三个净值接口，按顺序冗余查询：(接口名, 获取方法名)，接口编号即序号（1-3）
+    FUND_SOURCES = (
+        ('fundgz', '_fetch_fundgz'),
+        ('esongfund', '_fetch_esongfund'),
+        ('pingzhongdata', '_fetch_pingzhongdata'),
+    )
+    
+    async def get_fund_info(self, code):
+        """获取基金信息（三接口冗余查询，元数据缓存有效时先查询最近一次成功的接口）"""
+        sources = self.FUND_SOURCES
+        preferred = self.fund_metadata.preferred_source(code)
+        if preferred:
+            sources = (sources[preferred - 1],) + sources[:preferred - 1] + sources[preferred:]
+            self.metrics.inc('fund_metadata_total', result='fresh')
+        else:
+            self.metrics.inc('fund_metadata_total', result='probe')
+        
+        for source_name, method_name in sources:
+            start = time.perf_counter()
+            try:
+                info = await getattr(self, method_name)(code)
+                result = 'ok' if info else 'miss'
+            except Exception:
+                info = None
+                result = 'error'
+            self.metrics.observe('fetch_seconds', time.perf_counter() - start, source=source_name, result=result)
+            self.metrics.inc('fetch_requests_total', source=source_name, result=result)
+            if info:
+                self.fund_metadata.record(code, info)
+                return info
+        
+        # 所有接口都失败时返回未知基金信息
+        return {
+            'code': code,
+            'name': f"查询失败({code})",
+            'nav_date': "",
+            'nav': 0.0,
+            'change': "N/A",
+            'valid': False,
+            'source': 0
+        }
+    
+    async def conditional_get(self, source, code, url, headers, consumer=None):
+        """带缓存验证信息的 GET，返回 (响应, 缓存的解析结果)；响应未变化时后者不为 None，调用方无需再解析"""
+        if not self.conditional_requests:
+            return await self.http.get(url, headers=headers, consumer=consumer), None
+        
+        headers = dict(headers, **self.nav_cache.request_headers(source, code))
+        response = await self.http.get(url, headers=headers, consumer=consumer)
+        body_hash = consumer.hexdigest() if consumer is not None else None
+        cached = self.nav_cache.match(source, code, response, body_hash)
+        if cached is not None:
+            result = 'not_modified' if response.status_code == 304 else 'unchanged'
+        else:
+            result = 'modified' if self.nav_cache.get(source, code) else 'miss'
+        self.metrics.inc('fetch_conditional_total', source=source, result=result)
+        return response, cached
+    
+    def store_nav_response(self, source, code, response, info, consumer=None):
+        """保存解析结果；流式读取的响应使用消费者计算的响应体哈希"""
+        if self.conditional_requests and info:
+            body_hash = consumer.hexdigest() if consumer is not None else None
+            self.nav_cache.store(source, code, response, info, body_hash)
+        return info
+    
+    async def _fetch_fundgz(self, code):
+        """接口1: fundgz.1234567.com.cn"""
+        url1 = f"{self.fundgz_url}/js/{code}.js"
+        response1, cached = await self.conditional_get(
+            'fundgz', code, url1, {'Referer': 'http://fundf10.eastmoney.com/'}
+        )
+        self.metrics.inc('fetch_bytes_total', response1.body_bytes, source='fundgz')
+        if cached is not None:
+            return cached
+        response1.raise_for_status()
+        
+        if "jsonpgz" in response1.text:
+            json_str = re.sub(r'^jsonpgz\(|\);$', '', response1.text)
+            fund_data = json.loads(json_str)
+            return self.store_nav_response('fundgz', code, response1, {
+                'code': fund_data['fundcode'],
+                'name': fund_data['name'],
+                'nav_date': fund_data['jzrq'],
+                'nav': float(fund_data['dwjz']),
+                'change': fund_data.get('jzzl', 'N/A'),
+                'valid': True,
+                'source': 1
+            })
+        return None
+    
+    async def _fetch_esongfund(self, code):
+        """接口2: j4.esongfund.com"""
+        url2 = f"{self.esongfund_url}/eap/api/fund/public/portal/fundDetail/getFundBaseInfo?fundCode={code}"
+        response2, cached = await self.conditional_get(
+            'esongfund', code, url2, {'Referer': 'http://fundf10.eastmoney.com/'}
+        )
+        self.metrics.inc('fetch_bytes_total', response2.body_bytes, source='esongfund')
+        if cached is not None:
+            return cached
+        response2.raise_for_status()
+        data = response2.json()
+        
+        if data['code'] == 200:
+            info = data['data']
+            return self.store_nav_response('esongfund', code, response2, {
+                'code': code,
+                'name': info['fundName'],
+                'nav_date': info['netValueDate'],
+                'nav': float(info['netValue']),
+                'change': info['dayGrowth'],
+                'type': info.get('fundType', ''),
+                'valid': True,
+                'source': 2
+            })
+        return None
+    
+    async def _fetch_pingzhongdata(self, code):
+        """接口3: fund.eastmoney.com/pingzhongdata（流式解析，取到所需变量后不再读取剩余的历史数据）"""
+        url3 = f"{self.pingzhongdata_url}/pingzhongdata/{code}.js"
+        extractor = PingzhongdataExtractor()
+        response3, cached = await self.conditional_get(
+            'pingzhongdata', code, url3, {'Referer': 'http://fundf10.eastmoney.com/'}, consumer=extractor
+        )
+        self.metrics.inc('fetch_bytes_total', response3.body_bytes, source='pingzhongdata')
+        if cached is not None:
+            return cached
+        response3.raise_for_status()
+        
+        # 提取基金名称
+        fund_name = extractor.values.get('fS_name') or self.fund_metadata.name(code) or f"查询失败({code})"
+        
+        # 提取净值数据（只保留了最后两个点）
+        if not extractor.trend_found:
+            return None
+        nav_data = list(extractor.points)
+        if not nav_data:
+            return None
+        
+        # 获取最新净值数据点
+        latest_point = nav_data[-1]
+        nav_timestamp = latest_point['x'] / 1000
+        nav_date = datetime.fromtimestamp(nav_timestamp).strftime('%Y-%m-%d')
+        nav_value = latest_point['y']
+        
+        # 检查净值日期是否超过当前日期
+        current_date = self.calendar.clock().strftime('%Y-%m-%d')
+        if nav_date > current_date:
+            # 尝试使用前一个净值点
+            if len(nav_data) > 1:
+                prev_point = nav_data[-2]
+                nav_timestamp = prev_point['x'] / 1000
+                nav_date = datetime.fromtimestamp(nav_timestamp).strftime('%Y-%m-%d')
+                nav_value = prev_point['y']
+            else:
+                return {
+                    'code': code,
+                    'name': fund_name + CLOSED_FUND_SUFFIX,
+                    'nav_date': "",
+                    'nav': 0.0,
+                    'change': "N/A",
+                    'valid': False,
+                    'source': 3
+                }
+        
+        # 提取涨跌幅
+        change_value = extractor.values.get('syl_1y', "N/A")
+        
+        return self.store_nav_response('pingzhongdata', code, response3, {
+            'code': code,
+            'name': fund_name + CLOSED_FUND_SUFFIX,
+            'nav_date': nav_date,
+            'nav': float(nav_value),
+            'change': change_value,
+            'valid': True,
+            'source': 3
+        }, extractor)
+    
+    def calculate_return_values(self, buy_date_str, nav_date_str, profit, amount, is_valid=True):
+        """计算收益率数值（百分比），返回 (绝对收益率, 年化收益率)，无法计算时为 None"""
+        return calculate_return_values(buy_date_str, nav_date_str, profit, amount, is_valid)
+    
+    def format_returns(self, absolute_return, annualized_return, is_valid=True):
+        """收益率数值转为报告文本"""
+        return format_returns(absolute_return, annualized_return, is_valid)
+    
+    def calculate_returns(self, buy_date_str, nav_date_str, profit, amount, is_valid=True):
+        """计算收益率"""
+        return self.format_returns(
+            *self.calculate_return_values(buy_date_str, nav_date_str, profit, amount, is_valid),
+            is_valid
+        )
+    
+    def validate_fund_row(self, row, line_num):
+        """验证数据行有效性"""
+        return validate_fund_row(row) is None
+    
+    def read_fund_rows(self):
+        """读取并验证持仓数据文件，返回有效行列表 [(用户名, 基金代码, 买入日期, 买入金额, 持仓份额)]
+
+        无效行不逐行写日志，而是汇总到 self.validation_report，日志中只显示按错误类型的计数和少量样例
+        """
+        report = ValidationReport()
+        rows = []
+        append = rows.append
+        validate = validate_fund_row
+        with open(self.funds_file, 'r', encoding='utf-8') as f:
+            reader = checkpointed(csv.reader(f), lambda done: self.control.checkpoint())
+            for line_num, row in enumerate(reader, 1):
+                # 跳过空行和注释行
+                if not row or not row[0] or row[0].startswith('#'):
+                    continue
+                
+                # 验证数据行有效性
+                error = validate(row)
+                if error is None:
+                    append(tuple(row))
+                else:
+                    report.add(line_num, error, row)
+        
+        report.valid_rows = len(rows)
+        self.validation_report = report
+        self.metrics.inc('rows_total', len(rows), result='valid')
+        self.metrics.inc('rows_total', report.invalid_rows, result='invalid')
+        for error, count in report.counts.items():
+            self.metrics.inc('invalid_rows_total', count, error=error)
+        
+        if report.invalid_rows:
+            self.log_signal.emit(report.summary(), "warning")
+            for line in report.samples():
+                self.log_signal.emit(line, "warning")
+            if report.invalid_rows > VALIDATION_LOG_SAMPLES:
+                self.log_signal.emit(f"……另有 {report.invalid_rows - VALIDATION_LOG_SAMPLES} 行未显示", "warning")
+        return rows
+    
+    def save_validation_report(self, timestamp):
+        """把完整的无效行清单写入 report/validation/时间戳.csv"""
+        report = self.validation_report
+        if not report or not report.invalid_rows:
+            return
+        file_path = os.path.join(self.report_dir, "validation", f"{timestamp}.csv")
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            atomic_write_text(file_path, report.to_csv(), encoding='utf-8-sig')
+            self.log_signal.emit(f"无效行清单: {file_path}", "info")
+        except Exception as e:
+            self.log_signal.emit(f"保存无效行清单失败: {str(e)}", "error")
+    
+    def generate_user_report(self, user, data, emoji):
+        """生成用户报告（用于推送）"""
+        with self.metrics.time('render_seconds', kind='user_push'):
+            return self.push_renderer.render_user_push(user, data, emoji)
+    
+    def generate_performance_summary(self, performance_data, target_return, time_str, failed_users=None):
+        """生成业绩达标总结报告（用于推送），performance_data 由 collect_performance_data 收集"""
+        with self.metrics.time('render_seconds', kind='summary_push'):
+            return self.push_renderer.render_performance_data(performance_data, target_return, time_str, failed_users)
+    
+    def generate_fund_report(self, fund_code, fund_name, holdings):
+        """生成基金报告：持有该基金的客户情况列表和详情（用于电脑端文件）"""
+        with self.metrics.time('render_seconds', kind='by_fund'):
+            return self.file_renderer.render_fund(fund_code, fund_name, holdings)
+    
+    def generate_user_file_report(self, user, data):
+        """生成客户报告（用于电脑端文件）"""
+        with self.metrics.time('render_seconds', kind='by_user'):
+            return self.file_renderer.render_user_file(user, data)
+    
+    def sanitize_filename(self, name):
+        """清洗文件名中的非法字符"""
+        return sanitize_filename(name)
+    
+    def _record_push(self, channel, start, success, payload_bytes, attempts):
+        """记录一条推送消息的指标；start 为 None 时只记录失败结果"""
+        if start is not None:
+            self.metrics.observe('push_seconds', time.perf_counter() - start, channel=channel, result='ok')
+        self.metrics.inc('push_messages_total', channel=channel, result='ok' if success else 'failed')
+        self.metrics.inc('push_bytes_total', payload_bytes, channel=channel)
+        if attempts > 1:
+            self.metrics.inc('push_retries_total', attempts - 1, channel=channel)
+    
+    async def send_bark_notification(self, title, message, retries=None, device_key=None):
+        """发送Bark通知（带重试机制）；device_key 为空时发送到全局配置的设备
+
+        设备 key 可以有多个（逗号分隔）：开启批量推送时一次请求发送到全部设备，否则逐个设备发送
+        """
+        if retries is None:
+            retries = self.max_retries
+        
+        device_keys = bark_device_keys(device_key or self.config.get('advanced', 'bark_token', fallback=''))
+        if len(device_keys) > 1 and not self.bark_batch:
+            results = await asyncio.gather(
+                *(self.send_bark_notification(title, message, retries, key) for key in device_keys)
+            )
+            return all(results)
+        
+        attempts = 0
+        while attempts <= retries:
+            attempts += 1
+            start = time.perf_counter()
+            payload_bytes = 0
+            try:
+                bark_url = self.config.get('advanced', 'bark_url', fallback='')
+                
+                if not bark_url or not device_keys:
+                    self.log_signal.emit("Bark配置不完整，无法发送通知", "error")
+                    return False
+                
+                if self.bark_method == 'post':
+                    # JSON POST：内容放在请求体中按 UTF-8 发送，不做 URL 编码，也不受请求地址长度限制
+                    body = json.dumps(bark_payload(title, message, device_keys), ensure_ascii=False)
+                    payload_bytes = len(body.encode('utf-8'))
+                    response = await self.http.post(f"{bark_url}/push", data=body, headers=BARK_JSON_HEADERS,
+                                                    verify=False)
+                else:
+                    # 修复：使用查询参数而不是路径参数
+                    # 对标题和消息进行URL编码
+                    encoded_title = quote(title, safe='')
+                    encoded_message = quote(message, safe='')
+                    
+                    # 构建请求URL - 使用查询参数
+                    url = f"{bark_url}/{device_keys[0]}?title={encoded_title}&body={encoded_message}"
+                    payload_bytes = len(url)
+                    
+                    # 发送请求
+                    response = await self.http.get(url, verify=False)
+                
+                if response.status_code == 200:
+                    self.log_signal.emit(f"Bark通知发送成功: {title[:20]}...", "success")
+                    self._record_push('bark', start, True, payload_bytes, attempts)
+                    self.record_channel_attempt('bark', True)
+                    return True
+                else:
+                    self.log_signal.emit(f"Bark通知发送失败: {response.status_code}", "error")
+                    self.log_signal.emit(f"响应内容: {response.text[:100]}", "error")
+                    raise Exception(f"HTTP状态码: {response.status_code}")
+            except Exception as e:
+                error_msg = str(e)
+                self.log_signal.emit(f"Bark通知发送异常(尝试 {attempts}/{retries}): {error_msg}", "warning")
+                self.metrics.observe('push_seconds', time.perf_counter() - start, channel='bark', result='error')
+                self.record_channel_attempt('bark', False)
+                
+                # 渠道已判定为不可用时不再等待重试
+                if attempts <= retries and not self.channel_health.is_down('bark'):
+                    await asyncio.sleep(self.retry_delay)
+                else:
+                    self.log_signal.emit(f"⚠️ Bark推送失败: {title[:20]}...", "error")
+                    self._record_push('bark', None, False, 0, attempts)
+                    return False
+    
+    async def send_gotify_notification(self, title, message, retries=None, app_token=None):
+        """发送Gotify通知（带重试机制）；app_token 为空时使用全局配置的应用 token"""
+        if retries is None:
+            retries = self.max_retries
+            
+        attempts = 0
+        while attempts <= retries:
+            attempts += 1
+            start = time.perf_counter()
+            payload_bytes = 0
+            try:
+                gotify_url = self.config.get('advanced', 'gotify_url', fallback='')
+                gotify_token = app_token or self.config.get('advanced', 'gotify_token', fallback='')
+                
+                if not gotify_url or not gotify_token:
+                    self.log_signal.emit("Gotify配置不完整，无法发送通知", "error")
+                    return False
+                
+                # 构建请求URL
+                url = f"{gotify_url}/message?token={gotify_token}"
+                
+                # 构建请求数据
+                data = {
+                    "title": title,
+                    "message": message,
+                    "priority": 5
+                }
+                payload_bytes = len(json.dumps(data).encode('utf-8'))
+                
+                # 发送请求
+                response = await self.http.post(url, json=data, verify=False)
+                
+                if response.status_code == 200:
+                    self.log_signal.emit(f"Gotify通知发送成功: {title[:20]}...", "success")
+                    self._record_push('gotify', start, True, payload_bytes, attempts)
+                    self.record_channel_attempt('gotify', True)
+                    return True
+                else:
+                    self.log_signal.emit(f"Gotify通知发送失败: {response.status_code}", "error")
+                    self.log_signal.emit(f"响应内容: {response.text[:100]}", "error")
+                    raise Exception(f"HTTP状态码: {response.status_code}")
+            except Exception as e:
+                error_msg = str(e)
+                self.log_signal.emit(f"Gotify通知发送异常(尝试 {attempts}/{retries}): {error_msg}", "warning")
+                self.metrics.observe('push_seconds', time.perf_counter() - start, channel='gotify', result='error')
+                self.record_channel_attempt('gotify', False)
+                
+                # 渠道已判定为不可用时不再等待重试
+                if attempts <= retries and not self.channel_health.is_down('gotify'):
+                    await asyncio.sleep(self.retry_delay)
+                else:
+                    self.log_signal.emit(f"⚠️ Gotify推送失败: {title[:20]}...", "error")
+                    self._record_push('gotify', None, False, 0, attempts)
+                    return False
+    
+    async def send_wecom_notification(self, title, message, retries=None, touser=None):
+        """发送企业微信通知（带重试机制）；touser 为空时发送给全部成员"""
+        if retries is None:
+            retries = self.max_retries
+            
         attempts = 0
         while attempts <= retries:
             attempts += 1
+            start = time.perf_counter()
+            payload_bytes = 0
             try:
                 wecom_corpid = self.config.get('advanced', 'wecom_corpid', fallback='')
                 wecom_agentid = self.config.get('advanced', 'wecom_agentid', fallback='')
@@ -1378,7 +4874,7 @@ class ReportWorker(QThread):
                 
                 # 获取access_token
                 token_url = f"{wecom_proxy_url}/cgi-bin/gettoken?corpid={wecom_corpid}&corpsecret={wecom_secret}"
-                token_response = requests.get(token_url, timeout=10)
+                token_response = await self.http.get(token_url)
                 token_data = token_response.json()
                 
                 if token_data.get('errcode') != 0:
@@ -1388,7 +4884,7 @@ class ReportWorker(QThread):
                 
                 # 构建消息数据
                 msg_data = {
-                    "touser": "@all",
+                    "touser": touser or "@all",
                     "msgtype": "text",
                     "agentid": wecom_agentid,
                     "text": {
@@ -1396,14 +4892,17 @@ class ReportWorker(QThread):
                     },
                     "safe": 0
                 }
+                payload_bytes = len(json.dumps(msg_data).encode('utf-8'))
                 
                 # 通过代理发送消息
                 send_url = f"{wecom_proxy_url}/cgi-bin/message/send?access_token={access_token}"
-                send_response = requests.post(send_url, json=msg_data, timeout=10)
+                send_response = await self.http.post(send_url, json=msg_data)
                 send_data = send_response.json()
                 
                 if send_data.get('errcode') == 0:
                     self.log_signal.emit(f"企业微信通知发送成功: {title[:20]}...", "success")
+                    self._record_push('wecom', start, True, payload_bytes, attempts)
+                    self.record_channel_attempt('wecom', True)
                     return True
                 else:
                     self.log_signal.emit(f"企业微信通知发送失败: {send_data.get('errmsg')}", "error")
@@ -1411,17 +4910,331 @@ class ReportWorker(QThread):
             except Exception as e:
                 error_msg = str(e)
                 self.log_signal.emit(f"企业微信通知发送异常(尝试 {attempts}/{retries}): {error_msg}", "warning")
+                self.metrics.observe('push_seconds', time.perf_counter() - start, channel='wecom', result='error')
+                self.record_channel_attempt('wecom', False)
                 
-                if attempts <= retries:
-                    time.sleep(self.retry_delay)
+                # 渠道已判定为不可用时不再等待重试
+                if attempts <= retries and not self.channel_health.is_down('wecom'):
+                    await asyncio.sleep(self.retry_delay)
                 else:
                     self.log_signal.emit(f"⚠️ 企业微信推送失败: {title[:20]}...", "error")
+                    self._record_push('wecom', None, False, 0, attempts)
                     return False
     
+    async def deliver(self, channel, title, message):
+        """通过一个渠道发送消息（含重试），记录该渠道的投递耗时、结果和健康状态"""
+        start = time.perf_counter()
+        try:
+            success = await getattr(self, f"send_{channel}_notification")(title, message)
+        except asyncio.CancelledError:
+            # race 策略中其他渠道已经成功
+            self.metrics.observe('push_delivery_seconds', time.perf_counter() - start,
+                                 channel=channel, policy=self.delivery_policy, result='cancelled')
+            self.metrics.inc('push_delivery_total', channel=channel, policy=self.delivery_policy, result='cancelled')
+            raise
+        result = 'ok' if success else 'failed'
+        self.metrics.observe('push_delivery_seconds', time.perf_counter() - start,
+                             channel=channel, policy=self.delivery_policy, result=result)
+        self.metrics.inc('push_delivery_total', channel=channel, policy=self.delivery_policy, result=result)
+        return success
+    
+    def record_channel_attempt(self, channel, success):
+        if self.channel_health.record(channel, success):
+            self.log_signal.emit(f"{channel} 连续{self.channel_health.down_after}次请求失败，暂停使用该渠道", "warning")
+    
+    def channels_down(self, channels):
+        """已启用的渠道是否都已判定为不可用"""
+        enabled = [channel for channel, on in zip(PUSH_CHANNELS, channels) if on]
+        return bool(enabled) and all(self.channel_health.is_down(channel) for channel in enabled)
+    
+    async def probe_channel(self, channel):
+        """用一次轻量请求（短超时）检查推送渠道是否可用：Bark /ping、Gotify /health、企业微信获取 access_token"""
+        get = lambda key: self.config.get('advanced', key, fallback='')
+        try:
+            if channel == 'bark':
+                response = await self.http.get(f"{get('bark_url')}/ping", timeout=self.probe_timeout, verify=False)
+                ok = response.status_code == 200
+            elif channel == 'gotify':
+                response = await self.http.get(f"{get('gotify_url')}/health", timeout=self.probe_timeout, verify=False)
+                ok = response.status_code == 200
+            else:
+                response = await self.http.get(
+                    f"{get('wecom_proxy_url')}/cgi-bin/gettoken?corpid={get('wecom_corpid')}"
+                    f"&corpsecret={get('wecom_secret')}",
+                    timeout=self.probe_timeout
+                )
+                ok = response.json().get('errcode') == 0
+        except Exception:
+            ok = False
+        self.metrics.inc('push_probe_total', channel=channel, result='ok' if ok else 'failed')
+        return ok
+    
+    async def probe_channels(self, channels):
+        """并发探测渠道，更新健康状态，返回可用的渠道"""
+        results = await asyncio.gather(*(self.probe_channel(channel) for channel in channels))
+        available = []
+        for channel, ok in zip(channels, results):
+            if ok:
+                self.channel_health.reset(channel)
+                available.append(channel)
+            else:
+                self.channel_health.mark_down(channel)
+                self.log_signal.emit(f"推送渠道 {channel} 探测失败，暂不可用", "warning")
+        return available
+    
+    async def drain_retry_queue(self):
+        """等待后重新探测不可用的渠道，有渠道恢复时补发重试队列中的推送；超过轮数仍未发出的推送按失败处理"""
+        for _ in range(self.retry_queue_rounds):
+            if not self.retry_queue:
+                return
+            down = sorted(self.channel_health.down)
+            self.log_signal.emit(
+                f"{len(self.retry_queue)}项推送因渠道不可用（{', '.join(down)}）暂存，"
+                f"{self.retry_queue_wait:g}秒后重新探测", "warning"
+            )
+            await asyncio.sleep(self.retry_queue_wait)
+            if not await self.probe_channels(down):
+                continue
+            queue, self.retry_queue = self.retry_queue, []
+            await asyncio.gather(*(resume() for resume, _ in queue))
+        queue, self.retry_queue = self.retry_queue, []
+        for _, give_up in queue:
+            give_up()
+    
+    async def race_delivery(self, candidates, title, message):
+        """同时发送到全部候选渠道，第一个成功后取消其余渠道"""
+        pending = {asyncio.ensure_future(self.deliver(channel, title, message)) for channel in candidates}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if any(task.result() for task in done):
+                    return True
+            return False
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def push_message(self, title, chunk, channels):
+        """按投递策略发送一条消息到已启用的渠道（跳过本次运行中已判定不可用的渠道），返回是否至少一个渠道成功
+
+        fallback 按 Bark、Gotify、企业微信的顺序尝试；fanout 同时发送到全部渠道；race 同时发送，第一个成功后取消其余
+        """
+        candidates = []
+        for channel, enabled in zip(PUSH_CHANNELS, channels):
+            if not enabled:
+                continue
+            if self.channel_health.is_down(channel):
+                self.metrics.inc('push_delivery_total', channel=channel, policy=self.delivery_policy, result='skipped')
+            else:
+                candidates.append(channel)
+        if not candidates:
+            return False
+        if self.delivery_policy == 'fanout':
+            results = await asyncio.gather(*(self.deliver(channel, title, chunk) for channel in candidates))
+            return any(results)
+        if self.delivery_policy == 'race' and len(candidates) > 1:
+            return await self.race_delivery(candidates, title, chunk)
+        for channel in candidates:
+            if await self.deliver(channel, title, chunk):
+                return True
+        return False
+    
+    async def send_to_destination(self, destination, title, message):
+        """发送一条消息到路由表中的一个收件人"""
+        channel, target = destination
+        if channel == 'bark':
+            return await self.send_bark_notification(title, message, device_key=target)
+        if channel == 'gotify':
+            return await self.send_gotify_notification(title, message, app_token=target)
+        return await self.send_wecom_notification(title, message, touser=target)
+    
+    def load_routes(self):
+        """按配置读取推送路由表（文件不存在时不使用路由）"""
+        if not self.routes_file:
+            return {}
+        path = self.routes_file if os.path.isabs(self.routes_file) else os.path.join(self.base_dir, self.routes_file)
+        if not os.path.exists(path):
+            return {}
+        try:
+            routes, invalid = load_push_routes(path)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            self.log_signal.emit(f"读取推送路由表失败，按全局配置推送: {str(e)}", "warning")
+            return {}
+        if invalid:
+            self.log_signal.emit(
+                f"推送路由表中{len(invalid)}行无效（第{', '.join(map(str, invalid[:10]))}行），已忽略", "warning"
+            )
+        return routes
+    
+    async def push_routed_reports(self, groups, on_user_done):
+        """按收件人推送客户报告
+
+        同一收件人的多位客户报告合并为尽量少的消息按顺序发送，不同收件人之间并发；渠道不可用时该收件人
+        其余的消息暂存到重试队列；每位客户的全部收件人处理完后回调 on_user_done(客户, 是否成功)
+        """
+        remaining = defaultdict(int)
+        for reports in groups.values():
+            for report in reports:
+                remaining[report['user']] += 1
+        failed = set()
+        
+        def destination_done(user, success):
+            if not success:
+                failed.add(user)
+            remaining[user] -= 1
+            if remaining[user] == 0:
+                on_user_done(user, user not in failed)
+        
+        def give_up(reports):
+            for report in reports:
+                destination_done(report['user'], False)
+        
+        async def push_destination(destination, reports, batches=None, start=0, undelivered=None):
+            if batches is None:
+                budgets = self.message_budgets((), destination)
+                items = [
+                    (report['user'], chunk)
+                    for report in reports for chunk in split_message(report['content'], budgets)
+                ]
+                batches = batch_messages(items, budgets)
+                self.metrics.inc('push_routed_messages_total', len(batches), channel=destination[0])
+            undelivered = undelivered if undelivered is not None else set()
+            for index in range(start, len(batches)):
+                message, users = batches[index]
+                await self.control.acheckpoint()
+                title = f"净值推送报告[{index + 1}/{len(batches)}]"
+                if not self.channel_health.is_down(destination[0]):
+                    if await self.send_to_destination(destination, title, message):
+                        await asyncio.sleep(self.send_interval)
+                        continue
+                    if not self.channel_health.is_down(destination[0]):
+                        undelivered |= users
+                        await asyncio.sleep(self.send_interval)
+                        continue
+                # 渠道不可用：从这一条开始的消息暂存到重试队列
+                self.retry_queue.append((
+                    lambda i=index: push_destination(destination, reports, batches, i, undelivered),
+                    lambda: give_up(reports)
+                ))
+                return
+            for report in reports:
+                destination_done(report['user'], report['user'] not in undelivered)
+        
+        await asyncio.gather(*(push_destination(destination, reports) for destination, reports in groups.items()))
+    
+    async def push_user_report(self, report, channels):
+        """按页码顺序推送一位客户报告的全部分片，返回是否全部成功
+
+        已启用的渠道都不可用时返回 None，并在 report['resume_page'] 中记录尚未发出的页码，供重试队列补发
+        """
+        report_chunks = self.split_long_content(report['content'], channels)
+        total_pages = len(report_chunks)
+        for page_num in range(report.get('resume_page', 1), total_pages + 1):
+            await self.control.acheckpoint()
+            title = f"净值推送报告[{page_num}/{total_pages}]"
+            if not await self.push_message(title, report_chunks[page_num - 1], channels):
+                if self.channels_down(channels):
+                    report['resume_page'] = page_num
+                    return None
+                return False
+            await asyncio.sleep(self.send_interval)  # 避免消息发送过快
+        return True
+    
+    async def push_reports(self, user_reports, performance_report, channels):
+        """推送全部客户报告（客户之间并发，受网络并发数限制）和业绩总结报告，返回推送失败的客户
+
+        推送成功的客户记入 self.pushed_users，运行被取消后下次运行可跳过
+        """
+        def user_done(user, success):
+            if success:
+                self.pushed_users.add(user)
+            self.progress.advance()
+        
+        async def push_one(report):
+            success = await self.push_user_report(report, channels)
+            if success is None:
+                # 全部渠道不可用：暂存，渠道恢复后从未发出的页码继续
+                self.retry_queue.append((lambda: push_one(report), lambda: user_done(report['user'], False)))
+            else:
+                user_done(report['user'], success)
+        
+        # 推送前探测已启用的渠道，不可用的渠道不再逐条消耗重试
+        if self.probe_enabled and user_reports:
+            enabled = [channel for channel, on in zip(PUSH_CHANNELS, channels) if on]
+            available = await self.probe_channels(enabled)
+            self.log_signal.emit(f"推送渠道探测: {len(available)}/{len(enabled)}个可用", "info")
+        
+        # 路由表中有可用收件人的客户按收件人合并推送，其余客户按原方式推送到全局配置的目标
+        groups, unrouted = group_routes(user_reports, self.routes, channels) if self.routes else ({}, user_reports)
+        if self.bark_batch:
+            groups = merge_bark_destinations(groups)
+        if groups:
+            self.log_signal.emit(
+                f"按路由推送: {len(user_reports) - len(unrouted)}位客户 → {len(groups)}个收件人, "
+                f"{len(unrouted)}位客户按全局配置推送", "info"
+            )
+        await asyncio.gather(
+            self.push_routed_reports(groups, user_done),
+            *(push_one(report) for report in unrouted)
+        )
+        await self.drain_retry_queue()
+        failed_users = [report['user'] for report in user_reports if report['user'] not in self.pushed_users]
+        for user in failed_users:
+            self.log_signal.emit(f"⚠️ 用户 {user} 报告推送失败", "warning")
+        
+        # 推送业绩总结报告
+        if not self.summary_pushed:
+            perf_chunks = self.split_long_content(performance_report, channels)
+            total_pages = len(perf_chunks)
+            for page_num, chunk in enumerate(perf_chunks, 1):
+                await self.control.acheckpoint()
+                title = f"业绩达标总结[{page_num}/{total_pages}]"
+                await self.push_message(title, chunk, channels)
+                await asyncio.sleep(self.send_interval)
+            self.summary_pushed = True
+        self.progress.advance()
+        return failed_users
+    
     def run(self):
+        try:
+            if self.profile_enabled:
+                self.run_profiled()
+            else:
+                self.generate_reports()
+        finally:
+            self.finished.emit()
+    
+    def run_profiled(self):
+        """在性能分析模式下执行一次报告任务，分析结果写入 report/profile"""
+        profiler = RunProfiler(
+            os.path.join(self.report_dir, "profile"), datetime.now().strftime(REPORT_TIMESTAMP_FORMAT)
+        )
+        self.log_signal.emit("性能分析模式已开启，本次运行会明显变慢", "warning")
+        self.profiler = profiler
+        profiler.start()
+        try:
+            self.generate_reports()
+        finally:
+            self.profiler = None
+            try:
+                prof_path, summary_path = profiler.stop()
+                for location, calls, tottime, cumtime in profiler.hot_functions('tottime', 5):
+                    self.log_signal.emit(f"[性能分析] {tottime:.3f}秒 ({calls}次) {location}", "info")
+                self.log_signal.emit(f"性能分析结果: {summary_path} ({os.path.basename(prof_path)})", "info")
+            except Exception as e:
+                self.log_signal.emit(f"写出性能分析结果失败: {str(e)}", "error")
+    
+    def generate_reports(self):
+        exporter = None
+        run_start = time.perf_counter()
         try:
             # 开始生成基金报告
             self.log_signal.emit("开始生成基金报告...", "info")
+            for warning in self.config_warnings:
+                self.log_signal.emit(warning, "warning")
+            self.config_warnings = []
             
             # 确保报告目录存在
             os.makedirs(self.report_dir, exist_ok=True)
@@ -1433,265 +5246,561 @@ class ReportWorker(QThread):
             
             self.log_signal.emit(f"读取基金数据文件: {self.funds_file}", "info")
             
+            # 本次运行的时间戳（报告文件名、导出文件名）
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            
+            # 计算结果导出（JSON Lines / 列式二进制）
+            if self.export_jsonl or self.export_columnar:
+                exporter = ResultExporter(
+                    os.path.join(self.report_dir, "export"), timestamp, self.export_jsonl, self.export_columnar
+                )
+            
             # 解析基金数据
-            holdings = []
-            user_data = OrderedDict()  # 使用有序字典保持用户顺序
-            fund_holdings = defaultdict(list)  # 按基金存储持有情况
+            with self.stage('parse'):
+                rows = self.read_fund_rows()
+            self.save_validation_report(timestamp)
+            self.load_resume_state()
             
-            with open(self.funds_file, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                for line_num, row in enumerate(reader, 1):
-                    # 跳过空行和注释行
-                    if not row or not row[0] or row[0].startswith('#'):
-                        continue
-                    
-                    # 验证数据行有效性
-                    if not self.validate_fund_row(row, line_num):
-                        self.log_signal.emit(f"跳过无效行 {line_num}: {','.join(row)}", "warning")
-                        continue
-                    
-                    username, code, buy_date, amount, shares = row
-                    
-                    # 确保用户数据存在
-                    if username not in user_data:
-                        user_data[username] = {'funds': []}
-                    
-                    # 获取基金信息（如果尚未获取）
-                    if code not in self.fund_data:
-                        self.fund_data[code] = self.get_fund_info(code)
-                    
-                    fund_info = self.fund_data[code]
-                    
-                    # 计算收益
-                    buy_amount = float(amount)
-                    if fund_info.get('valid', True) and fund_info.get('nav_date'):
-                        current_value = float(shares) * fund_info['nav']
-                        profit = current_value - buy_amount
-                        is_valid = True
-                    else:
-                        current_value = 0
-                        profit = 0
-                        is_valid = False
+            # 获取基金信息（每个基金代码只查询一次）
+            with self.stage('fetch'):
+                codes = [code for code in dict.fromkeys(row[1] for row in rows) if code not in self.fund_data]
+                unique_count = len(codes)
+                all_codes = codes
+                self.fund_metadata.load()
+                self.calendar = self.load_calendar()
+                codes = self.reuse_current_navs(codes)
+                self.progress.begin('fetch', len(codes))
+                if self.conditional_requests:
+                    self.nav_cache.load()
+                try:
+                    self.run_async(self.fetch_funds(codes))
+                    self.run_async(self.lookup_fund_types(all_codes))
+                finally:
+                    self.save_fund_metadata()
+                self.track_nav_updates(codes)
+                self.progress.finish()
+                self.metrics.inc('fund_cache_total', unique_count, result='miss')
+                self.metrics.inc('fund_cache_total', len(rows) - unique_count, result='hit')
+            
+            if self.delta:
+                rows = self.delta_rows(rows)
+                self.log_signal.emit(
+                    f"增量查询: {len(codes)}只基金, {len(self.updated_codes)}只净值有更新, "
+                    f"{len(self.behind_codes)}只仍未更新", "info"
+                )
+                if not rows:
+                    self.log_signal.emit("没有客户持有净值有更新的基金，无需重新推送", "info")
+                    return
+            
+            book = None
+            with self.stage('compute'):
+                if self.use_sharding(len(rows)):
+                    self.log_signal.emit(f"持仓数据较多，使用{self.compute_processes}个进程分片计算", "info")
+                    self.progress.begin('compute', 0)  # 分片数在分片后确定，按已完成的分片数上报
+                    def on_shards(done, total):
+                        self.control.checkpoint()
+                        self.progress.update(done, total)
                     
-                    abs_return, ann_return = self.calculate_returns(
-                        buy_date, 
-                        fund_info.get('nav_date', ''),
-                        profit,
-                        buy_amount,
-                        is_valid
+                    book = compute_sharded(
+                        rows, self.fund_data, self.shard_options(exporter is not None), self.compute_processes,
+                        on_progress=on_shards
                     )
+                    users, funds = book.users, book.funds
+                    performance_data = book.performance
+                    holding_count, valid_count = book.holding_count, book.valid_count
+                    holdings = book.holdings or ()
+                else:
+                    def on_rows(done):
+                        self.control.checkpoint()
+                        self.progress.update(done)
                     
-                    # 存储用户数据
-                    fund_data = {
-                        'code': code,
-                        'name': fund_info['name'],
-                        'buy_date': buy_date,
-                        'buy_amount': buy_amount,
-                        'nav': fund_info['nav'],
-                        'nav_date': fund_info.get('nav_date', ''),
-                        'profit': profit,
-                        'returns': {
-                            'absolute': abs_return,
-                            'annualized': ann_return
-                        },
-                        'valid': is_valid
-                    }
-                    user_data[username]['funds'].append(fund_data)
-                    
-                    # 存储基金持有情况（用于生成基金报告）
-                    fund_holdings[code].append({
-                        'username': username,
-                        'buy_date': buy_date,
-                        'buy_amount': buy_amount,
-                        'shares': float(shares),
-                        'nav': fund_info['nav'],
-                        'nav_date': fund_info.get('nav_date', ''),
-                        'profit': profit,
-                        'returns_absolute': abs_return,
-                        'returns_annualized': ann_return,
-                        'valid': is_valid,
-                        'fund_name': fund_info['name']  # 存储原始基金名称
-                    })
+                    self.progress.begin('compute', len(rows))
+                    user_data, fund_holdings, holdings = compute_book(checkpointed(rows, on_rows), self.fund_data)
+                    users, funds = list(user_data), list(fund_holdings)
+                    performance_data = collect_performance_data(user_data, self.target_return)
+                    holding_count = len(holdings)
+                    valid_count = sum(1 for holding in holdings if holding['valid'])
+                if exporter:
+                    for holding in holdings:
+                        exporter.add(holding)
+                self.progress.finish()
+            
+            self.metrics.inc('holdings_total', valid_count, valid='true')
+            self.metrics.inc('holdings_total', holding_count - valid_count, valid='false')
+            self.log_signal.emit(f"解析到 {holding_count} 条持仓记录", "info")
+            
+            if exporter:
+                with self.stage('export'):
+                    export_stats = exporter.close()
+                self.log_signal.emit(
+                    f"计算结果已导出: {export_stats['rows']}条记录 "
+                    f"(JSON Lines {export_stats['jsonl_bytes'] / 1024:.1f}KB, "
+                    f"列式 {export_stats['columnar_bytes'] / 1024:.1f}KB) -> {os.path.join(self.report_dir, 'export')}",
+                    "info"
+                )
             
-            self.log_signal.emit(f"解析到 {len(holdings)} 条持仓记录", "info")
+            # 对比上次推送的持仓快照，只推送变化达到阈值的客户
+            if self.mobile_enabled and self.change_only:
+                with self.stage('diff'):
+                    if book:
+                        snapshots = book.user_snapshots
+                    else:
+                        snapshots = {
+                            user: user_position_snapshot(user_data[user], self.target_return) for user in users
+                        }
+                    self.diff_positions(snapshots)
             
             # 手机端推送
             if self.mobile_enabled:
-                bark_enabled = self.config.getboolean('mobile', 'bark_enabled', fallback=False)
-                gotify_enabled = self.config.getboolean('mobile', 'gotify_enabled', fallback=False)
-                wecom_enabled = self.config.getboolean('mobile', 'wecom_enabled', fallback=False)
-                
-                # 生成所有客户报告
-                user_reports = []
-                user_emojis = ['👤','👥']  # 用户标识符
-                for idx, (user, data) in enumerate(user_data.items()):
-                    user_emoji = user_emojis[idx % len(user_emojis)]
-                    report_content = self.generate_user_report(user, data, user_emoji)
-                    user_reports.append({
-                        'user': user,
-                        'content': report_content
-                    })
-                
-                # 生成业绩达标总结报告
-                time_str = datetime.now().strftime('%Y-%m-%d %H:%M')
-                performance_report = self.generate_performance_summary(
-                    user_data, 
-                    self.target_return, 
-                    time_str
-                )
+                with self.stage('push'):
+                    bark_enabled = self.config.getboolean('mobile', 'bark_enabled', fallback=False)
+                    gotify_enabled = self.config.getboolean('mobile', 'gotify_enabled', fallback=False)
+                    wecom_enabled = self.config.getboolean('mobile', 'wecom_enabled', fallback=False)
                 
-                # 推送所有客户报告
-                failed_users = []
-                for report in user_reports:
-                    user = report['user']
-                    report_chunks = self.split_long_content(report['content'])
-                    total_pages = len(report_chunks)
-                    
-                    # 推送该用户的所有分片
-                    all_chunks_success = True
-                    for page_num, chunk in enumerate(report_chunks, 1):
-                        title = f"净值推送报告[{page_num}/{total_pages}]"
-                        
-                        # 根据配置选择推送方式
-                        success = False
-                        if bark_enabled:
-                            success = self.send_bark_notification(title, chunk)
-                        if gotify_enabled and not success:  # 如果Bark失败尝试Gotify
-                            success = self.send_gotify_notification(title, chunk)
-                        if wecom_enabled and not success:  # 如果前两者失败尝试企业微信
-                            success = self.send_wecom_notification(title, chunk)
-                        
-                        if not success:
-                            all_chunks_success = False
-                            break
-                        
-                        time.sleep(0.5)  # 避免消息发送过快
-                    
-                    # 记录用户推送状态
-                    if not all_chunks_success:
-                        failed_users.append(user)
-                        self.log_signal.emit(f"⚠️ 用户 {user} 报告推送失败", "warning")
+                    # 生成所有客户报告（跳过上次取消前已推送成功的客户和持仓无明显变化的客户）
+                    user_reports = []
+                    for idx, user in enumerate(users):
+                        if user in self.pushed_users:
+                            continue
+                        if self.position_changes is not None and user not in self.position_changes:
+                            continue
+                        previous = self.push_snapshots.get(user) if self.delta_message else None
+                        if previous is not None and self.position_changes is not None:
+                            report_content = render_position_delta(
+                                user, USER_EMOJIS[idx % len(USER_EMOJIS)], previous,
+                                self.position_snapshots[user], self.position_changes[user]
+                            )
+                        elif book:
+                            report_content = book.user_push[user]
+                        else:
+                            user_emoji = USER_EMOJIS[idx % len(USER_EMOJIS)]
+                            report_content = self.generate_user_report(user, user_data[user], user_emoji)
+                        user_reports.append({
+                            'user': user,
+                            'content': report_content
+                        })
                 
-                # 推送业绩总结报告
-                perf_chunks = self.split_long_content(performance_report)
-                total_pages = len(perf_chunks)
+                    # 生成业绩达标总结报告
+                    time_str = datetime.now().strftime('%Y-%m-%d %H:%M')
+                    performance_report = self.generate_performance_summary(
+                        performance_data, 
+                        self.target_return, 
+                        time_str
+                    )
                 
-                for page_num, chunk in enumerate(perf_chunks, 1):
-                    title = f"业绩达标总结[{page_num}/{total_pages}]"
-                    
-                    # 根据配置选择推送方式
-                    success = False
-                    if bark_enabled:
-                        success = self.send_bark_notification(title, chunk)
-                    if gotify_enabled and not success:
-                        success = self.send_gotify_notification(title, chunk)
-                    if wecom_enabled and not success:
-                        success = self.send_wecom_notification(title, chunk)
-                    
-                    time.sleep(0.5)
+                    # 并发推送所有客户报告，之后推送业绩总结报告
+                    channels = (bark_enabled, gotify_enabled, wecom_enabled)
+                    self.routes = self.load_routes()
+                    self.progress.begin('push', len(user_reports) + 1)  # 客户报告 + 业绩总结
+                    try:
+                        failed_users = self.run_async(self.push_reports(user_reports, performance_report, channels))
+                    finally:
+                        self.save_push_snapshots()
+                    self.progress.finish()
                 
-                # 最终状态报告
-                success_count = len(user_data) - len(failed_users)
-                self.log_signal.emit(f"客户报告推送: {success_count}成功, {len(failed_users)}失败", "success")
+                    # 最终状态报告
+                    success_count = len(user_reports) - len(failed_users)
+                    self.log_signal.emit(f"客户报告推送: {success_count}成功, {len(failed_users)}失败", "success")
             
             # PC端报告生成
             if self.pc_enabled:
-                # 获取当前时间戳（用于创建日期目录）
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                with self.stage('write'):
+                    writer = create_report_writer(
+                        self.output_backend, self.report_dir, timestamp, self.write_workers, self.write_fsync,
+                        self.file_renderer.extension
+                    )
                 
-                # 按基金分类生成报告
-                if self.by_fund:
-                    # 生成每个基金的报告
-                    for code, holdings_list in fund_holdings.items():
-                        fund_name = self.fund_data.get(code, {}).get('name', f"基金{code}")
-                        
-                        # 创建基金目录
-                        fund_safe_name = self.sanitize_filename(f"{code}_{fund_name}")
-                        fund_dir = os.path.join(self.report_dir, "by_fund", fund_safe_name)
-                        
-                        if not os.path.exists(fund_dir):
-                            os.makedirs(fund_dir, exist_ok=True)
-                        
-                        # 生成报告内容
-                        report_content = self.generate_fund_report(code, fund_name, holdings_list)
-                        
-                        # 保存报告 - 直接使用时间戳作为文件名
-                        file_name = f"{timestamp}.txt"
-                        file_path = os.path.join(fund_dir, file_name)
-                        
-                        try:
-                            with open(file_path, 'w', encoding='utf-8') as f:
-                                f.write(report_content)
-                            self.log_signal.emit(f"已保存基金报告: {file_path}", "info")
-                        except Exception as e:
-                            self.log_signal.emit(f"保存基金报告失败: {str(e)}", "error")
+                    # 按基金分类生成报告（渲染延迟到写入线程池中执行；增量模式下只有部分持仓，不生成）
+                    if self.by_fund and not self.delta:
+                        for code in funds:
+                            fund_name = fund_display_name(self.fund_data, code)
+                            if book:
+                                content = book.fund_files[code]
+                            else:
+                                content = lambda c=code, n=fund_name, h=fund_holdings[code]: (
+                                    self.generate_fund_report(c, n, h)
+                                )
+                            writer.add('by_fund', code, content, "基金报告", fund_name)
                 
-                # 按客户分类生成报告
-                if self.by_user:
-                    # 生成每个用户的报告
-                    for user, funds_list in user_data.items():
-                        # 创建用户目录
-                        user_safe_name = self.sanitize_filename(user)
-                        user_dir = os.path.join(self.report_dir, "by_user", user_safe_name)
-                        
-                        if not os.path.exists(user_dir):
-                            os.makedirs(user_dir, exist_ok=True)
-                        
-                        # 生成报告内容
-                        report_content = ""
-                        for fund in funds_list['funds']:
-                            report_content += f"基金代码: {fund['code']}\n"
-                            report_content += f"基金名称: {fund['name']}\n"
-                            report_content += f"购买日期: {fund['buy_date']}\n"
-                            report_content += f"购买金额: {fund['buy_amount']:,.2f}\n"
-                            if fund.get('valid', True):
-                                report_content += f"最新净值: {fund['nav']:.4f} ({fund['nav_date']})\n"
-                                report_content += f"持仓收益: {fund['profit']:+,.2f}\n"
-                                report_content += f"年化收益率: {fund['returns']['annualized']}\n"
+                    # 按客户分类生成报告
+                    if self.by_user:
+                        for user in users:
+                            if book:
+                                content = book.user_files[user]
                             else:
-                                report_content += "最新净值: 未知\n"
-                                report_content += "持仓收益: 未知\n"
-                                report_content += "年化收益率: 未知\n"
-                            report_content += "\n"
-                        
-                        # 保存报告 - 直接使用时间戳作为文件名
-                        file_name = f"{timestamp}.txt"
-                        file_path = os.path.join(user_dir, file_name)
-                        
-                        try:
-                            with open(file_path, 'w', encoding='utf-8') as f:
-                                f.write(report_content)
-                            self.log_signal.emit(f"已保存客户报告: {file_path}", "info")
-                        except Exception as e:
-                            self.log_signal.emit(f"保存客户报告失败: {str(e)}", "error")
+                                content = lambda u=user, d=user_data[user]: self.generate_user_file_report(u, d)
+                            writer.add('by_user', user, content, "客户报告")
                 
-                # ========== 生成目标收益报告 ==========
-                target_report_content = self.generate_performance_summary(
-                    user_data, 
-                    self.target_return, 
-                    datetime.now().strftime('%Y-%m-%d %H:%M')
-                )
-                target_report_path = os.path.join(self.report_dir, "已达目标收益.txt")
+                    # ========== 生成目标收益报告（增量模式下只有部分客户，不生成） ==========
+                    if not self.delta:
+                        target_report_content = self.file_renderer.render_performance_data(
+                            performance_data,
+                            self.target_return,
+                            datetime.now().strftime('%Y-%m-%d %H:%M')
+                        )
+                        writer.add('summary', SUMMARY_REPORT_NAME, target_report_content, "目标收益报告")
+                        if writer.backend != 'files':
+                            # 归档模式下仍保留最新一份目标收益报告，便于直接查看
+                            target_report_path = os.path.join(
+                                self.report_dir, f"{SUMMARY_REPORT_NAME}{self.file_renderer.extension}"
+                            )
+                            try:
+                                atomic_write_text(target_report_path, target_report_content)
+                            except Exception as e:
+                                self.log_signal.emit(f"保存目标收益报告失败: {str(e)}", "error")
                 
-                try:
-                    with open(target_report_path, 'w', encoding='utf-8') as f:
-                        f.write(target_report_content)
-                    self.log_signal.emit(f"已保存目标收益报告: {target_report_path}", "success")
-                except Exception as e:
-                    self.log_signal.emit(f"保存目标收益报告失败: {str(e)}", "error")
+                    def on_written(label, location, error):
+                        self.progress.advance()
+                        if error is None:
+                            self.log_signal.emit(f"已保存{label}: {location}", "info")
+                        else:
+                            self.log_signal.emit(f"保存{label}失败: {str(error)}", "error")
+                
+                    self.progress.begin('write', len(writer.jobs))
+                    stats = writer.write_all(on_written, self.control.should_stop)
+                    self.progress.finish()
+                    self.metrics.inc('report_files_total', stats['files'], backend=writer.backend)
+                    self.metrics.inc('report_bytes_total', stats['bytes'], backend=writer.backend)
+                    self.log_signal.emit(
+                        f"报告写入: {stats['files']}份成功, {stats['failed']}份失败, "
+                        f"{stats['bytes'] / 1024 / 1024:.2f}MB, 耗时{stats['elapsed']:.2f}秒 "
+                        f"({stats['files_per_sec']:.1f}份/秒, {stats['mb_per_sec']:.2f}MB/秒)",
+                        "info"
+                    )
+                    if stats['skipped']:
+                        self.log_signal.emit(f"运行已取消，{stats['skipped']}份报告未写入", "warning")
+                    # 取消时已写入的报告照常提交，不再执行后续的整理
+                    self.control.checkpoint()
+                
+                # ========== 报告保留与整理 ==========
+                retention = ReportRetention.from_config(self.config, self.report_dir)
+                if self.config.getboolean('retention', 'enabled', fallback=False):
+                    try:
+                        retention.record_run(timestamp, writer.backend, writer.journal_items(), self.delta)
+                        self.log_signal.emit(format_retention_stats(retention.run()), "info")
+                    except Exception as e:
+                        self.log_signal.emit(f"报告整理失败: {str(e)}", "error")
+                else:
+                    retention.invalidate()
                 
                 self.log_signal.emit("PC端报告生成完成", "success")
                 self.log_signal.emit(f"报告保存位置: {os.path.abspath(self.report_dir)}", "info")
             
             self.log_signal.emit("报告生成和推送完成", "success")
+            self.clear_resume_state()
             
+        except RunCancelled:
+            self.log_signal.emit("运行已取消", "warning")
+            self.save_resume_state()
         except Exception as e:
             self.log_signal.emit(f"报告生成失败: {str(e)}", "error")
         finally:
-            self.finished.emit()
+            if exporter:
+                exporter.abort()
+            self.close_network()
+            self.finish_metrics(run_start)
+    
+    def diff_positions(self, snapshots):
+        """对比每位客户本次的持仓快照与上次推送时的快照，记录需要推送的客户及变化说明"""
+        self.push_snapshots.load()
+        self.position_snapshots = snapshots
+        self.position_changes = {}
+        for user, snapshot in snapshots.items():
+            changes = position_changes(
+                self.push_snapshots.get(user), snapshot, self.min_profit_change, self.min_return_change
+            )
+            if changes:
+                self.position_changes[user] = changes
+        unchanged = len(snapshots) - len(self.position_changes)
+        self.metrics.inc('push_diff_total', len(self.position_changes), result='changed')
+        self.metrics.inc('push_diff_total', unchanged, result='unchanged')
+        self.log_signal.emit(
+            f"持仓变化: {len(self.position_changes)}位客户需要推送, {unchanged}位无明显变化", "info"
+        )
+    
+    def save_push_snapshots(self):
+        """记录推送成功的客户本次的持仓快照（取消运行时同样记录已推送的部分）"""
+        if self.position_snapshots is None:
+            return
+        for user in self.pushed_users:
+            if user in self.position_snapshots:
+                self.push_snapshots.record(user, self.position_snapshots[user])
+        try:
+            self.push_snapshots.save()
+        except Exception as e:
+            self.log_signal.emit(f"保存推送快照失败: {str(e)}", "warning")
+    
+    def save_fund_metadata(self):
+        try:
+            self.fund_metadata.save()
+        except Exception as e:
+            self.log_signal.emit(f"保存基金元数据缓存失败: {str(e)}", "warning")
+        if self.conditional_requests:
+            try:
+                self.nav_cache.save()
+            except Exception as e:
+                self.log_signal.emit(f"保存净值响应缓存失败: {str(e)}", "warning")
+    
+    def load_resume_state(self):
+        """读取上次取消运行时记录的进度：持仓文件未变且未超过有效期时，复用已获取的净值并跳过已推送的客户"""
+        if not self.resume_enabled or not os.path.exists(self.resume_path):
+            return
+        try:
+            with open(self.resume_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            age = time.time() - state['created']
+            if state['funds_file'] != funds_file_signature(self.funds_file) or not 0 <= age <= self.resume_max_age:
+                self.clear_resume_state()
+                return
+        except Exception as e:
+            self.log_signal.emit(f"忽略无法读取的运行进度记录: {str(e)}", "warning")
+            self.clear_resume_state()
+            return
+        
+        self.fund_data.update(state['fund_data'])
+        self.pushed_users.update(state['pushed_users'])
+        self.summary_pushed = state['summary_pushed']
+        self.log_signal.emit(
+            f"继续{int(age // 60)}分钟前取消的运行: 复用{len(state['fund_data'])}只基金净值, "
+            f"跳过{len(state['pushed_users'])}位已推送的客户"
+            f"{'和业绩总结' if self.summary_pushed else ''}",
+            "info"
+        )
+    
+    def save_resume_state(self):
+        """记录取消前已完成的部分（只保存获取成功的净值），供下次运行复用"""
+        fund_data = {code: info for code, info in self.fund_data.items() if info.get('valid')}
+        self.log_signal.emit(
+            f"已完成: 获取{len(fund_data)}只基金净值, 推送{len(self.pushed_users)}位客户报告",
+            "info"
+        )
+        if not self.resume_enabled or not os.path.exists(self.funds_file):
+            return
+        if not fund_data and not self.pushed_users and not self.summary_pushed:
+            return
+        state = {
+            'created': time.time(),
+            'funds_file': funds_file_signature(self.funds_file),
+            'fund_data': fund_data,
+            'pushed_users': sorted(self.pushed_users),
+            'summary_pushed': self.summary_pushed,
+        }
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            atomic_write_text(self.resume_path, json.dumps(state, ensure_ascii=False))
+            self.log_signal.emit("下次运行将跳过已完成的部分", "info")
+        except Exception as e:
+            self.log_signal.emit(f"保存运行进度失败: {str(e)}", "error")
+    
+    def clear_resume_state(self):
+        try:
+            os.remove(self.resume_path)
+        except FileNotFoundError:
+            pass
+    
+    def finish_metrics(self, run_start):
+        """记录本次运行的总体指标，输出摘要并按配置写出 Prometheus 文本文件"""
+        self.metrics.inc('runs_total')
+        self.metrics.set('last_run_duration_seconds', time.perf_counter() - run_start)
+        self.metrics.set('last_run_timestamp_seconds', time.time())
+        
+        for line in self.metrics.summary_lines():
+            self.log_signal.emit(f"[指标] {line}", "info")
+        
+        prometheus_file = self.config.get('metrics', 'prometheus_file', fallback='').strip()
+        if prometheus_file:
+            if not os.path.isabs(prometheus_file):
+                prometheus_file = os.path.join(self.base_dir, prometheus_file)
+            try:
+                write_prometheus_file(self.metrics, prometheus_file)
+            except Exception as e:
+                self.log_signal.emit(f"写出指标文件失败: {str(e)}", "error")
+
+def load_app_config():
+    """读取配置文件（命令行模式使用）"""
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULT_CONFIG)
+    config.read(os.path.join(get_app_base_dir(), "config", "config.ini"))
+    return config
+
+def poll_schedule(config):
+    """增量轮询设置：(首次间隔秒数, 退避倍数, 最长间隔秒数, 当天截止时间 (时, 分))"""
+    try:
+        until = parse_clock_time(config.get('poll', 'until', fallback='23:30'))
+    except ValueError:
+        until = (23, 30)
+    return (
+        max(1.0, config.getfloat('poll', 'interval', fallback=600)),
+        max(1.0, config.getfloat('poll', 'backoff', fallback=2)),
+        max(1.0, config.getfloat('poll', 'max_interval', fallback=3600)),
+        until,
+    )
+
+def run_headless(config, base_dir, interval=None, metrics_port=0, poll=False):
+    """无界面执行报告任务；interval 不为空时常驻循环，并可提供累计指标的 HTTP 端点
+
+    poll 为 True 时，每次完整运行后按退避间隔增量轮询净值仍未更新的基金，直到全部更新或到达截止时间
+    """
+    app = QCoreApplication.instance() or QCoreApplication([])
+    cumulative = MetricsRegistry()
+    server = None
+    if metrics_port:
+        server = start_metrics_server(cumulative, metrics_port)
+        print(f"指标端点: http://127.0.0.1:{metrics_port}/metrics", file=sys.stderr)
+    
+    try:
+        file_logger = create_file_logger(config, base_dir)
+    except Exception as e:
+        file_logger = None
+        print(f"无法打开日志文件: {str(e)}", file=sys.stderr)
+    
+    def print_log(message, level):
+        now = datetime.now()
+        print(f"[{now:%H:%M:%S}] [{level}] {message}", flush=True)
+        if file_logger:
+            file_logger.info(format_file_log(now, level, message))
+    
+    last_progress = {'stage': None, 'time': 0.0}
+    
+    def print_progress(progress):
+        # 阶段开始/结束时打印，其余更新每隔 HEADLESS_PROGRESS_INTERVAL 秒最多打印一行
+        now = time.monotonic()
+        if (progress['stage'] == last_progress['stage'] and not progress['finished']
+                and now - last_progress['time'] < HEADLESS_PROGRESS_INTERVAL):
+            return
+        last_progress['stage'] = progress['stage']
+        last_progress['time'] = now
+        print_log(f"[进度] {format_progress(progress)}", "info")
+    
+    current = {'worker': None}
+    
+    def handle_interrupt(signum, frame):
+        # 第一次中断取消当前运行（保存已完成的部分），运行间隔中或再次中断时立即退出
+        worker = current['worker']
+        if worker is None or worker.control.cancelled:
+            raise KeyboardInterrupt
+        print("收到中断信号，正在取消本次运行（再次中断立即退出）", file=sys.stderr, flush=True)
+        worker.control.cancel()
+    
+    def run_once(delta=False):
+        worker = ReportWorker(
+            config, base_dir,
+            config.getboolean('mobile', 'enabled', fallback=False),
+            config.getboolean('pc', 'enabled', fallback=False),
+            config.getboolean('pc', 'by_fund', fallback=True),
+            config.getboolean('pc', 'by_user', fallback=True),
+            delta=delta
+        )
+        worker.log_signal.connect(print_log)
+        worker.progress_signal.connect(print_progress)
+        current['worker'] = worker
+        worker.run()
+        current['worker'] = None
+        cumulative.merge(worker.metrics)
+        return worker
+    
+    def poll_updates(worker):
+        # 本轮有基金更新时恢复首次间隔，否则按倍数退避；下一轮将超过截止时间时停止
+        delay, backoff, max_delay, until = poll_schedule(config)
+        first_delay = delay
+        while worker.behind_codes and not worker.control.cancelled:
+            now = datetime.now()
+            deadline = now.replace(hour=until[0], minute=until[1], second=0, microsecond=0)
+            if now + timedelta(seconds=delay) > deadline:
+                print_log(f"{len(worker.behind_codes)}只基金净值仍未更新，已到轮询截止时间{until[0]:02d}:{until[1]:02d}",
+                          "warning")
+                return worker
+            print_log(f"{len(worker.behind_codes)}只基金净值尚未更新，{format_duration(delay)}后再次查询", "info")
+            time.sleep(delay)
+            worker = run_once(delta=True)
+            delay = first_delay if worker.updated_codes else min(delay * backoff, max_delay)
+        return worker
+    
+    previous_handlers = {sig: signal.signal(sig, handle_interrupt) for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        while True:
+            worker = run_once()
+            if poll:
+                worker = poll_updates(worker)
+            if interval is None or worker.control.cancelled:
+                return 0
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+        if server:
+            server.shutdown()
+
+def run_cli(argv):
+    """命令行工具入口；未指定任何命令行功能时返回 None，继续启动图形界面"""
+    parser = argparse.ArgumentParser(description="基金报告推送系统")
+    parser.add_argument('--extract', nargs=2, metavar=('KIND', 'KEY'),
+                        help="提取单份历史报告，KIND 为 by_fund/by_user/summary，KEY 为基金代码或用户名")
+    parser.add_argument('--at', metavar='TIMESTAMP', help="报告时间戳（YYYYMMDD_HHMMSS），默认最新一份")
+    parser.add_argument('--backend', choices=REPORT_BACKENDS, help="报告存储后端，默认读取配置文件")
+    parser.add_argument('-o', '--output', help="输出到文件（默认打印到标准输出）")
+    parser.add_argument('--compact', action='store_true', help="按保留策略清理并压缩整理历史报告")
+    parser.add_argument('--headless', action='store_true', help="不启动界面，按配置文件执行一次报告任务")
+    parser.add_argument('--daemon', action='store_true', help="常驻运行，每隔 --interval 秒执行一次报告任务")
+    parser.add_argument('--interval', type=float, default=3600, help="常驻模式的运行间隔（秒），默认3600")
+    parser.add_argument('--poll', action='store_true',
+                        help="无界面运行后按 [poll] 配置增量轮询净值尚未更新的基金，只推送受影响的客户")
+    parser.add_argument('--metrics-port', type=int, help="常驻模式下在 127.0.0.1 提供 /metrics 端点的端口")
+    parser.add_argument('--profile', action='store_true',
+                        help="性能分析模式：无界面执行报告任务，并在 report/profile 下写出分析结果")
+    args, _ = parser.parse_known_args(argv)
+
+    if not (args.extract or args.compact or args.headless or args.daemon or args.profile or args.poll):
+        return None
+
+    config = load_app_config()
+    report_dir = os.path.join(get_app_base_dir(), "report")
+
+    if args.profile:
+        config['advanced']['profile'] = '1'
+    if args.headless or args.daemon or args.profile or args.poll:
+        metrics_port = args.metrics_port
+        if metrics_port is None:
+            metrics_port = config.getint('metrics', 'http_port', fallback=0)
+        return run_headless(config, get_app_base_dir(), args.interval if args.daemon else None,
+                            metrics_port if args.daemon else 0, args.poll)
+
+    if args.compact:
+        if not os.path.isdir(report_dir):
+            print("报告目录不存在，无需整理", file=sys.stderr)
+            return 0
+        stats = ReportRetention.from_config(config, report_dir).run()
+        print(format_retention_stats(stats))
+        return 0
+    backend = args.backend or config.get('output', 'backend', fallback='files')
+    kind, key = args.extract
+    try:
+        result = read_archived_report(report_dir, backend, kind, key, args.at)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    if result is None:
+        print(f"未找到报告: {kind}/{key}", file=sys.stderr)
+        return 1
+
+    timestamp, content = result
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(content)
+        print(f"已导出报告({timestamp}): {args.output}", file=sys.stderr)
+    else:
+        sys.stdout.write(content)
+    return 0
 
 # 应用程序入口
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包为可执行文件后分片计算的子进程需要
+    exit_code = run_cli(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+    
     app = QApplication(sys.argv)
     
     # 设置应用样式
@@ -0,0 +1,125 @@
+import configparser
+import json
+import os
+import sys
+from collections import defaultdict
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pytest
+
+# main.py 在导入时加载 PyQt5；测试在无显示环境中运行
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+MOCK_URL = "http://mock.invalid"
+
+
+@pytest.fixture(scope='session')
+def qt_app():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+def make_config(**sections):
+    """默认配置，净值接口和推送地址指向替身客户端；sections 为需要覆盖的 {节: {键: 值}}"""
+    config = configparser.ConfigParser()
+    config.read_dict(main.DEFAULT_CONFIG)
+    config['advanced'].update({
+        'bark_url': MOCK_URL, 'bark_token': 'device', 'gotify_url': MOCK_URL, 'gotify_token': 'app',
+        'wecom_corpid': 'corp', 'wecom_agentid': '1', 'wecom_secret': 'secret', 'wecom_proxy_url': MOCK_URL,
+        'max_retries': '0', 'retry_delay': '0',
+    })
+    config['sources'].update({'fundgz_url': MOCK_URL, 'esongfund_url': MOCK_URL, 'pingzhongdata_url': MOCK_URL})
+    config['push'].update({'send_interval': '0', 'retry_queue_wait': '0', 'probe': '0'})
+    config['calendar']['holidays_file'] = ''
+    for section, values in sections.items():
+        config[section].update(values)
+    return config
+
+
+@pytest.fixture
+def make_worker(tmp_path, qt_app):
+    """创建使用 FakeHttpClient 的 ReportWorker；worker.logs 收集日志 (级别, 内容)"""
+    workers = []
+
+    def factory(handler, config=None, mobile=False, pc=False, delta=False, funds=None):
+        os.makedirs(tmp_path / "config", exist_ok=True)
+        if funds is not None:
+            (tmp_path / "config" / "funds.txt").write_text(
+                "# 用户名,基金代码,买入日期,买入金额(元),持仓份额\n" + "".join(f"{row}\n" for row in funds),
+                encoding='utf-8'
+            )
+        client = main.FakeHttpClient(handler)
+        worker = main.ReportWorker(config or make_config(), str(tmp_path), mobile, pc, True, True,
+                                   lambda: client, delta=delta)
+        worker.fake_client = client
+        worker.logs = []
+        worker.log_signal.connect(lambda message, level: worker.logs.append((level, message)))
+        workers.append(worker)
+        return worker
+
+    yield factory
+    for worker in workers:
+        worker.close_network()
+
+
+class PushService:
+    """推送接口替身：Bark、Gotify、企业微信共用 MOCK_URL，按路径区分；down 中的渠道返回失败
+
+    sent 按顺序记录成功发送的消息 (渠道, 目标, 标题, 内容)
+    """
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.sent = []
+        self.attempts = defaultdict(int)
+
+    def channel(self, path):
+        if path.startswith('/cgi-bin/'):
+            return 'wecom'
+        if path in ('/message', '/health'):
+            return 'gotify'
+        return 'bark'
+
+    def __call__(self, method, url, headers, body):
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        channel = self.channel(parts.path)
+        self.attempts[channel] += 1
+        if channel in self.down:
+            if channel == 'wecom':
+                return 200, json.dumps({'errcode': 40001, 'errmsg': "unavailable"}), 'application/json'
+            return 500, b"unavailable", 'text/plain'
+        if parts.path in ('/ping', '/health'):
+            return 200, b"{}", 'application/json'
+        if parts.path == '/cgi-bin/gettoken':
+            return 200, json.dumps({'errcode': 0, 'access_token': "token"}), 'application/json'
+        if parts.path == '/cgi-bin/message/send':
+            data = json.loads(body)
+            title, _, content = data['text']['content'].partition("\n\n")
+            self.sent.append(('wecom', data['touser'], title, content))
+            return 200, json.dumps({'errcode': 0}), 'application/json'
+        if parts.path == '/message':
+            data = json.loads(body)
+            self.sent.append(('gotify', query['token'][0], data['title'], data['message']))
+            return 200, b"{}", 'application/json'
+        if parts.path == '/push':
+            data = json.loads(body)
+            target = ','.join(data['device_keys']) if 'device_keys' in data else data['device_key']
+            self.sent.append(('bark', target, data['title'], data['body']))
+        else:
+            self.sent.append(('bark', unquote(parts.path[1:]), query['title'][0], query['body'][0]))
+        return 200, b'{"code": 200}', 'application/json'
+
+    def messages(self, channel=None):
+        return [(target, title, content) for ch, target, title, content in self.sent if channel in (None, ch)]
+
+
+def push_reports(worker, reports, channels, summary="业绩总结"):
+    """按推送阶段的方式读取路由表并推送客户报告 [(客户, 内容)]，返回推送失败的客户"""
+    worker.routes = worker.load_routes()
+    worker.progress.begin('push', len(reports) + 1)
+    user_reports = [{'user': user, 'content': content} for user, content in reports]
+    return worker.run_async(worker.push_reports(user_reports, summary, channels))
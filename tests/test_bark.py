@@ -0,0 +1,74 @@
+import json
+
+import main
+from conftest import MOCK_URL, PushService, make_config
+
+
+def bark_worker(make_worker, service, token="k1, k2", **push):
+    config = make_config(push=push)
+    config['advanced']['bark_token'] = token
+    return make_worker(service, config=config)
+
+
+def test_bark_payload_and_device_keys():
+    assert main.bark_device_keys(" k1, ,k2,") == ["k1", "k2"]
+    assert main.bark_payload("标题", "内容", ["k1"]) == {"title": "标题", "body": "内容", "device_key": "k1"}
+    assert main.bark_payload("标题", "内容", ["k1", "k2"]) == \
+        {"title": "标题", "body": "内容", "device_keys": ["k1", "k2"]}
+
+
+def test_post_sends_one_batched_json_request(make_worker):
+    requests = []
+    service = PushService()
+
+    def handler(method, url, headers, body):
+        requests.append((method, url, headers, body))
+        return service(method, url, headers, body)
+
+    worker = bark_worker(make_worker, handler)
+    assert worker.run_async(worker.send_bark_notification("标题", "内容 & 100%"))
+    [(method, url, headers, body)] = requests
+    assert (method, url) == ('POST', f"{MOCK_URL}/push")
+    assert headers['Content-Type'] == 'application/json; charset=utf-8'
+    assert json.loads(body) == {"title": "标题", "body": "内容 & 100%", "device_keys": ["k1", "k2"]}
+    assert "内容".encode('utf-8') in body  # 非 ASCII 字符按 UTF-8 原样发送
+
+
+def test_unbatched_post_and_get_send_per_device(make_worker):
+    service = PushService()
+    worker = bark_worker(make_worker, service, bark_batch='0')
+    assert worker.run_async(worker.send_bark_notification("标题", "内容"))
+    assert sorted(target for target, _, _ in service.messages('bark')) == ["k1", "k2"]
+
+    service = PushService()
+    worker = bark_worker(make_worker, service, bark_method='get')
+    assert not worker.bark_batch  # GET 接口不支持批量
+    assert worker.run_async(worker.send_bark_notification("标题", "内容 & 100%"))
+    assert sorted(service.messages('bark')) == [("k1", "标题", "内容 & 100%"), ("k2", "标题", "内容 & 100%")]
+    assert all(method == 'GET' for method, _ in worker.fake_client.requests)
+
+
+def test_post_budget_fits_batched_request_body(make_worker):
+    service = PushService()
+    worker = bark_worker(make_worker, service, token="k" * 40 + ",k2", channel_max_bytes='bark=600')
+    content = "\n".join(f"基金{i} \"名称\"\n├ 净值 1.{i}" for i in range(60))
+    pages = worker.split_long_content(content, (True, False, False))
+    assert len(pages) > 1
+    for page in pages:
+        body = json.dumps(main.bark_payload(main.PAGE_TITLE_RESERVE, page, ["k" * 40, "k2"]), ensure_ascii=False)
+        assert len(body.encode('utf-8')) <= 600
+
+
+def test_post_only_pages_use_the_bark_limit_instead_of_max_message_bytes(make_worker):
+    content = "\n".join(f"{i}️⃣ 华夏成长混合{i} | 0000{i:02d}\n├ 购买日期:2024-01-02\n└ 收益率:+1.{i}%" for i in range(80))
+    post = bark_worker(make_worker, PushService(), token="k1")
+    get = bark_worker(make_worker, PushService(), token="k1", bark_method='get')
+    bark_only = (True, False, False)
+    post_pages = post.split_long_content(content, bark_only)
+    get_pages = get.split_long_content(content, bark_only)
+    assert len(post_pages) < len(get_pages)
+    assert max(len(page.encode('utf-8')) for page in post_pages) > post.max_message_bytes
+    assert "\n".join(post_pages) == "\n".join(get_pages) == content
+    # 同时启用没有单独上限的 Gotify 时仍受 max_message_bytes 约束
+    assert all(len(page.encode('utf-8')) <= post.max_message_bytes
+               for page in post.split_long_content(content, (True, True, False)))
@@ -0,0 +1,40 @@
+import csv
+
+import benchmark
+import main
+
+
+def test_generate_funds_file_rows_are_valid(tmp_path):
+    path = tmp_path / "funds.txt"
+    benchmark.generate_funds_file(str(path), rows=500, users=40, funds=25)
+    with open(path, encoding='utf-8', newline='') as f:
+        lines = f.read().splitlines()
+    assert lines[0].startswith("#")
+    rows = list(csv.reader(lines[1:]))
+    assert len(rows) == 500
+    assert all(main.validate_fund_row(row) is None for row in rows)
+    assert len({row[0] for row in rows}) == 40
+    assert len({row[1] for row in rows}) <= 25
+
+
+def test_pipeline_runs_against_mock_server_with_injected_failures(qt_app):
+    result = benchmark.run_pipeline(200, 20, 10, failure_rates={'fundgz': 1.0}, mobile=True)
+    assert result['errors'] == []
+    assert set(result['stages']) >= {'parse', 'fetch', 'compute', 'write', 'push'}
+    server = result['server']
+    # fundgz 全部失败时改从 esongfund 查询
+    assert server['fundgz']['requests'] == server['fundgz']['failures'] == 10
+    assert server['esongfund']['requests'] >= 10 and server['esongfund']['failures'] == 0
+    assert server['bark']['requests'] > 0
+    assert result['peak_rss_mb'] is None or result['peak_rss_mb'] > 0
+
+
+def test_pipeline_delta_runs_refetch_only_lagging_funds(qt_app):
+    result = benchmark.run_pipeline(400, 30, 100, delta=0.3, fake_network=True)
+    first, second = result['runs']
+    assert not first['delta'] and second['delta']
+    # 基金代码后三位小于300的基金第一次运行时仍是上一交易日的净值，增量运行只查询这些基金
+    lagging = {benchmark.synthetic_fund_code(i) for i in range(100)
+               if int(benchmark.synthetic_fund_code(i)) % 1000 < 300}
+    assert 0 < second['server']['fundgz']['requests'] <= len(lagging) < first['server']['fundgz']['requests']
+    assert second['updated_funds'] == second['server']['fundgz']['requests']
@@ -0,0 +1,81 @@
+import json
+
+from benchmark import pingzhongdata_body
+from conftest import make_config
+from main import HttpResponse, content_hash
+
+FUNDGZ = 'jsonpgz({"fundcode":"000001","name":"华夏成长","jzrq":"2026-10-16","dwjz":"1.2345","jzzl":"0.5"});'
+
+
+def fundgz_handler(seen, etag='"v1"', changed=False):
+    def handler(method, url, headers, body):
+        seen.append(dict(headers))
+        if headers.get('If-None-Match') == etag and not changed:
+            return 304, b"", 'text/plain'
+        content = FUNDGZ.replace("1.2345", "1.3000") if changed else FUNDGZ
+        return HttpResponse(200, {'content-type': 'application/javascript', 'etag': etag},
+                            content.encode('utf-8'), url)
+    return handler
+
+
+def test_not_modified_response_reuses_parsed_result(make_worker):
+    seen = []
+    worker = make_worker(fundgz_handler(seen))
+    first = worker.run_async(worker.get_fund_info("000001"))
+    second = worker.run_async(worker.get_fund_info("000001"))
+    assert first == second and first['nav'] == 1.2345 and first['source'] == 1
+    assert 'If-None-Match' not in seen[0] and seen[1]['If-None-Match'] == '"v1"'
+    assert worker.metrics.counter_total('fetch_conditional_total', result='not_modified') == 1
+
+
+def test_unchanged_body_without_validators_is_not_parsed_again(make_worker):
+    worker = make_worker(fundgz_handler([], etag=''))
+    worker.run_async(worker.get_fund_info("000001"))
+    worker.run_async(worker.get_fund_info("000001"))
+    assert worker.metrics.counter_total('fetch_conditional_total', result='unchanged') == 1
+
+
+def test_changed_response_is_parsed_and_cache_persisted(make_worker, tmp_path):
+    worker = make_worker(fundgz_handler([]))
+    worker.run_async(worker.get_fund_info("000001"))
+    worker.fake_client.handler = fundgz_handler([], changed=True)
+    assert worker.run_async(worker.get_fund_info("000001"))['nav'] == 1.3
+    assert worker.metrics.counter_total('fetch_conditional_total', result='modified') == 1
+    worker.nav_cache.save()
+    saved = json.loads((tmp_path / "cache" / "nav_responses.json").read_text(encoding='utf-8'))
+    assert saved['fundgz']["000001"]['info']['nav'] == 1.3
+
+
+def test_conditional_requests_can_be_disabled(make_worker):
+    seen = []
+    worker = make_worker(fundgz_handler(seen), config=make_config(cache={'conditional_requests': '0'}))
+    worker.run_async(worker.get_fund_info("000001"))
+    worker.run_async(worker.get_fund_info("000001"))
+    assert all('If-None-Match' not in headers for headers in seen)
+
+
+def pingzhongdata_handler(nav):
+    points = [{'x': 1760400000000, 'y': 1.2}, {'x': 1760572800000, 'y': nav}]
+    body = pingzhongdata_body("000001", points).encode('utf-8')
+
+    def handler(method, url, headers, request_body):
+        if '/pingzhongdata/' in url:
+            return HttpResponse(200, {'content-type': 'application/javascript'}, body, url)
+        return 404, b"", 'text/plain'
+    return handler, body
+
+
+def test_streamed_pingzhongdata_body_is_hashed_while_parsing(make_worker):
+    handler, body = pingzhongdata_handler(1.25)
+    worker = make_worker(handler)
+    first = worker.run_async(worker.get_fund_info("000001"))
+    assert first['source'] == 3 and first['nav'] == 1.25
+    entry = worker.nav_cache.get('pingzhongdata', "000001")
+    assert entry['hash'] == content_hash(body)  # 流式读取时 content 为空，哈希来自解析器读取的字节
+
+    assert worker.run_async(worker.get_fund_info("000001")) == first
+    assert worker.metrics.counter_total('fetch_conditional_total', result='unchanged') == 1
+
+    worker.fake_client.handler, _ = pingzhongdata_handler(1.3)
+    assert worker.run_async(worker.get_fund_info("000001"))['nav'] == 1.3
+    assert worker.metrics.counter_total('fetch_conditional_total', result='modified') == 1
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+import main
+from conftest import PushService, make_config
+
+ALL = (True, True, True)
+
+
+def test_channel_health_marks_down_after_consecutive_failures():
+    health = main.ChannelHealth(down_after=2)
+    assert not health.record('bark', False)
+    assert not health.record('bark', True)  # 成功后重新计数
+    assert not health.record('bark', False)
+    assert health.record('bark', False)
+    assert health.is_down('bark') and not health.record('bark', False)  # 只在判定时返回 True
+    health.reset('bark')
+    assert not health.is_down('bark')
+    health.mark_down('gotify')
+    assert health.is_down('gotify')
+    assert main.ChannelHealth(down_after=0).down_after == 1
+
+
+def push_worker(make_worker, policy, service, **push):
+    return make_worker(service, config=make_config(push=dict(delivery=policy, **push)))
+
+
+def test_fallback_stops_at_first_successful_channel(make_worker):
+    service = PushService(down={'bark'})
+    worker = push_worker(make_worker, 'fallback', service)
+    assert worker.run_async(worker.push_message("标题", "内容", ALL))
+    assert [channel for channel, *_ in service.sent] == ['gotify']
+    assert worker.metrics.counter_total('push_delivery_total', channel='bark', result='failed') == 1
+
+
+def test_fanout_sends_to_every_channel(make_worker):
+    service = PushService(down={'wecom'})
+    worker = push_worker(make_worker, 'fanout', service)
+    assert worker.run_async(worker.push_message("标题", "内容", ALL))
+    assert sorted(channel for channel, *_ in service.sent) == ['bark', 'gotify']
+
+
+def test_race_cancels_slower_channels(make_worker):
+    service = PushService()
+
+    async def handler(method, url, headers, body):
+        if '/cgi-bin/' not in url:
+            await asyncio.sleep(1)
+        return service(method, url, headers, body)
+
+    worker = push_worker(make_worker, 'race', handler)
+    assert worker.run_async(worker.push_message("标题", "内容", ALL))
+    assert [channel for channel, *_ in service.sent] == ['wecom']
+    assert worker.metrics.counter_total('push_delivery_total', policy='race', result='cancelled') == 2
+
+
+@pytest.mark.parametrize("policy", main.DELIVERY_POLICIES)
+def test_down_channel_is_skipped_without_retries(make_worker, policy):
+    service = PushService(down={'bark'})
+    config = make_config(push={'delivery': policy, 'channel_down_after': '2'})
+    config['advanced']['max_retries'] = '5'
+    worker = make_worker(service, config=config)
+    channels = (True, True, False)
+    for _ in range(3):
+        assert worker.run_async(worker.push_message("标题", "内容", channels))
+    # 连续两次请求失败后不再等待重试，之后的消息直接跳过该渠道
+    assert service.attempts['bark'] == 2
+    assert worker.channel_health.is_down('bark')
+    assert worker.metrics.counter_total('push_delivery_total', channel='bark', result='skipped') >= 1
+    assert any("bark 连续2次请求失败" in message for _, message in worker.logs)
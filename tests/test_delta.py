@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import main
+
+
+def nav(code, nav_date, value=1.0, valid=True):
+    return {'code': code, 'name': f"基金{code}", 'nav_date': nav_date, 'nav': value, 'change': "0.1",
+            'valid': valid, 'source': 1}
+
+
+def failed(code):
+    return {'code': code, 'name': f"查询失败({code})", 'nav_date': "", 'nav': 0.0, 'change': "N/A",
+            'valid': False, 'source': 0}
+
+
+def prepare(worker, previous, fetched, expected="2026-10-09"):
+    worker.nav_checked_at = datetime(2026, 10, 9, 20, 0)
+    for code, info in previous.items():
+        worker.expected_navs[code] = (expected, info)
+    worker.fund_data.update(fetched)
+    worker.track_nav_updates(list(previous))
+
+
+def test_track_nav_updates_classifies_funds(make_worker):
+    worker = make_worker(lambda *args: (404, b"", "text/plain"), delta=True)
+    prepare(worker, {
+        "000001": nav("000001", "2026-10-08"),
+        "000002": nav("000002", "2026-10-08"),
+        "000003": None,
+    }, {
+        "000001": nav("000001", "2026-10-09", 1.1),
+        "000002": nav("000002", "2026-10-08"),
+        "000003": nav("000003", "2026-10-08"),
+    })
+    assert worker.updated_codes == {"000001", "000003"}
+    assert worker.behind_codes == ["000002", "000003"]
+
+
+def test_delta_fetch_failure_keeps_previous_nav(make_worker):
+    worker = make_worker(lambda *args: (404, b"", "text/plain"), delta=True)
+    previous = nav("000001", "2026-10-08")
+    prepare(worker, {"000001": previous, "000002": None},
+            {"000001": failed("000001"), "000002": failed("000002")})
+    assert worker.fund_data["000001"] == previous
+    assert not worker.fund_data["000002"]['valid']  # 没有缓存可沿用
+    assert worker.updated_codes == set()
+    assert worker.behind_codes == ["000001", "000002"]
+    assert any("沿用上次查询的净值" in message for _, message in worker.logs)
+
+
+def test_full_run_reports_fetch_failure(make_worker):
+    worker = make_worker(lambda *args: (404, b"", "text/plain"))
+    prepare(worker, {"000001": nav("000001", "2026-10-08")}, {"000001": failed("000001")})
+    assert not worker.fund_data["000001"]['valid']
+    assert worker.behind_codes == ["000001"]
+
+
+def test_fetch_funds_falls_back_when_every_source_fails(make_worker):
+    worker = make_worker(lambda *args: (500, b"", "text/plain"), delta=True)
+    previous = nav("000001", "2026-10-08")
+    prepare(worker, {"000001": previous}, {})
+    worker.progress.begin('fetch', 1)
+    worker.run_async(worker.fetch_funds(["000001"]))
+    worker.track_nav_updates(["000001"])
+    assert worker.fake_client.requests  # 每个接口都查询过
+    assert worker.fund_data["000001"] == previous
+    assert worker.behind_codes == ["000001"] and not worker.updated_codes
+
+
+def test_delta_rows_selects_whole_portfolio_of_updated_users(make_worker):
+    worker = make_worker(lambda *args: (404, b"", "text/plain"), delta=True)
+    worker.updated_codes = {"000001"}
+    rows = [("张三", "000001"), ("张三", "000002"), ("李四", "000002"), ("王五", "000001")]
+    assert worker.delta_rows(rows) == [("张三", "000001"), ("张三", "000002"), ("王五", "000001")]
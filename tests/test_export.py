@@ -0,0 +1,77 @@
+import json
+import math
+import os
+
+import main
+
+RECORDS = [
+    {'username': "张三", 'code': "000001", 'name': "华夏成长😀", 'buy_date': "2024-01-02", 'buy_amount': 10000.5,
+     'shares': 8000.25, 'nav': 1.2345, 'nav_date': "2025-06-30", 'nav_source': 1, 'current_value': 9876.0,
+     'profit': -124.5, 'return_absolute': -1.245, 'return_annualized': -0.8, 'valid': True},
+    {'username': "Émile", 'code': "110022", 'name': "易方达消费行业", 'buy_date': "2023-12-31", 'buy_amount': 5000.0,
+     'shares': 0.0, 'nav': None, 'nav_date': "", 'nav_source': 0, 'current_value': None,
+     'profit': None, 'return_absolute': None, 'return_annualized': None, 'valid': False},
+    {'username': "张三", 'code': "110022", 'name': "易方达消费行业", 'buy_date': "2022-05-06", 'buy_amount': 1.0,
+     'shares': 1.0, 'nav': 2.0, 'nav_date': "2025-06-30", 'nav_source': 3, 'current_value': 2.0,
+     'profit': 1.0, 'return_absolute': 100.0, 'return_annualized': 33.3, 'valid': True},
+]
+
+
+def export(tmp_path, records):
+    exporter = main.ResultExporter(str(tmp_path), "20250630_200000")
+    for record in records:
+        exporter.add(record)
+    return exporter.close()
+
+
+def same(value, expected):
+    return math.isnan(value) if expected is None else value == expected
+
+
+def test_jsonl_round_trip(tmp_path):
+    stats = export(tmp_path, RECORDS)
+    path = tmp_path / "20250630_200000.jsonl"
+    assert stats['rows'] == 3 and stats['jsonl_bytes'] == path.stat().st_size
+    text = path.read_text(encoding='utf-8')
+    assert "华夏成长😀" in text  # 非 ASCII 字符原样写出，不转义
+    assert [json.loads(line) for line in text.splitlines()] == RECORDS
+
+
+def test_columnar_round_trip(tmp_path):
+    stats = export(tmp_path, RECORDS)
+    path = str(tmp_path / "20250630_200000.frcol")
+    assert stats['columnar_bytes'] == os.path.getsize(path)
+    header, columns = main.read_columnar_export(path)
+    assert (header['rows'], header['run_ts']) == (3, "20250630_200000")
+    assert [column['name'] for column in header['columns']] == [name for name, _ in main.EXPORT_COLUMNS]
+    for name, col_type in main.EXPORT_COLUMNS:
+        values = list(columns[name])
+        expected = [record[name] for record in RECORDS]
+        if col_type == 'date':
+            expected = [int(value.replace('-', '')) if value else 0 for value in expected]
+        elif col_type == 'i1':
+            expected = [int(value) for value in expected]
+        assert len(values) == 3
+        assert all(same(value, want) for value, want in zip(values, expected)), name
+
+    header, encoded = main.read_columnar_export(path, columns={'username', 'nav'}, decode_strings=False)
+    assert set(encoded) == {'username', 'nav'}
+    dictionary = next(column['dictionary'] for column in header['columns'] if column['name'] == 'username')
+    assert dictionary == ["张三", "Émile"] and list(encoded['username']) == [0, 1, 0]
+
+
+def test_empty_export_round_trip(tmp_path):
+    stats = export(tmp_path, [])
+    assert stats['rows'] == 0
+    assert (tmp_path / "20250630_200000.jsonl").read_bytes() == b""
+    header, columns = main.read_columnar_export(str(tmp_path / "20250630_200000.frcol"))
+    assert header['rows'] == 0
+    assert all(len(values) == 0 for values in columns.values())
+    assert all(column['dictionary'] == [] for column in header['columns'] if column['type'] == 'str')
+
+
+def test_abort_removes_temporary_files(tmp_path):
+    exporter = main.ResultExporter(str(tmp_path), "20250630_200000")
+    exporter.add(RECORDS[0])
+    exporter.abort()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,76 @@
+import json
+import os
+
+import main
+
+ESONGFUND = {'code': 200, 'data': {'fundName': "模拟债券", 'netValueDate': "2026-10-16", 'netValue': "1.0502",
+                                   'dayGrowth': "0.02", 'fundType': "债券型"}}
+
+
+def nav(source, name="模拟基金", nav_date="2026-10-09", valid=True):
+    return {'code': "000001", 'name': name, 'nav_date': nav_date, 'nav': 1.2345, 'change': "0.1",
+            'valid': valid, 'source': source}
+
+
+def test_metadata_store_persists_and_reloads(tmp_path):
+    path = str(tmp_path / "cache" / "fund_meta.json")
+    now = [1000.0]
+    store = main.FundMetadataStore(path, refresh_days=7, clock=lambda: now[0]).load()
+    assert store.entries == {} and not os.path.exists(path)
+    store.record("000001", nav(2))
+    store.record("000002", dict(nav(3, name="封闭基金" + main.CLOSED_FUND_SUFFIX), code="000002"))
+    store.set_type("000002", "")
+    store.save()
+
+    reloaded = main.FundMetadataStore(path, refresh_days=7, clock=lambda: now[0]).load()
+    assert reloaded.entries == store.entries and not reloaded.dirty
+    assert reloaded.preferred_source("000001") == 2 and reloaded.preferred_source("000002") == 3
+    assert reloaded.name("000002") == "封闭基金" and reloaded.entries["000002"]['closed']
+    assert not reloaded.needs_type("000002")
+    assert reloaded.latest_nav("000001") == nav(2)
+
+    now[0] += 8 * 86400  # 超过有效期：重新探测，但名称和最近净值仍可用
+    assert reloaded.preferred_source("000001") is None
+    assert reloaded.name("000001") == "模拟基金" and reloaded.latest_nav("000001") is not None
+
+
+def test_metadata_store_writes_only_when_changed(tmp_path):
+    path = tmp_path / "fund_meta.json"
+    store = main.FundMetadataStore(str(path))
+    store.record("000001", nav(1))
+    store.save()
+    path.unlink()
+    store.record("000001", nav(1))  # 有效期内内容相同，不算变化
+    store.save()
+    assert not path.exists()
+    store.record("000001", nav(1, nav_date="2026-10-12"))
+    store.save()
+    assert json.loads(path.read_text(encoding='utf-8'))["000001"]['latest']['nav_date'] == "2026-10-12"
+
+
+def test_metadata_store_ignores_corrupt_file(tmp_path):
+    path = tmp_path / "fund_meta.json"
+    path.write_text("{不是 JSON", encoding='utf-8')
+    store = main.FundMetadataStore(str(path)).load()
+    assert store.entries == {} and store.preferred_source("000001") is None
+
+
+def test_next_run_starts_with_last_successful_source(make_worker, tmp_path):
+    def handler(method, url, headers, body):
+        if '/getFundBaseInfo' in url:
+            return 200, json.dumps(ESONGFUND), 'application/json'
+        return 404, b"", 'text/plain'
+
+    worker = make_worker(handler)
+    worker.fund_metadata.load()
+    info = worker.run_async(worker.get_fund_info("000001"))
+    worker.save_fund_metadata()
+    assert (info['name'], info['source']) == ("模拟债券", 2)
+    assert [url.split('/')[3] for _, url in worker.fake_client.requests] == ['js', 'eap']
+    assert (tmp_path / "cache" / "fund_meta.json").exists()
+
+    rerun = make_worker(handler)
+    rerun.fund_metadata.load()
+    assert rerun.fund_metadata.nav_lag("000001") == 0 and rerun.fund_metadata.entries["000001"]['type'] == "债券型"
+    rerun.run_async(rerun.get_fund_info("000001"))
+    assert [url.split('/')[3] for _, url in rerun.fake_client.requests] == ['eap']  # 直接查询上次成功的接口
@@ -0,0 +1,104 @@
+import re
+
+import pytest
+from PyQt5.QtGui import QColor
+from PyQt5.QtTest import QTest
+from PyQt5.QtWidgets import QStatusBar, QTextEdit
+
+import main
+
+
+class ListLogger:
+    """代替文件 logger，记录写入的每一行"""
+
+    def __init__(self):
+        self.lines = []
+
+    def info(self, line):
+        self.lines.append(line)
+
+
+@pytest.fixture
+def sink_factory(qt_app):
+    widgets = []
+
+    def factory(max_lines=5000, interval_ms=100):
+        log_area, status_bar = QTextEdit(), QStatusBar()
+        widgets.append((log_area, status_bar))
+        sink = main.LogSink(log_area, status_bar, max_lines, interval_ms)
+        sink.set_file_logger(ListLogger())
+        return sink
+
+    yield factory
+    for log_area, status_bar in widgets:
+        log_area.deleteLater()
+        status_bar.deleteLater()
+
+
+def lines(sink):
+    return sink.log_area.toPlainText().split("\n")
+
+
+def test_messages_are_batched_until_flush(sink_factory):
+    sink = sink_factory()
+    sink.write("开始生成基金报告...")
+    sink.write("查询失败", "error")
+    assert sink.log_area.toPlainText() == "" and sink.timer.isActive()
+
+    sink.flush()
+    assert not sink.timer.isActive()
+    shown = lines(sink)
+    assert [line.split("] ", 1)[1] for line in shown] == ["[信息] 开始生成基金报告...", "[错误] 查询失败"]
+    assert re.match(r"\[\d{2}:\d{2}:\d{2}\] ", shown[0])
+    assert sink.status_bar.currentMessage() == "最新状态: 查询失败"
+    assert [line.split(" ", 2)[2] for line in sink.file_logger.lines] == \
+        ["[信息] 开始生成基金报告...", "[错误] 查询失败"]
+
+    sink.flush()  # 没有新日志时不做任何事
+    assert len(lines(sink)) == 2
+
+
+def test_timer_flushes_after_interval(sink_factory):
+    sink = sink_factory(interval_ms=10)
+    sink.write("第一条")
+    sink.write("第二条", "success")
+    QTest.qWait(100)
+    assert len(lines(sink)) == 2 and not sink.pending
+    assert sink.status_bar.currentMessage() == "最新状态: 第二条"
+
+
+def test_log_area_keeps_only_latest_lines(sink_factory):
+    sink = sink_factory(max_lines=5)
+    for batch in (range(3), range(3, 7)):
+        for i in batch:
+            sink.write(f"消息{i}")
+        sink.flush()
+    assert [line.rsplit(" ", 1)[1] for line in lines(sink)] == ["消息2", "消息3", "消息4", "消息5", "消息6"]
+    assert sink.log_area.document().blockCount() == 5
+    assert len(sink.file_logger.lines) == 7  # 日志文件保留全部内容
+
+
+def test_oversized_batch_is_skipped_with_notice(sink_factory):
+    sink = sink_factory(max_lines=5)
+    for i in range(12):
+        sink.write(f"消息{i}", "warning" if i % 2 else "info")
+    sink.flush()
+    shown = lines(sink)
+    assert shown[0] == "…… 省略 8 条日志（完整内容见日志文件）"
+    assert [line.rsplit(" ", 1)[1] for line in shown[1:]] == ["消息8", "消息9", "消息10", "消息11"]
+    assert len(sink.file_logger.lines) == 12
+    assert sink.status_bar.currentMessage() == "最新状态: 消息11"
+
+
+def test_lines_are_coloured_by_level(sink_factory):
+    sink = sink_factory()
+    sink.write("出错了", "error")
+    sink.write("完成", "success")
+    sink.flush()
+    block = sink.log_area.document().firstBlock()
+    colours = []
+    while block.isValid():
+        colours.append(block.begin().fragment().charFormat().foreground().color())
+        block = block.next()
+    assert colours == [QColor("#e74c3c"), QColor("#27ae60")]
+    assert sink.char_format('error') is sink.char_format('error')  # 同一级别的格式只创建一次
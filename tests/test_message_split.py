@@ -0,0 +1,70 @@
+import json
+from urllib.parse import quote
+
+import pytest
+
+import main
+from conftest import make_config
+
+SAMPLES = ["ascii text", "基金净值 ├ 明细", "emoji 📈 \"quoted\"\\\n\ttab", "\x01控制字符"]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_wire_costs_match_real_encodings(text):
+    assert main.WIRE_COSTS['utf8'].measure(text) == len(text.encode('utf-8'))
+    assert main.WIRE_COSTS['url'].measure(text) == len(quote(text, safe=''))
+    assert main.WIRE_COSTS['json'].measure(text) == len(json.dumps(text)) - 2
+    assert main.WIRE_COSTS['json_utf8'].measure(text) == \
+        len(json.dumps(text, ensure_ascii=False).encode('utf-8')) - 2
+
+
+def test_message_blocks_keep_fund_details_together():
+    content = "基金A\n├ 净值 1.0\n└ 收益 10\n\n基金B\n- 明细\n总计"
+    assert main.message_blocks(content) == ["基金A\n├ 净值 1.0\n└ 收益 10\n", "基金B\n- 明细", "总计"]
+
+
+def report(funds):
+    return "\n".join(f"基金{i} 标题\n├ 明细一 {i}\n└ 明细二 {i}" for i in range(funds))
+
+
+def test_split_message_respects_every_budget_and_keeps_blocks_whole():
+    content = report(30)
+    budgets = [(main.WIRE_COSTS['utf8'], 300), (main.WIRE_COSTS['url'], 600)]
+    pages = main.split_message(content, budgets)
+    assert len(pages) > 1 and "\n".join(pages) == content
+    for page in pages:
+        assert len(page.encode('utf-8')) <= 300 and len(quote(page, safe='')) <= 600
+        assert page.startswith("基金") and page.count("├") == page.count("└")
+
+
+def test_split_message_splits_oversized_lines_by_character():
+    content = "长" * 500
+    pages = main.split_message(content, [(main.WIRE_COSTS['utf8'], 100)])
+    assert "".join(pages) == content
+    assert max(len(page.encode('utf-8')) for page in pages) <= 100
+
+
+def test_parse_channel_limits_ignores_invalid_items():
+    assert main.parse_channel_limits("bark=8000, WeCom=2048,gotify=abc,sms=10,") == {'bark': 8000, 'wecom': 2048}
+
+
+def test_channel_limits_default_when_config_lacks_option(make_worker):
+    # 随仓库提供的 config.ini 没有 [push] 节，读取时回退到 DEFAULT_CONFIG 的取值
+    config = make_config()
+    config.remove_option('push', 'channel_max_bytes')
+    worker = make_worker(lambda *args: (404, b"", "text/plain"), config=config)
+    assert worker.channel_max_bytes == {'bark': 8000, 'wecom': 2048}
+
+
+def test_message_budgets_fit_the_whole_request(make_worker):
+    config = make_config(push={'channel_max_bytes': 'bark=1000,gotify=900,wecom=500', 'bark_method': 'get'})
+    worker = make_worker(lambda *args: (404, b"", "text/plain"), config=config)
+    budgets = worker.message_budgets((True, True, True))
+    pages = main.split_message(report(40), budgets)
+    assert len(pages) > 1
+    for page in pages:
+        title = main.PAGE_TITLE_RESERVE
+        url = f"{config['advanced']['bark_url']}/device?title={quote(title, safe='')}&body={quote(page, safe='')}"
+        assert len(url) <= 1000
+        assert len(json.dumps({"title": title, "message": page, "priority": 5})) <= 900
+        assert len(f"{title}\n\n{page}".encode('utf-8')) <= 500
@@ -0,0 +1,52 @@
+import main
+
+EXPECTED = """\
+# HELP fundreport_custom_total custom_total
+# TYPE fundreport_custom_total counter
+fundreport_custom_total{path="a\\"b\\\\c\\nd"} 2
+# HELP fundreport_fetch_seconds 净值接口请求耗时（秒）
+# TYPE fundreport_fetch_seconds histogram
+fundreport_fetch_seconds_bucket{source="fundgz",le="0.1"} 1
+fundreport_fetch_seconds_bucket{source="fundgz",le="1"} 2
+fundreport_fetch_seconds_bucket{source="fundgz",le="+Inf"} 3
+fundreport_fetch_seconds_sum{source="fundgz"} 3.550000
+fundreport_fetch_seconds_count{source="fundgz"} 3
+# HELP fundreport_fund_nav_behind 本次查询后净值仍落后于预期日期的基金数
+# TYPE fundreport_fund_nav_behind gauge
+fundreport_fund_nav_behind 4
+# HELP fundreport_rows_total 持仓文件解析行数
+# TYPE fundreport_rows_total counter
+fundreport_rows_total{result="invalid"} 1
+fundreport_rows_total{result="valid"} 3
+"""
+
+
+def sample_registry():
+    metrics = main.MetricsRegistry(buckets=(0.1, 1))
+    metrics.inc('rows_total', 3, result='valid')
+    metrics.inc('rows_total', result='invalid')
+    metrics.inc('custom_total', 2, path='a"b\\c\nd')
+    metrics.set('fund_nav_behind', 4)
+    for seconds in (0.05, 0.5, 3):
+        metrics.observe('fetch_seconds', seconds, source='fundgz')
+    return metrics
+
+
+def test_prometheus_exposition():
+    assert sample_registry().to_prometheus() == EXPECTED
+
+
+def test_merge_adds_counters_and_histograms_and_replaces_gauges():
+    total = sample_registry()
+    run = main.MetricsRegistry(buckets=(0.1, 1))
+    run.inc('rows_total', 2, result='valid')
+    run.set('fund_nav_behind', 1)
+    run.observe('fetch_seconds', 0.01, source='fundgz')
+    total.merge(run)
+    text = total.to_prometheus()
+    assert 'fundreport_rows_total{result="valid"} 5' in text
+    assert "fundreport_fund_nav_behind 1\n" in text
+    assert 'fundreport_fetch_seconds_bucket{source="fundgz",le="0.1"} 2' in text
+    assert 'fundreport_fetch_seconds_count{source="fundgz"} 4' in text
+    assert total.counter_total('rows_total') == 6
+
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+import main
+
+POINTS = [{'x': 1704067200000 + i * 86400000, 'y': round(1 + i * 0.01, 4), 'equityReturn': i % 3,
+           'unitMoney': "每份派现金0.01元" if i == 7 else ""} for i in range(12)]
+POINTS[4]['y'] = None
+BODY = (
+    'var ishb=false;var fS_name = "华夏成长混合";var fS_code = "000001";\n'
+    'var syl_1y="-3.21";var syl_6y="4.56";\n'
+    f'var Data_netWorthTrend = {json.dumps(POINTS, ensure_ascii=False)};\n'
+    'var Data_ACWorthTrend = [[1704067200000,1.5],[1704153600000,1.6]];var Data_grandTotal = [{"name":"华夏"}];'
+).encode('utf-8')
+
+
+def parse(chunks, **kwargs):
+    extractor = main.PingzhongdataExtractor(**kwargs)
+    for chunk in chunks:
+        if extractor.feed(chunk):
+            break
+    else:
+        extractor.close()
+    return extractor
+
+
+def result(extractor):
+    return (extractor.values, list(extractor.points), extractor.point_count, extractor.trend_found, extractor.done,
+            list(extractor.history_x), [repr(y) for y in extractor.history_y])
+
+
+def test_one_shot_parse():
+    extractor = parse([BODY])
+    assert extractor.values == {'fS_name': "华夏成长混合", 'syl_1y': "-3.21"}
+    assert list(extractor.points) == POINTS[-2:]
+    assert extractor.point_count == len(POINTS) and extractor.trend_found and extractor.done
+
+    full = parse([BODY], history=True)
+    assert list(full.history_x) == [point['x'] for point in POINTS]
+    assert repr(full.history_y[4]) == 'nan' and full.history_y[-1] == POINTS[-1]['y']
+
+
+@pytest.mark.parametrize('history', [False, True])
+def test_split_at_every_byte_offset_matches_one_shot(history):
+    expected = result(parse([BODY], history=history))
+    # 分割点覆盖 Data_netWorthTrend 标记内部和多字节 UTF-8 字符内部
+    marker = BODY.index(b"Data_netWorthTrend")
+    multibyte = BODY.index("华".encode('utf-8'))
+    assert 0 < marker < len(BODY) and len("华".encode('utf-8')) == 3
+    for offset in range(len(BODY) + 1):
+        assert result(parse([BODY[:offset], BODY[offset:]], history=history)) == expected, offset
+    for offset in list(range(marker, marker + 20)) + [multibyte + 1, multibyte + 2]:
+        for second in range(offset, offset + 8):
+            chunks = [BODY[:offset], BODY[offset:second], BODY[second:]]
+            assert result(parse(chunks, history=history)) == expected, (offset, second)
+
+
+@pytest.mark.parametrize('history', [False, True])
+def test_byte_by_byte_feed_matches_one_shot(history):
+    chunks = [BODY[i:i + 1] for i in range(len(BODY))]
+    assert result(parse(chunks, history=history)) == result(parse([BODY], history=history))
+
+
+def test_stops_after_trend_without_reading_the_rest():
+    extractor = main.PingzhongdataExtractor()
+    end = BODY.index(b"var Data_ACWorthTrend")
+    assert extractor.feed(BODY[:end])
+    assert extractor.feed(b"never parsed")  # 已完成，忽略后续数据
+    assert extractor.bytes_fed == end
+
+
+def test_missing_trend_and_truncated_body():
+    extractor = parse([b'var fS_name = "\xe5\x8d\x8e', b'\xe5\xa4\x8f";var syl_1y=""; var other = 1;'])
+    assert extractor.values == {'fS_name': "华夏", 'syl_1y': ""}
+    assert not extractor.trend_found and not extractor.done
+
+    truncated = parse([BODY[:BODY.index(b"var Data_ACWorthTrend") - 40]])
+    assert truncated.trend_found and not truncated.done and not truncated.points
@@ -0,0 +1,70 @@
+import main
+
+
+def fund(code, profit, amount, annualized, valid=True):
+    return {'code': code, 'name': f"基金{code}", 'profit': profit, 'buy_amount': amount,
+            'returns': {'annualized': annualized}, 'valid': valid}
+
+
+def snapshot(profit=100.0, ret=10.0, funds=2, reached=None):
+    return {'funds': funds, 'profit': profit, 'return': ret, 'reached': reached or {}}
+
+
+def test_user_position_snapshot_skips_invalid_funds():
+    data = {'funds': [fund("000001", 100, 1000, "+6.00%"), fund("000002", -50, 1000, "+1.00%"),
+                      fund("000003", 0, 500, "未知", valid=False)]}
+    assert main.user_position_snapshot(data, 5.0) == {
+        'funds': 3, 'profit': 50.0, 'return': 2.5, 'reached': {"000001": "基金000001"}
+    }
+    assert main.user_position_snapshot({'funds': []}, 5.0)['return'] is None
+
+
+def test_position_changes_thresholds():
+    previous = snapshot()
+    assert main.position_changes(None, previous, 100, 0.5) == ["首次推送"]
+    assert main.position_changes(previous, snapshot(profit=199.99, ret=10.4), 100, 0.5) == []
+    assert main.position_changes(previous, snapshot(profit=200.0, ret=9.5), 100, 0.5) == \
+        ["持仓收益 +100.00", "收益率 -0.50个百分点"]
+    assert main.position_changes(previous, snapshot(funds=3), 100, 0.5) == ["持仓 2只 → 3只"]
+    assert main.position_changes(previous, snapshot(ret=None), 100, 0.5) == ["收益率无法计算"]
+
+
+def test_position_changes_target_crossings():
+    previous = snapshot(reached={"000001": "基金A"})
+    current = snapshot(reached={"000002": "基金B"})
+    assert main.position_changes(previous, current, 100, 0.5) == ["新达到目标收益: 基金B", "跌破目标收益: 基金A"]
+
+
+def test_render_position_delta():
+    text = main.render_position_delta("张三", "📈", snapshot(ret=None), snapshot(profit=1300.5, ret=12.0),
+                                      ["持仓收益 +1,200.50"])
+    assert text.splitlines() == [
+        "📈 张三 持仓变化", "", "持仓收益: +1,300.50 (上次 +100.00)", "收益率: +12.00% (上次 N/A)", "",
+        "• 持仓收益 +1,200.50",
+    ]
+
+
+def test_push_snapshot_store_saves_only_changes(tmp_path):
+    path = tmp_path / "cache" / "push_snapshots.json"
+    store = main.PushSnapshotStore(str(path)).load()
+    assert store.get("张三") is None
+    store.record("张三", snapshot())
+    store.save()
+    assert main.PushSnapshotStore(str(path)).load().get("张三") == snapshot()
+    mtime = path.stat().st_mtime_ns
+    store.record("张三", snapshot())
+    assert not store.dirty
+    store.save()
+    assert path.stat().st_mtime_ns == mtime
+    path.write_text("{broken", encoding='utf-8')
+    assert main.PushSnapshotStore(str(path)).load().entries == {}
+
+
+def test_diff_positions_selects_changed_users(make_worker):
+    worker = make_worker(lambda *args: (404, b"", "text/plain"))
+    worker.push_snapshots.record("张三", snapshot())
+    worker.push_snapshots.record("李四", snapshot())
+    worker.push_snapshots.save()
+    worker.diff_positions({"张三": snapshot(profit=120.0), "李四": snapshot(profit=500.0), "王五": snapshot()})
+    assert worker.position_changes == {"李四": ["持仓收益 +400.00"], "王五": ["首次推送"]}
+    assert ('info', "持仓变化: 2位客户需要推送, 1位无明显变化") in worker.logs
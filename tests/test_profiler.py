@@ -0,0 +1,44 @@
+import os
+import pstats
+
+import main
+from conftest import make_config
+
+
+def busy_allocation():
+    return [str(i) * 10 for i in range(20000)]
+
+
+def test_run_profiler_writes_profile_and_summary(tmp_path):
+    profiler = main.RunProfiler(str(tmp_path / "profile"), "20260101_150000", top_n=5)
+    profiler.start()
+    kept = busy_allocation()
+    profiler.mark('compute', 0.25)
+    prof_path, summary_path = profiler.stop()
+    assert kept
+
+    assert os.path.basename(prof_path) == "20260101_150000.prof"
+    assert any(name == 'busy_allocation' for _, _, name in pstats.Stats(prof_path).stats)
+    locations = [location for location, *_ in profiler.hot_functions('cumulative', 20)]
+    assert any("busy_allocation" in location for location in locations)
+    assert not any("tracemalloc" in location for location in locations)
+
+    with open(summary_path, encoding='utf-8') as f:
+        summary = f.read()
+    assert summary.startswith("报告运行性能分析 20260101_150000\n")
+    assert "compute        0.250秒" in summary
+    assert "== 阶段 compute 新增内存分配 ==" in summary and "test_profiler.py:" in summary
+    assert not main.tracemalloc.is_tracing()
+
+
+def test_profile_mode_runs_worker_under_profiler(make_worker, tmp_path):
+    handler = lambda *args: (404, b"", 'text/plain')
+    worker = make_worker(handler, config=make_config(advanced={'profile': '1'}), funds=["张三,000001,2024-01-02,1000,800"])
+    worker.run()
+    profile_dir = tmp_path / "report" / "profile"
+    names = sorted(os.listdir(profile_dir))
+    assert len(names) == 2 and names[0].endswith(".prof") and names[1].endswith(".txt")
+    summary = (profile_dir / names[1]).read_text(encoding='utf-8')
+    assert all(f"\n{stage} " in summary for stage in ('parse', 'fetch', 'compute'))
+    assert worker.profiler is None
+    assert any("性能分析结果" in message for _, message in worker.logs)
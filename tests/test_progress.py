@@ -0,0 +1,115 @@
+import threading
+
+import main
+
+FUNDGZ = 'jsonpgz({{"fundcode":"{code}","name":"基金{code}","jzrq":"2026-10-16","dwjz":"1.2345","jzzl":"0.5"}});'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_tracker(interval=0.2):
+    clock = FakeClock()
+    emitted = []
+    return main.ProgressTracker(emitted.append, interval, clock), clock, emitted
+
+
+def test_begin_and_finish_always_emit_and_advance_is_throttled():
+    tracker, clock, emitted = make_tracker()
+    tracker.begin('fetch', 10)
+    for _ in range(5):
+        tracker.advance()  # 距上次回调不足 0.2 秒，只累加
+    assert [p['done'] for p in emitted] == [0]
+    clock.now += 0.2
+    tracker.advance()
+    assert [p['done'] for p in emitted] == [0, 6]
+    tracker.update(8)
+    assert len(emitted) == 2 and tracker.done == 8
+    tracker.finish()
+    last = emitted[-1]
+    assert (last['stage'], last['label'], last['done'], last['total'], last['finished']) == \
+        ('fetch', "获取净值", 10, 10, True)
+    tracker.finish()  # 阶段已结束，不再回调
+    assert len(emitted) == 3
+
+
+def test_rate_and_eta():
+    tracker, clock, emitted = make_tracker()
+    tracker.begin('compute', 100)
+    clock.now += 0.5
+    tracker.advance(10)
+    assert emitted[-1]['rate'] == 20.0
+    assert emitted[-1]['eta'] is None  # 开始不足 1 秒，不估算剩余时间
+    clock.now += 1.5
+    tracker.advance(30)
+    assert emitted[-1]['rate'] == 20.0 and emitted[-1]['eta'] == 3.0
+    assert main.format_progress(emitted[-1]) == "计算收益 40/100 (40%) 20.0项/秒 预计剩余 0:03"
+
+
+def test_update_sets_total_for_stages_sized_later():
+    tracker, clock, emitted = make_tracker()
+    tracker.begin('compute', 0)
+    assert main.format_progress(emitted[-1]) == "计算收益 0/0"
+    clock.now += 1
+    tracker.update(2, 8)
+    assert (emitted[-1]['done'], emitted[-1]['total']) == (2, 8)
+    clock.now += 60
+    tracker.finish()
+    assert main.format_progress(emitted[-1]) == "计算收益 8/8 (100%) 用时 1:01"
+
+
+def test_advance_from_many_threads():
+    tracker, _, emitted = make_tracker(interval=0)
+    tracker.begin('push', 8000)
+
+    def work():
+        for _ in range(1000):
+            tracker.advance()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tracker.done == 8000
+    assert [p['done'] for p in emitted] == sorted(p['done'] for p in emitted)  # 回调在锁内，进度不会倒退
+
+
+def test_format_duration():
+    assert main.format_duration(0) == "0:00"
+    assert main.format_duration(65.4) == "1:05"
+    assert main.format_duration(3725) == "1:02:05"
+
+
+def test_checkpointed_reports_progress_between_chunks():
+    calls = []
+    assert list(main.checkpointed(range(10), calls.append, every=4)) == list(range(10))
+    assert calls == [4, 8]
+
+
+def test_worker_reports_each_stage(make_worker):
+    funds = [f"{user},{code},2024-01-02,1000,800" for user in ("张三", "李四", "王五") for code in ("000001", "000002")]
+
+    def handler(method, url, headers, body):
+        code = url.rsplit("/", 1)[-1].split(".")[0]
+        return 200, FUNDGZ.format(code=code), 'application/javascript'
+
+    worker = make_worker(handler, pc=True, funds=funds)
+    progress = []
+    worker.progress_signal.connect(progress.append)
+    worker.run()
+
+    stages = [p['stage'] for p in progress if p['finished']]
+    assert stages == ['fetch', 'compute', 'write']
+    for p in progress:
+        assert 0 <= p['done'] <= max(p['total'], p['done'])
+        if p['finished']:
+            assert p['done'] == p['total']
+    fetch = [p for p in progress if p['stage'] == 'fetch']
+    assert fetch[0]['done'] == 0 and fetch[-1]['total'] == 2
+    assert [p['total'] for p in progress if p['finished']][:2] == [2, 6]  # 两只基金、六条持仓
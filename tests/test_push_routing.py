@@ -0,0 +1,80 @@
+import main
+from conftest import PushService, make_config, push_reports
+
+
+def write_routes(tmp_path, text):
+    path = tmp_path / "config" / "routes.txt"
+    path.parent.mkdir(exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_load_push_routes(tmp_path):
+    path = write_routes(tmp_path, "\n".join([
+        "# 用户名,渠道,目标",
+        "张三,bark,key1",
+        "张三, Bark ,key1",  # 重复
+        "张三,wecom,zhangsan",
+        "",
+        "李四,sms,123",
+        "李四,gotify,",
+        "李四,gotify,token,extra",
+        "李四,GOTIFY,token",
+    ]))
+    routes, invalid = main.load_push_routes(path)
+    assert routes == {"张三": [('bark', "key1"), ('wecom', "zhangsan")], "李四": [('gotify', "token")]}
+    assert invalid == [6, 7, 8]
+
+
+def test_group_routes_merges_wecom_users_and_skips_disabled_channels():
+    routes = {
+        "张三": [('bark', "k1"), ('wecom', "u1"), ('wecom', "u2"), ('gotify', "t1")],
+        "李四": [('bark', "k1")],
+        "王五": [('gotify', "t1")],
+    }
+    reports = [{'user': user, 'content': user} for user in ("张三", "李四", "王五", "赵六")]
+    groups, unrouted = main.group_routes(reports, routes, (True, False, True))
+    assert {destination: [r['user'] for r in group] for destination, group in groups.items()} == {
+        ('bark', "k1"): ["张三", "李四"], ('wecom', "u1|u2"): ["张三"],
+    }
+    assert [r['user'] for r in unrouted] == ["王五", "赵六"]
+
+
+def test_merge_bark_destinations_only_merges_identical_report_sets():
+    a, b = {'user': "张三"}, {'user': "李四"}
+    groups = {('bark', "k1"): [a, b], ('gotify', "t"): [a], ('bark', "k2"): [a, b], ('bark', "k3"): [a]}
+    merged = main.merge_bark_destinations(groups)
+    assert list(merged) == [('gotify', "t"), ('bark', "k1,k2"), ('bark', "k3")]
+
+
+def test_batch_messages_fills_budget_in_order():
+    budgets = [(main.WIRE_COSTS['utf8'], 20)]
+    items = [("张三", "a" * 8), ("张三", "b" * 8), ("李四", "c" * 8), ("王五", "d" * 30)]
+    assert main.batch_messages(items, budgets) == [
+        ("a" * 8 + "\n\n" + "b" * 8, {"张三"}), ("c" * 8, {"李四"}), ("d" * 30, {"王五"}),
+    ]
+
+
+def test_routed_push_batches_reports_per_recipient(make_worker, tmp_path):
+    write_routes(tmp_path, "张三,bark,k1\n李四,bark,k1\n张三,wecom,u1\n张三,wecom,u2\n")
+    service = PushService()
+    worker = make_worker(service, config=make_config(push={'channel_max_bytes': ''}))
+    failed = push_reports(worker, [("张三", "张三的报告"), ("李四", "李四的报告"), ("王五", "王五的报告")],
+                          (True, False, True))
+    assert failed == []
+    assert worker.pushed_users == {"张三", "李四", "王五"}
+    assert service.messages('wecom') == [("u1|u2", "净值推送报告[1/1]", "张三的报告")]
+    # 不同收件人之间并发发送；业绩总结在全部客户报告之后发送
+    assert sorted(service.messages('bark')[:2]) == [
+        ("device", "净值推送报告[1/1]", "王五的报告"),  # 没有路由的客户推送到全局配置的目标
+        ("k1", "净值推送报告[1/1]", "张三的报告\n\n李四的报告"),
+    ]
+    assert service.messages('bark')[2:] == [("device", "业绩达标总结[1/1]", "业绩总结")]
+
+
+def test_routed_push_failure_marks_only_that_recipients_users(make_worker, tmp_path):
+    write_routes(tmp_path, "张三,gotify,t1\n李四,bark,k1\n")
+    worker = make_worker(PushService(down={'gotify'}))
+    failed = push_reports(worker, [("张三", "张三的报告"), ("李四", "李四的报告")], (True, True, False))
+    assert failed == ["张三"]
+    assert worker.pushed_users == {"李四"}
@@ -0,0 +1,57 @@
+import pytest
+
+import main
+from benchmark import LegacyStringReports, build_synthetic_book
+from conftest import make_config
+
+TIME_STR = "2025-06-30 20:00"
+
+
+@pytest.fixture(scope='module')
+def book():
+    return build_synthetic_book(holdings=400, users=25, funds=30)
+
+
+def test_text_output_is_byte_identical_to_legacy_reports(book):
+    user_data, fund_holdings = book
+    legacy = LegacyStringReports()
+    renderer = main.ReportRenderer('text')
+    for user, data in user_data.items():
+        assert renderer.render_user_push(user, data, '👤').encode('utf-8') == \
+            legacy.generate_user_report(user, data, '👤').encode('utf-8')
+        assert renderer.render_user_file(user, data).encode('utf-8') == \
+            legacy.generate_user_file_report(data).encode('utf-8')
+    for code, holdings in fund_holdings.items():
+        name = holdings[0]['fund_name']
+        assert renderer.render_fund(code, name, holdings).encode('utf-8') == \
+            legacy.generate_fund_report(code, name, holdings).encode('utf-8')
+    for target, failed in ((5.0, None), (5.0, ["张三", "李四"]), (1000.0, None)):
+        assert renderer.render_performance_summary(user_data, target, TIME_STR, failed).encode('utf-8') == \
+            legacy.generate_performance_summary(user_data, target, TIME_STR, failed).encode('utf-8')
+
+
+def test_templates_escape_per_format():
+    data = {'funds': [{'code': "000001", 'name': 'A|B <"基金">', 'buy_date': "2025-01-02", 'buy_amount': 12345.0,
+                       'nav': 1.2345, 'nav_date': "2025-06-30", 'profit': 100.0,
+                       'returns': {'annualized': "+1.00%"}, 'valid': True}]}
+    assert "A\\|B <\"基金\">" in main.ReportRenderer('markdown').render_user_file("张三", data)
+    assert "A|B &lt;&quot;基金&quot;&gt;" in main.ReportRenderer('html').render_user_file("张三", data)
+    assert '<"基金">' in main.ReportRenderer('text').render_user_push("张三", data, '👤')
+
+
+def test_compile_template():
+    render = main.compile_template('{name!e} "{count}"支 {{字面量}} {amount:,.2f}')
+    assert render({'name': "<a>", 'count': 3, 'amount': 1234.5}, lambda value: f"[{value}]") == \
+        '[<a>] "3"支 {字面量} 1,234.50'
+    for source in ("{d['name']}", "{fund.name}", "{name!r}", "{amount:{width}}"):
+        with pytest.raises(ValueError):
+            main.compile_template(source)
+
+
+def test_unknown_output_format_falls_back_to_text(make_worker):
+    worker = make_worker(lambda *args: (404, b"", 'text/plain'), config=make_config(output={'format': "PDF"}))
+    assert worker.file_renderer.fmt == 'text'
+    worker.generate_reports()  # 没有持仓文件，只记录日志
+    assert any(level == 'warning' and "未知的报告格式 pdf" in message for level, message in worker.logs)
+    assert make_worker(lambda *args: None, config=make_config(output={'format': " Markdown "})).file_renderer.fmt \
+        == 'markdown'
@@ -0,0 +1,136 @@
+import os
+import stat
+import zipfile
+
+import pytest
+
+import main
+
+
+def file_mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="文件权限位只在 POSIX 上有意义")
+def test_atomic_write_uses_umask_default_mode(tmp_path):
+    path = tmp_path / "report.txt"
+    assert main.atomic_write_text(str(path), "净值报告") == len("净值报告".encode('utf-8'))
+    assert path.read_text(encoding='utf-8') == "净值报告"
+    assert file_mode(path) == main.DEFAULT_FILE_MODE
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="文件权限位只在 POSIX 上有意义")
+def test_atomic_write_keeps_existing_mode(tmp_path):
+    path = tmp_path / "report.txt"
+    path.write_text("old")
+    os.chmod(path, 0o640)
+    main.atomic_write_text(str(path), "new")
+    assert path.read_text() == "new"
+    assert file_mode(path) == 0o640
+
+
+def test_atomic_write_failure_leaves_target_and_no_temp_files(tmp_path):
+    path = tmp_path / "report.txt"
+    path.write_text("old")
+    with pytest.raises(TypeError):
+        main.atomic_write_bytes(str(path), "not bytes")
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["report.txt"]
+
+
+def test_file_writer_writes_all_reports(tmp_path):
+    writer = main.create_report_writer('files', str(tmp_path), "20260101_150000", max_workers=4)
+    writer.add('by_user', "张三", "report 1")
+    writer.add('by_fund', "000001", lambda: "report 2", name="华夏成长")
+    writer.add('summary', "已达目标收益", "summary")
+    stats = writer.write_all()
+    assert (stats['files'], stats['failed']) == (3, 0)
+    assert (tmp_path / "by_user" / "张三" / "20260101_150000.txt").read_text(encoding='utf-8') == "report 1"
+    assert (tmp_path / "by_fund" / "000001_华夏成长" / "20260101_150000.txt").read_text(encoding='utf-8') == "report 2"
+    assert (tmp_path / "已达目标收益.txt").read_text(encoding='utf-8') == "summary"
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith(".tmp")]
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="文件权限位只在 POSIX 上有意义")
+def test_zip_writer_archive_uses_default_mode(tmp_path):
+    writer = main.create_report_writer('zip', str(tmp_path), "20260101_150000")
+    writer.add('by_user', "张三", "report")
+    writer.write_all()
+    archive = tmp_path / "archive" / "20260101_150000.zip"
+    assert file_mode(archive) == main.DEFAULT_FILE_MODE
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.read(main.zip_entry_name('by_user', "张三")) == "report".encode('utf-8')
+
+
+def test_zip_writer_removes_temp_archive_when_rename_fails(tmp_path, monkeypatch):
+    def fail_replace(src, dst):
+        raise OSError("disk full")
+
+    writer = main.create_report_writer('zip', str(tmp_path), "20260101_150000")
+    writer.add('by_user', "张三", "report")
+    monkeypatch.setattr(main.os, 'replace', fail_replace)
+    with pytest.raises(OSError, match="disk full"):
+        writer.write_all()
+    assert os.listdir(tmp_path / "archive") == []
+
+
+def test_zip_writer_removes_temp_archive_when_close_fails(tmp_path, monkeypatch):
+    close = zipfile.ZipFile.close
+
+    def close_then_fail(zf):
+        if zf.fp is None:
+            return  # 已关闭（析构时再次调用）
+        close(zf)
+        raise OSError("write error")
+
+    writer = main.create_report_writer('zip', str(tmp_path), "20260101_150000")
+    writer.add('by_user', "张三", "report")
+    monkeypatch.setattr(main.zipfile.ZipFile, 'close', close_then_fail)
+    with pytest.raises(OSError, match="write error"):
+        writer.write_all()
+    assert os.listdir(tmp_path / "archive") == []
+
+
+def write_run(backend, report_dir, timestamp, fund_name, extension='.txt'):
+    writer = main.create_report_writer(backend, report_dir, timestamp, extension=extension)
+    writer.add('by_user', "张三", f"张三 {timestamp}")
+    writer.add('by_fund', "000001", f"000001 {timestamp}", name=fund_name)
+    stats = writer.write_all()
+    assert stats['failed'] == 0
+
+
+@pytest.mark.parametrize("backend", ['files', 'zip', 'sqlite'])
+def test_read_archived_report_round_trip(tmp_path, backend):
+    report_dir = str(tmp_path)
+    # 基金在两次运行之间改名，文件后端的报告分布在两个目录中
+    write_run(backend, report_dir, "20261016_200000", "华夏成长")
+    write_run(backend, report_dir, "20261017_200000", "华夏A", extension='.md')
+    write_run(backend, report_dir, "20261015_200000", "华夏成长")
+
+    assert main.read_archived_report(report_dir, backend, 'by_user', "张三") == \
+        ("20261017_200000", "张三 20261017_200000")
+    assert main.read_archived_report(report_dir, backend, 'by_fund', "000001") == \
+        ("20261017_200000", "000001 20261017_200000")
+    assert main.read_archived_report(report_dir, backend, 'by_fund', "000001", "20261016_200000") == \
+        ("20261016_200000", "000001 20261016_200000")
+    assert main.read_archived_report(report_dir, backend, 'by_user', "张三", "20261001_200000") is None
+    assert main.read_archived_report(report_dir, backend, 'by_user', "李四") is None
+    assert main.read_archived_report(report_dir, backend, 'by_fund', "00000") is None
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_read_archived_report_checks_every_fund_directory(tmp_path, monkeypatch, reverse):
+    report_dir = str(tmp_path)
+    write_run('files', report_dir, "20261016_200000", "华夏A")
+    write_run('files', report_dir, "20261017_200000", "华夏B")
+    write_run('files', report_dir, "20261018_200000", "华夏A")
+    scandir = os.scandir
+
+    def ordered_scandir(path):
+        # 目录遍历顺序由文件系统决定，两种顺序下都应取到最新一份
+        return iter(sorted(scandir(path), key=lambda entry: entry.name, reverse=reverse))
+
+    monkeypatch.setattr(main.os, 'scandir', ordered_scandir)
+    assert main.read_archived_report(report_dir, 'files', 'by_fund', "000001")[0] == "20261018_200000"
+    assert main.read_archived_report(report_dir, 'files', 'by_fund', "000001", "20261017_200000") == \
+        ("20261017_200000", "000001 20261017_200000")
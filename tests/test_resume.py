@@ -0,0 +1,91 @@
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+from conftest import PushService, make_config
+
+USERS = ("张三", "李四", "王五", "赵六")
+FUNDS = [f"{user},{code},2024-01-02,1000,800" for user in USERS for code in ("000001", "000002")]
+FUNDGZ = 'jsonpgz({{"fundcode":"{code}","name":"基金{code}","jzrq":"2026-10-16","dwjz":"1.2345","jzzl":"0.5"}});'
+
+
+def resume_config():
+    return make_config(mobile={'enabled': '1', 'bark_enabled': '1'}, network={'max_per_host': '1'})
+
+
+def make_handler(service, cancel_after=None):
+    """净值查询返回 fundgz 数据，其余请求交给推送替身；cancel_after 条 Bark 消息发出后取消运行，
+    此后的请求一直挂起，直到运行中止
+    """
+    state = {'worker': None}
+
+    async def handler(method, url, headers, body):
+        if state['worker'].control.cancelled:
+            await asyncio.sleep(5)
+        path = urlsplit(url).path
+        if path.startswith('/js/'):
+            code = path[len('/js/'):-len('.js')]
+            return 200, FUNDGZ.format(code=code), 'application/javascript'
+        if path.startswith('/eap/') or path.startswith('/pingzhongdata/'):
+            return 404, b"", 'text/plain'
+        result = service(method, url, headers, body)
+        if cancel_after is not None and len(service.messages('bark')) >= cancel_after:
+            state['worker'].control.cancel()
+        return result
+
+    return handler, state
+
+
+def pushed_users(service):
+    return {user for user in USERS for _, _, content in service.messages('bark') if f" {user} 持仓详情" in content}
+
+
+def test_cancel_saves_progress_and_next_run_resumes(make_worker, tmp_path):
+    resume_path = tmp_path / "report" / ".resume.json"
+    first_service = PushService()
+    handler, state = make_handler(first_service, cancel_after=2)
+    worker = state['worker'] = make_worker(handler, config=resume_config(), mobile=True, funds=FUNDS)
+    worker.run()
+
+    assert ('warning', "运行已取消") in worker.logs
+    saved = json.loads(resume_path.read_text(encoding='utf-8'))
+    assert set(saved['fund_data']) == {"000001", "000002"}
+    assert set(saved['pushed_users']) == pushed_users(first_service)
+    assert 0 < len(saved['pushed_users']) < len(USERS)
+    assert saved['summary_pushed'] is False
+
+    second_service = PushService()
+    handler, state = make_handler(second_service)
+    resumed = state['worker'] = make_worker(handler, config=resume_config(), mobile=True)
+    resumed.run()
+
+    assert any(message.startswith("继续") and "复用2只基金净值" in message for _, message in resumed.logs)
+    assert not [url for _, url in resumed.fake_client.requests if '/js/' in url]  # 净值不再重新获取
+    assert pushed_users(second_service) == set(USERS) - set(saved['pushed_users'])
+    assert any(title.startswith("业绩达标总结") for _, title, _ in second_service.messages('bark'))
+    assert ('success', "报告生成和推送完成") in resumed.logs
+    assert not resume_path.exists()  # 运行成功后清除进度记录
+
+
+def test_successful_run_leaves_no_resume_file(make_worker, tmp_path):
+    service = PushService()
+    handler, state = make_handler(service)
+    worker = state['worker'] = make_worker(handler, config=resume_config(), mobile=True, funds=FUNDS)
+    worker.run()
+    assert pushed_users(service) == set(USERS)
+    assert not (tmp_path / "report" / ".resume.json").exists()
+
+
+def test_changed_funds_file_discards_saved_progress(make_worker, tmp_path):
+    first_service = PushService()
+    handler, state = make_handler(first_service, cancel_after=1)
+    worker = state['worker'] = make_worker(handler, config=resume_config(), mobile=True, funds=FUNDS)
+    worker.run()
+    assert (tmp_path / "report" / ".resume.json").exists()
+
+    second_service = PushService()
+    handler, state = make_handler(second_service)
+    rerun = state['worker'] = make_worker(handler, config=resume_config(), mobile=True, funds=FUNDS[:-1])
+    rerun.run()
+    assert not any(message.startswith("继续") for _, message in rerun.logs)
+    assert pushed_users(second_service) == set(USERS)
@@ -0,0 +1,84 @@
+import json
+import os
+from datetime import datetime
+
+import main
+
+NOW = datetime(2026, 10, 19, 12, 0)
+
+
+def write_run(report_dir, ts, user="张三"):
+    rel_path = os.path.join("by_user", user, f"{ts}.txt")
+    path = os.path.join(report_dir, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(ts)
+    return [["by_user", user, rel_path]]
+
+
+def journal(retention):
+    with open(retention.journal_file, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_select_retained_runs_keeps_recent_weekly_and_monthly():
+    timestamps = [
+        "20261018_200000", "20261015_200000",  # 完整保留期内
+        "20261008_200000", "20261009_200000",  # 同一周，保留最后一次
+        "20260901_200000", "20260915_200000",  # 超出周保留窗口，每月保留最后一次
+        "20260815_120000",
+        "20260701_200000",  # 超出月保留窗口
+    ]
+    keep = main.select_retained_runs(timestamps, NOW, keep_days=7, keep_weeks=4, keep_months=3)
+    assert keep == {"20261018_200000", "20261015_200000", "20261009_200000", "20260915_200000", "20260815_120000"}
+
+
+def test_first_run_scans_reports_then_compacts_and_deletes(tmp_path):
+    report_dir = str(tmp_path)
+    for ts in ("20261018_200000", "20260915_200000", "20260910_200000"):
+        write_run(report_dir, ts)
+    retention = main.ReportRetention(report_dir, keep_days=7, keep_weeks=4, keep_months=3)
+    assert not os.path.exists(retention.state_file)
+
+    stats = retention.run(NOW)
+    assert stats['runs_compacted'] == 1 and stats['runs_deleted'] == 1 and stats['runs_pending'] == 1
+    user_dir = os.path.join(report_dir, "by_user", "张三")
+    assert os.listdir(user_dir) == ["20261018_200000.txt"]
+    assert main.read_archived_report(report_dir, 'zip', 'by_user', "张三", "20260915_200000") == \
+        ("20260915_200000", "20260915_200000")
+    assert not os.path.exists(os.path.join(report_dir, "archive", "20260910_200000.zip"))
+
+    # 之后的整理只读取登记：快照超出月保留窗口后删除归档
+    later = main.ReportRetention(report_dir, keep_days=7, keep_weeks=4, keep_months=1)
+    stats = later.run(NOW)
+    assert stats['runs_deleted'] == 1 and stats['runs_compacted'] == 0
+    assert not os.path.exists(os.path.join(report_dir, "archive", "20260915_200000.zip"))
+
+
+def test_record_run_waits_for_bootstrap(tmp_path):
+    retention = main.ReportRetention(str(tmp_path))
+    retention.record_run("20261018_200000", 'files', write_run(str(tmp_path), "20261018_200000"))
+    assert not os.path.exists(retention.journal_file)
+    retention.run(NOW)
+    retention.record_run("20261019_080000", 'zip', [])
+    assert [record['ts'] for record in journal(retention)] == ["20261018_200000", "20261019_080000"]
+    retention.invalidate()
+    assert not os.path.exists(retention.journal_file) and not os.path.exists(retention.state_file)
+
+
+def test_delta_runs_are_never_kept_as_snapshots(tmp_path):
+    report_dir = str(tmp_path)
+    retention = main.ReportRetention(report_dir, keep_days=7, keep_weeks=4, keep_months=0)
+    retention.run(NOW)  # 建立登记
+    full, delta, recent_delta = "20261001_200000", "20261001_230000", "20261018_230000"
+    retention.record_run(full, 'files', write_run(report_dir, full))
+    retention.record_run(delta, 'files', write_run(report_dir, delta), delta=True)
+    retention.record_run(recent_delta, 'files', write_run(report_dir, recent_delta), delta=True)
+
+    stats = retention.run(NOW)
+    assert stats['runs_compacted'] == 1 and stats['runs_deleted'] == 1 and stats['runs_pending'] == 1
+    assert os.path.exists(os.path.join(report_dir, "archive", f"{full}.zip"))
+    assert not os.path.exists(os.path.join(report_dir, "archive", f"{delta}.zip"))
+    assert not os.path.exists(os.path.join(report_dir, "by_user", "张三", f"{delta}.txt"))
+    # 仍在完整保留期内的增量运行保留原样，登记中带有标记
+    assert [(record['ts'], record.get('delta')) for record in journal(retention)] == [(recent_delta, True)]
@@ -0,0 +1,68 @@
+from urllib.parse import urlsplit
+
+from conftest import PushService, make_config, push_reports
+
+BARK_ONLY = (True, False, False)
+REPORT = "\n".join(f"基金{i}\n├ 净值 1.{i}" for i in range(6))
+
+
+def retry_worker(make_worker, handler, **push):
+    # 报告分成多页：Bark（POST）按 channel_max_bytes 分页，其他渠道按 max_message_bytes 分页
+    defaults = {'probe': '1', 'channel_down_after': '1', 'retry_queue_rounds': '2', 'channel_max_bytes': 'bark=120'}
+    config = make_config(push=dict(defaults, **push))
+    config['advanced']['max_message_bytes'] = '40'
+    return make_worker(handler, config=config)
+
+
+def test_probe_marks_unavailable_channels_down(make_worker):
+    service = PushService(down={'gotify', 'wecom'})
+    worker = retry_worker(make_worker, service)
+    assert worker.run_async(worker.probe_channels(['bark', 'gotify', 'wecom'])) == ['bark']
+    assert worker.channel_health.down == {'gotify', 'wecom'}
+    assert worker.metrics.counter_total('push_probe_total', result='failed') == 2
+    service.down.clear()
+    assert worker.run_async(worker.probe_channels(['gotify'])) == ['gotify']
+    assert worker.channel_health.down == {'wecom'}
+
+
+def test_probed_down_channel_is_not_retried_per_message(make_worker):
+    service = PushService(down={'bark'})
+    worker = retry_worker(make_worker, service)
+    assert push_reports(worker, [("张三", REPORT)], (True, True, False)) == []
+    assert service.attempts['bark'] == 1  # 只有推送前的探测
+    assert service.messages('bark') == [] and service.messages('gotify')
+
+
+def test_queued_report_resumes_from_unsent_page_after_recovery(make_worker):
+    service = PushService()
+    state = {'pushed': 0}
+
+    def handler(method, url, headers, body):
+        path = urlsplit(url).path
+        if service.channel(path) == 'bark' and path != '/ping':
+            state['pushed'] += 1
+            if state['pushed'] == 2:
+                service.down.add('bark')  # 第二页发送时渠道中断
+        elif path == '/ping' and service.down:
+            service.down.clear()  # 第一次重新探测仍失败，下一轮恢复
+            return 500, b"", 'text/plain'
+        return service(method, url, headers, body)
+
+    worker = retry_worker(make_worker, handler)
+    assert push_reports(worker, [("张三", REPORT)], BARK_ONLY) == []
+    titles = [title for _, title, _ in service.messages('bark')]
+    pages = len(titles) - 1  # 最后一条为业绩总结
+    assert pages > 2
+    assert titles[:pages] == [f"净值推送报告[{page}/{pages}]" for page in range(1, pages + 1)]
+    assert "\n".join(content for _, _, content in service.messages('bark')[:pages]) == REPORT
+    assert worker.pushed_users == {"张三"}
+    assert any("暂存" in message for _, message in worker.logs)
+
+
+def test_queued_report_fails_after_all_rounds(make_worker):
+    service = PushService(down={'bark'})
+    worker = retry_worker(make_worker, service)
+    assert push_reports(worker, [("张三", REPORT), ("李四", REPORT)], BARK_ONLY) == ["张三", "李四"]
+    assert service.attempts['bark'] == 3  # 推送前探测 + 两轮重新探测
+    assert worker.retry_queue == []
+    assert worker.progress.done == 3
@@ -0,0 +1,103 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+
+TARGET_RETURN = 3.0
+
+
+def build_rows(row_count=120, users=9, funds=14, seed=7):
+    """持仓行：客户的持仓与其他客户交错出现，同一客户持有多只基金，其中一只基金净值无效"""
+    rng = random.Random(seed)
+    codes = [f"{110000 + i:06d}" for i in range(funds)]
+    user_names = [f"客户{i}" for i in range(users)]
+    rows = []
+    for i in range(row_count):
+        user = user_names[rng.randrange(users)]
+        code = codes[rng.randrange(funds)]
+        buy_date = f"20{rng.randint(19, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        rows.append((user, code, buy_date, f"{rng.randint(1, 500) * 100}", f"{rng.uniform(100, 50000):.2f}"))
+    fund_data = {
+        code: {'name': f"测试基金{code}", 'nav': 0.8 + i * 0.05, 'nav_date': "2025-06-30", 'valid': True,
+               'source': 1}
+        for i, code in enumerate(codes)
+    }
+    fund_data[codes[-1]] = {'name': f"查询失败({codes[-1]})", 'nav': 0, 'valid': False}
+    return rows, fund_data
+
+
+def options(export=True):
+    return {'target_return': TARGET_RETURN, 'file_format': 'markdown', 'user_files': True, 'user_push': True,
+            'snapshots': True, 'export': export}
+
+
+def thread_executor():
+    return ThreadPoolExecutor(max_workers=2)
+
+
+@pytest.mark.parametrize('processes', [1, 2, 3, 5])
+def test_sharded_book_matches_single_process(processes):
+    rows, fund_data = build_rows()
+    book = main.compute_sharded(rows, fund_data, options(), processes, executor_factory=thread_executor)
+    user_data, fund_holdings, holdings = main.compute_book(rows, fund_data)
+
+    assert book.users == list(user_data)
+    assert book.funds == list(fund_holdings)
+    assert book.performance == main.collect_performance_data(user_data, TARGET_RETURN)
+    assert book.performance  # 部分客户有达标基金
+    assert book.holdings == holdings
+    assert book.holding_count == len(holdings)
+    assert book.valid_count == sum(1 for holding in holdings if holding['valid'])
+
+    renderer = main.ReportRenderer('markdown')
+    push_renderer = main.ReportRenderer('text')
+    for index, (user, data) in enumerate(user_data.items()):
+        assert book.user_files[user] == renderer.render_user_file(user, data)
+        emoji = main.USER_EMOJIS[index % len(main.USER_EMOJIS)]
+        assert book.user_push[user] == push_renderer.render_user_push(user, data, emoji)
+        assert book.user_snapshots[user] == main.user_position_snapshot(data, TARGET_RETURN)
+    assert book.fund_files == {
+        code: renderer.render_fund(code, main.fund_display_name(fund_data, code), holdings_list)
+        for code, holdings_list in fund_holdings.items()
+    }
+
+
+def test_user_holdings_span_several_fund_shards():
+    """分片边界：同一客户的基金分到不同基金分片，客户分片与基金分片各自重算后结果仍一致"""
+    rows, fund_data = build_rows()
+    fund_weights = {}
+    for _, code, *_ in rows:
+        fund_weights[code] = fund_weights.get(code, 0) + 1
+    fund_shards = main.partition_keys(list(fund_weights), fund_weights, 4)
+    shard_of = {code: index for index, shard in enumerate(fund_shards) for code in shard}
+    user = rows[0][0]
+    assert len({shard_of[code] for name, code, *_ in rows if name == user}) > 1
+
+    book = main.compute_sharded(rows, fund_data, options(), 2, executor_factory=thread_executor)
+    user_data, fund_holdings, _ = main.compute_book(rows, fund_data)
+    assert book.user_files[user] == main.ReportRenderer('markdown').render_user_file(user, user_data[user])
+    for code in {code for name, code, *_ in rows if name == user}:
+        assert book.fund_files[code] == main.ReportRenderer('markdown').render_fund(
+            code, main.fund_display_name(fund_data, code), fund_holdings[code])
+
+
+def test_single_row_shards_and_no_export():
+    rows, fund_data = build_rows(row_count=3, users=3, funds=3)
+    book = main.compute_sharded(rows, fund_data, options(export=False), 4, executor_factory=thread_executor)
+    user_data, fund_holdings, _ = main.compute_book(rows, fund_data)
+    assert book.users == list(user_data) and book.funds == list(fund_holdings)
+    assert book.holdings is None
+    assert book.holding_count == 3
+
+
+def test_process_pool_matches_single_process():
+    rows, fund_data = build_rows(row_count=40)
+    book = main.compute_sharded(rows, fund_data, options(), 2)
+    user_data, fund_holdings, holdings = main.compute_book(rows, fund_data)
+    assert book.holdings == holdings
+    assert book.fund_files == {
+        code: main.ReportRenderer('markdown').render_fund(code, main.fund_display_name(fund_data, code), items)
+        for code, items in fund_holdings.items()
+    }
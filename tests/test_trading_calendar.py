@@ -0,0 +1,123 @@
+import json
+from datetime import date, datetime
+
+import main
+
+
+def calendar(**kwargs):
+    # 2026-10-01 至 10-07 国庆休市
+    holidays = {date(2026, 10, day) for day in range(1, 8)}
+    return main.TradingCalendar(holidays, **kwargs)
+
+
+def test_load_holidays_and_clock_time(tmp_path):
+    path = tmp_path / "holidays.txt"
+    path.write_text("# 休市日\n2026-10-01  # 国庆\n\n2026-10-02\n", encoding='utf-8')
+    assert main.load_holidays(str(path)) == {date(2026, 10, 1), date(2026, 10, 2)}
+    assert main.parse_clock_time(" 19:30 ") == (19, 30)
+    for text in ("24:00", "7", "ab:cd"):
+        try:
+            main.parse_clock_time(text)
+        except ValueError:
+            continue
+        raise AssertionError(text)
+
+
+def test_trading_days():
+    cal = calendar()
+    assert cal.is_trading_day(date(2026, 10, 9))
+    assert not cal.is_trading_day(date(2026, 10, 10))  # 周六
+    assert not cal.is_trading_day(date(2026, 10, 5))  # 休市
+    assert cal.previous_trading_day(date(2026, 10, 8)) == date(2026, 9, 30)
+    assert cal.covers(date(2026, 1, 1)) and not cal.covers(date(2027, 1, 1))
+
+
+def test_expected_nav_date_follows_publish_time_and_lag():
+    cal = calendar(publish_time=(19, 0))
+    assert cal.expected_nav_date(datetime(2026, 10, 9, 18, 59)) == "2026-10-08"
+    assert cal.expected_nav_date(datetime(2026, 10, 9, 19, 0)) == "2026-10-09"
+    assert cal.expected_nav_date(datetime(2026, 10, 11, 12, 0)) == "2026-10-09"  # 周日
+    assert cal.expected_nav_date(datetime(2026, 10, 8, 20, 0), lag=1) == "2026-09-30"  # 跨越休市
+    assert calendar(clock=lambda: datetime(2026, 10, 12, 20, 0)).expected_nav_date() == "2026-10-12"
+
+
+def test_fund_nav_lag_uses_type_or_name():
+    assert main.fund_nav_lag("QDII-指数") == 1
+    assert main.fund_nav_lag("", "广发纳斯达克100ETF联接人民币(qdii)A") == 1
+    assert main.fund_nav_lag("混合型", "易方达蓝筹精选混合") == 0
+    assert main.fund_nav_lag(None) == 0
+
+
+def nav(source, name="模拟基金", nav_date="2026-10-09", fund_type=None, valid=True):
+    info = {'code': "000001", 'name': name, 'nav_date': nav_date, 'nav': 1.2345, 'change': "0.1",
+            'valid': valid, 'source': source}
+    if fund_type is not None:
+        info['type'] = fund_type
+    return info
+
+
+def test_metadata_store_keeps_type_from_any_fetch(tmp_path):
+    now = [1000.0]
+    store = main.FundMetadataStore(str(tmp_path / "meta.json"), refresh_days=7, clock=lambda: now[0])
+    store.record("000001", nav(1))
+    assert store.needs_type("000001")
+    store.record("000001", nav(1))
+    # 记录仍在有效期内、接口未变，esongfund 偶尔返回的类型也要保存
+    store.record("000001", nav(1, fund_type="QDII"))
+    assert store.nav_lag("000001") == 1 and not store.needs_type("000001")
+    # 之后只提供名称的接口不会清空已知类型
+    store.record("000001", nav(1))
+    assert store.entries["000001"]['type'] == "QDII"
+    store.save()
+    reloaded = main.FundMetadataStore(str(tmp_path / "meta.json")).load()
+    assert reloaded.nav_lag("000001") == 1
+
+
+def test_metadata_store_set_type_marks_checked(tmp_path):
+    store = main.FundMetadataStore(str(tmp_path / "meta.json"))
+    store.set_type("999999", "QDII")  # 没有记录的基金不处理
+    assert "999999" not in store.entries
+    store.record("000001", nav(1))
+    store.set_type("000001", "")
+    assert not store.needs_type("000001") and store.nav_lag("000001") == 0
+    store.record("000001", nav(2, name="模拟基金 [未开放]"))  # 刷新记录时保留已查询过的标记
+    assert not store.needs_type("000001")
+
+
+def test_metadata_store_latest_and_current_nav(tmp_path):
+    store = main.FundMetadataStore(str(tmp_path / "meta.json"))
+    store.record("000001", nav(1, nav_date="2026-10-08"))
+    store.record("000001", nav(1, valid=False))  # 无效结果不覆盖最近一次有效净值
+    assert store.latest_nav("000001")['nav_date'] == "2026-10-08"
+    assert store.current_nav("000001", "2026-10-08") is not None
+    assert store.current_nav("000001", "2026-10-09") is None
+
+
+def test_worker_looks_up_missing_fund_types_once(make_worker):
+    def handler(method, url, headers, body):
+        code = url.rsplit('=', 1)[-1]
+        data = {'code': 200, 'data': {'fundType': "QDII" if code == "000001" else ""}}
+        return 200, json.dumps(data), "application/json"
+
+    worker = make_worker(handler)
+    for code in ("000001", "000002"):
+        worker.fund_metadata.record(code, dict(nav(1), code=code))
+    worker.fund_metadata.record("000003", dict(nav(2, fund_type="混合型"), code="000003"))
+    worker.run_async(worker.lookup_fund_types(["000001", "000002", "000003"]))
+    assert len(worker.fake_client.requests) == 2  # 已知类型的基金不查询
+    assert worker.fund_metadata.nav_lag("000001") == 1
+    worker.run_async(worker.lookup_fund_types(["000001", "000002"]))
+    assert len(worker.fake_client.requests) == 2  # 查询过一次后不再查询
+
+
+def test_track_nav_updates_uses_type_learned_during_fetch(make_worker):
+    worker = make_worker(lambda *args: (404, "", "text/plain"))
+    worker.calendar = calendar(clock=lambda: datetime(2026, 10, 9, 20, 0))
+    worker.reuse_current_navs(["000001"])
+    assert worker.expected_navs["000001"][0] == "2026-10-09"
+    # 查询结果只有前一交易日的净值，查询后才知道是 QDII 基金
+    worker.fund_data["000001"] = nav(1, nav_date="2026-10-08")
+    worker.fund_metadata.record("000001", nav(1, nav_date="2026-10-08", fund_type="QDII"))
+    worker.track_nav_updates(["000001"])
+    assert worker.behind_codes == []
+    assert worker.updated_codes == {"000001"}
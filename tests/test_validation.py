@@ -0,0 +1,50 @@
+import csv
+import io
+
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("row, error", [
+    (["张三", "000001", "2024-01-02", "1000", "800.5"], None),
+    (["Alice", "000001", "2024-01-02", "1e3", "800"], None),
+    (["张三", "000001", "2024-01-02", "1000"], 'field_count'),
+    (["张", "000001", "2024-01-02", "1000", "800"], 'username'),
+    (["user1", "000001", "2024-01-02", "1000", "800"], 'username'),
+    (["张三", "000001", "2024-02-30", "1000", "800"], 'buy_date'),
+    (["张三", "000001", "2024/01/02", "1000", "800"], 'buy_date'),
+    (["张三", "000001", "2024-01-02", "一千", "800"], 'amount'),
+    (["张三", "000001", "2024-01-02", "1000", ""], 'shares'),
+])
+def test_validate_fund_row(row, error):
+    assert main.validate_fund_row(row) == error
+
+
+def test_validation_report_counts_samples_and_csv():
+    report = main.ValidationReport()
+    report.valid_rows = 3
+    report.add(2, 'username', ["张", "000001", "2024-01-02", "1000", "800"])
+    report.add(5, 'amount', ["张三", "000001", "2024-01-02", "x", "800"])
+    report.add(9, 'username', ["1", "000001", "2024-01-02", "1000", "800"])
+    assert report.invalid_rows == 3
+    assert report.summary() == "跳过无效行 3 行（有效 3 行）: 用户名应为2-20个中文或英文字母 2行，买入金额不是数字 1行"
+    assert list(report.samples(limit=1)) == ["第2行 [用户名应为2-20个中文或英文字母]: 张,000001,2024-01-02,1000,800"]
+    rows = list(csv.reader(io.StringIO(report.to_csv())))
+    assert rows[0] == ['line', 'error', 'message', 'content']
+    assert [row[:2] for row in rows[1:]] == [['2', 'username'], ['5', 'amount'], ['9', 'username']]
+
+
+def test_read_fund_rows_skips_comments_and_logs_summary(make_worker):
+    worker = make_worker(lambda *args: (404, b"", "text/plain"), funds=[
+        "张三,000001,2024-01-02,1000,800",
+        "",
+        "# 注释",
+        "李四,000002,2024-13-01,1000,800",
+        "王五,000002,2024-03-01,2000,1500",
+    ])
+    rows = worker.read_fund_rows()
+    assert rows == [("张三", "000001", "2024-01-02", "1000", "800"), ("王五", "000002", "2024-03-01", "2000", "1500")]
+    assert worker.validation_report.counts == {'buy_date': 1}
+    assert worker.validation_report.errors[0][0] == 5  # 行号包含表头注释
+    assert ('warning', "第5行 [买入日期无效（应为YYYY-MM-DD）]: 李四,000002,2024-13-01,1000,800") in worker.logs